@@ -1,11 +1,11 @@
-import chromadb
 import os
+import time
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_groq import ChatGroq
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from dotenv import load_dotenv
+from busca_hibrida import criar_retriever
+from montagem_contexto import montar_contexto, formatar_economia, formatar_tempos, descrever_trecho
+from recursos_compartilhados import obter_llm, obter_embeddings, obter_vectorstore
 
 load_dotenv()
 
@@ -14,25 +14,22 @@ DB_FOLDER = r"C:\chroma\banco"
 COLLECTION_NAME = "PlanoManejo_Tijuca"
 TOP_K = 5  
 
+# busca vetorial + BM25 (fusão por RRF); False usa só a busca vetorial
+BUSCA_HIBRIDA = True
+
+# parte vetorial da busca: "chroma" ou "memmap" (busca exata numa cópia dos vetores
+# mapeada em memória, ver indice_memmap.py)
+BUSCA_VETORIAL = "chroma"
+
 groq_api_key = os.getenv("GROQ_API_KEY")
 if not groq_api_key:
     print("\n⚠️  AVISO: Verifique se a GROQ_API_KEY está configurada corretamente")
     exit(1)
 
-# inicializa llm do groq
-llm = ChatGroq(
-    groq_api_key=groq_api_key,
-    model_name="llama-3.3-70b-versatile",
-    temperature=0.3,
-    max_tokens=2000
-)
-
-# inicializa os embeddings
-embeddings = HuggingFaceEmbeddings(
-    model_name="all-MiniLM-L6-v2",
-    model_kwargs={'device': 'cpu'},
-    encode_kwargs={'normalize_embeddings': True}
-)
+# llm do groq e embeddings vêm do registro compartilhado: os agentes carregados
+# pelo orquestrador usam o mesmo modelo e o mesmo cliente
+llm = obter_llm()
+embeddings = obter_embeddings()
 
 
 def inicializar_vectorstore():
@@ -45,11 +42,7 @@ def inicializar_vectorstore():
 
     try:
         # concecta o chromadb
-        vectorstore = Chroma(
-            collection_name=COLLECTION_NAME,
-            embedding_function=embeddings,
-            persist_directory=DB_FOLDER
-        )
+        vectorstore = obter_vectorstore(DB_FOLDER, COLLECTION_NAME)
 
         # verifica a quantidade de documentos que tem na coleção
         collection = vectorstore._collection
@@ -106,31 +99,21 @@ PERGUNTA DO VISITANTE: {question}"""
     ])
 
 
-def criar_chain_rag(vectorstore):
+def criar_chain_rag(vectorstore, busca_vetorial=BUSCA_VETORIAL):
     # cria a chain RAG
 
     from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.runnables import RunnableLambda
 
-    # retriver
-    retriever = vectorstore.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": TOP_K}
-    )
+    retriever = criar_retriever(vectorstore, embeddings, DB_FOLDER, TOP_K, busca_vetorial, BUSCA_HIBRIDA)
 
     # prompt
     prompt = criar_prompt_template()
 
-    # formatação de documentos
-    def format_docs(docs):
-        return "\n\n".join([
-            f"[Fonte: {doc.metadata.get('arquivo', 'Desconhecido')} - Parte {doc.metadata.get('parte', '?')}]\n{doc.page_content}"
-            for doc in docs
-        ])
-
-    # chain(LCEL) com histórico
-    retrieval_chain = (
+    # chain(LCEL) com histórico; recebe os documentos já recuperados
+    geracao_chain = (
         {
-            "context": lambda x: format_docs(retriever.invoke(x["question"])),
+            "context": lambda x: x["contexto"],
             "question": lambda x: x["question"],
             "chat_history": lambda x: x.get("chat_history", [])
         }
@@ -139,11 +122,39 @@ def criar_chain_rag(vectorstore):
         | StrOutputParser()
     )
 
+    # uma única busca por pergunta: os mesmos documentos vão para o prompt e voltam
+    # para quem chamou, junto com o tempo de cada etapa. Quem já tem os documentos
+    # pode passá-los em "documentos" e a busca é pulada.
+    def executar(x):
+        tempos = {}
+
+        inicio = time.perf_counter()
+        documentos = x.get("documentos")
+        if documentos is None:
+            documentos = retriever.invoke(x["question"])
+        tempos["recuperacao"] = time.perf_counter() - inicio
+
+        # trechos escolhidos por MMR, sem o overlap entre chunks vizinhos e dentro do orçamento
+        inicio = time.perf_counter()
+        contexto, documentos, economia = montar_contexto(
+            documentos, vectorstore, descrever_trecho, retriever=retriever
+        )
+        tempos["contexto"] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        resposta = geracao_chain.invoke({**x, "contexto": contexto})
+        tempos["geracao"] = time.perf_counter() - inicio
+
+        return {"resposta": resposta, "documentos": documentos, "contexto": economia, "tempos": tempos}
+
+    retrieval_chain = RunnableLambda(executar)
+
     return retrieval_chain, retriever
 
 
-def processar_pergunta_langchain(chain_tuple, pergunta, chat_history=None):
-    # usa a chain pra processar a pergunta
+def processar_pergunta_langchain(chain_tuple, pergunta, chat_history=None, documentos=None):
+    # usa a chain pra processar a pergunta; documentos já buscados (ex.: pelo orquestrador,
+    # em paralelo à classificação) dispensam a busca
 
     chain, retriever = chain_tuple
 
@@ -153,14 +164,17 @@ def processar_pergunta_langchain(chain_tuple, pergunta, chat_history=None):
     print(f"Pergunta: {pergunta}\n")
 
     try:
-        # busca documentos relevantes
-        documentos = retriever.invoke(pergunta)
-
-        # executa a chain para gerar a resposta com histórico
-        resposta = chain.invoke({
+        # executa a chain: busca os documentos uma vez e gera a resposta com histórico
+        resultado = chain.invoke({
             "question": pergunta,
-            "chat_history": chat_history
+            "chat_history": chat_history,
+            "documentos": documentos
         })
+        resposta = resultado["resposta"]
+        documentos = resultado["documentos"]
+
+        print(f"Contexto: {formatar_economia(resultado['contexto'])}")
+        print(f"Tempos: {formatar_tempos(resultado['tempos'])}\n")
 
         # resposta no terminal
         print("Resposta:\n")
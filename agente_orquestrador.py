@@ -1,10 +1,15 @@
 import os
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, AIMessage
 import sys
 import importlib.util
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from recursos_compartilhados import obter_llm, obter_embeddings
+from cache_respostas import CacheRespostas, depende_do_historico
+from historico_conversa import HistoricoConversa
+from roteador_local import RoteadorLocal
 
 
 def importar_modulo(caminho_arquivo, nome_modulo):
@@ -67,18 +72,58 @@ if not groq_api_key:
     print("\nA variável GROQ_API_KEY não foi encontrada. Verifique o arquivo .env.")
     exit(1)
 
-llm_classificador = ChatGroq(
-    groq_api_key=groq_api_key,
-    model_name="llama-3.3-70b-versatile",
-    temperature=0.1,
-    max_tokens=100
-)
+# mesmo cliente dos agentes, com parâmetros próprios para a classificação
+llm_classificador = obter_llm().bind(temperature=0.1, max_tokens=100)
+
+PROMPT_CLASSIFICACAO = ChatPromptTemplate.from_messages([
+    ("system", """Você é um classificador de perguntas sobre o Parque Nacional da Tijuca.
+
+Analise a pergunta do usuário e classifique em UMA das categorias:
+
+1. clima
+   - Perguntas sobre tempo, temperatura, condições climáticas
+   - Previsão do tempo, chuva, sol, vento
+
+2. trilhas
+   - Perguntas sobre trilhas específicas
+   - Mapas, rotas, caminhos, distância, dificuldade
+   - Pontos turísticos e mirantes
+
+3. geral
+   - Fauna, flora, história do parque
+   - Regras, normas e informações gerais
+
+Responda apenas com uma palavra: clima, trilhas ou geral"""),
+    ("human", "{pergunta}")
+])
+
+# regras + centróides de perguntas de exemplo (ver roteador_local.py); o LLM só é chamado
+# quando a decisão local fica apertada. False volta a classificar tudo pelo LLM
+USAR_ROTEADOR_LOCAL = True
+
+# a busca no Plano de Manejo não depende da categoria (geral e trilhas consultam a mesma
+# coleção com a mesma busca), então começa junto com a classificação. A consulta ao clima
+# também pode ser antecipada, ao custo de chamadas à API em perguntas que não são de clima
+ESPECULAR_RECUPERACAO = True
+ESPECULAR_CLIMA = False
+
+# respostas reaproveitadas para perguntas parecidas (ver cache_respostas.py); False desativa
+USAR_CACHE_RESPOSTAS = True
 
 
 class OrquestradorAgentes:
     def __init__(self):
-        self.chat_history = []
+        # últimos turnos na íntegra + resumo dos anteriores, com teto de tokens
+        self.historico = HistoricoConversa(obter_llm().bind(temperature=0.1, max_tokens=400))
         self.agentes_inicializados = {}
+        self.cache_respostas = CacheRespostas(obter_embeddings()) if USAR_CACHE_RESPOSTAS else None
+        self.roteador = RoteadorLocal(obter_embeddings()) if USAR_ROTEADOR_LOCAL else None
+
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="especulacao")
+        self._lock_especulacao = threading.Lock()
+        self.especulacoes_usadas = 0
+        self.especulacoes_descartadas = 0
+        self.latencia_economizada = 0.0
 
         print("\nInicializando agentes especializados...\n")
 
@@ -108,30 +153,23 @@ class OrquestradorAgentes:
         print()
 
     def classificar_pergunta(self, pergunta: str) -> str:
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """Você é um classificador de perguntas sobre o Parque Nacional da Tijuca.
-
-Analise a pergunta do usuário e classifique em UMA das categorias:
-
-1. clima
-   - Perguntas sobre tempo, temperatura, condições climáticas
-   - Previsão do tempo, chuva, sol, vento
-
-2. trilhas
-   - Perguntas sobre trilhas específicas
-   - Mapas, rotas, caminhos, distância, dificuldade
-   - Pontos turísticos e mirantes
-
-3. geral
-   - Fauna, flora, história do parque
-   - Regras, normas e informações gerais
-
-Responda apenas com uma palavra: clima, trilhas ou geral"""),
-            ("human", "{pergunta}")
-        ])
+        if self.roteador is not None:
+            try:
+                decisao = self.roteador.classificar(pergunta)
+            except Exception as e:
+                print(f"Erro na classificação local: {e}")
+                decisao = None
+            taxa_local = self.roteador.estatisticas()["taxa_local"]
+            if decisao is not None:
+                categoria, confianca, origem = decisao
+                print(f"Classificação local: {categoria} ({origem}, confiança {confianca:.2f}; "
+                      f"{taxa_local:.0%} das perguntas classificadas sem o LLM)")
+                return categoria
+            print(f"Classificação local incerta, consultando o LLM "
+                  f"({taxa_local:.0%} das perguntas classificadas sem o LLM)")
 
         try:
-            chain = prompt | llm_classificador
+            chain = PROMPT_CLASSIFICACAO | llm_classificador
             resposta = chain.invoke({"pergunta": pergunta})
             categoria = resposta.content.strip().lower()
 
@@ -150,27 +188,66 @@ Responda apenas com uma palavra: clima, trilhas ou geral"""),
         print(f"Pergunta: {pergunta}")
         print(f"{'=' * 70}\n")
 
-        print("Analisando a pergunta...\n")
-        categoria = self.classificar_pergunta(pergunta)
-
         emoji_categoria = {
             'clima': 'Clima e Previsão',
             'trilhas': 'Trilhas e Mapas',
             'geral': 'Informações Gerais'
         }
 
+        # perguntas que dependem da conversa anterior não usam nem alimentam o cache
+        usar_cache = self.cache_respostas is not None and not depende_do_historico(pergunta, self.historico)
+
+        if usar_cache:
+            inicio = time.perf_counter()
+            encontrada = self.cache_respostas.buscar(pergunta)
+            if encontrada is not None:
+                categoria, resposta, similaridade, extras = encontrada
+                print(f"Direcionando para: {emoji_categoria.get(categoria, 'Informações Gerais')} "
+                      f"(cache, similaridade {similaridade:.2f}, {(time.perf_counter() - inicio) * 1000:.0f} ms)\n")
+                print(f"{'=' * 70}\n")
+                print("\nRESPOSTA:\n")
+                print(resposta)
+                print()
+
+                # os mapas oferecidos na resposta original são oferecidos de novo, sem as ampliações
+                if extras.get('mapas') and 'trilhas' in self.agentes_inicializados:
+                    agente_trilhas.oferecer_mapas(self.agentes_inicializados['trilhas'][2], extras['mapas'],
+                                                  ampliar=False)
+
+                if categoria != 'clima':
+                    self.historico.adicionar(pergunta, resposta)
+                return resposta
+
+        tarefas = self._iniciar_especulacao(pergunta)
+
+        print("Analisando a pergunta...\n")
+        inicio = time.perf_counter()
+        categoria = self.classificar_pergunta(pergunta)
+        tempo_classificacao = time.perf_counter() - inicio
+
         print(f"Direcionando para: {emoji_categoria.get(categoria, 'Informações Gerais')}\n")
         print(f"{'=' * 70}\n")
 
+        resposta = None
+        extras = {}
         try:
             if categoria == 'clima' and 'clima' in self.agentes_inicializados:
-                self._processar_clima(pergunta)
+                clima = self._usar_especulacao(tarefas, 'clima', tempo_classificacao)
+                resposta = self._processar_clima(pergunta, clima)
 
             elif categoria == 'trilhas' and 'trilhas' in self.agentes_inicializados:
-                self._processar_trilhas(pergunta)
+                documentos = self._usar_especulacao(tarefas, 'documentos', tempo_classificacao)
+                resposta, mapas = self._processar_trilhas(pergunta, documentos)
+                if mapas:
+                    extras['mapas'] = mapas
+                if resposta:
+                    self.historico.adicionar(pergunta, resposta)
 
             elif categoria == 'geral' and 'rag' in self.agentes_inicializados:
-                self._processar_geral(pergunta)
+                documentos = self._usar_especulacao(tarefas, 'documentos', tempo_classificacao)
+                resposta = self._processar_geral(pergunta, documentos)
+                if resposta:
+                    self.historico.adicionar(pergunta, resposta)
 
             else:
                 print(f"Agente para '{categoria}' não está disponível no momento.")
@@ -181,41 +258,124 @@ Responda apenas com uma palavra: clima, trilhas ou geral"""),
             import traceback
             traceback.print_exc()
 
-    def _processar_clima(self, pergunta: str):
+        self._descartar_especulacao(tarefas)
+
+        # falhas de consulta (ex.: API do clima fora do ar) não devem ser repetidas pelo cache
+        if usar_cache and resposta and not resposta.startswith("Não foi possível"):
+            self.cache_respostas.guardar(pergunta, categoria, resposta, extras)
+
+        return resposta
+
+    def _retriever_texto(self):
+        # qualquer um dos dois agentes serve: a busca de texto é a mesma
+        for nome in ('rag', 'trilhas'):
+            if nome in self.agentes_inicializados:
+                return self.agentes_inicializados[nome][1]
+        return None
+
+    @staticmethod
+    def _cronometrar(funcao, *args):
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        return resultado, time.perf_counter() - inicio
+
+    def _iniciar_especulacao(self, pergunta: str):
+        # tarefas que rodam enquanto a pergunta é classificada; o resultado só é usado
+        # se a categoria escolhida precisar dele
+        tarefas = {}
+        retriever = self._retriever_texto() if ESPECULAR_RECUPERACAO else None
+        if retriever is not None:
+            tarefas['documentos'] = self._executor.submit(self._cronometrar, retriever.invoke, pergunta)
+        if ESPECULAR_CLIMA and 'clima' in self.agentes_inicializados:
+            tarefas['clima'] = self._executor.submit(self._cronometrar, agente_clima.responder_clima, pergunta)
+        return tarefas
+
+    def _usar_especulacao(self, tarefas, nome, tempo_classificacao):
+        futuro = tarefas.pop(nome, None)
+        if futuro is None:
+            return None
+
+        inicio = time.perf_counter()
+        try:
+            resultado, duracao = futuro.result()
+        except Exception as e:
+            print(f"Busca antecipada ({nome}) falhou: {e}. O agente vai buscar de novo")
+            return None
+        espera = time.perf_counter() - inicio
+
+        # em sequência seriam classificação + busca; em paralelo, classificação + espera
+        economia = max(duracao - espera, 0.0)
+        with self._lock_especulacao:
+            self.especulacoes_usadas += 1
+            self.latencia_economizada += economia
+        print(f"Busca antecipada ({nome}): {duracao * 1000:.0f} ms em paralelo à classificação "
+              f"({tempo_classificacao * 1000:.0f} ms), {economia * 1000:.0f} ms economizados\n")
+        return resultado
+
+    def _descartar_especulacao(self, tarefas):
+        # buscas que a categoria não aproveitou; as que ainda não começaram são canceladas
+        for futuro in tarefas.values():
+            futuro.cancel()
+        with self._lock_especulacao:
+            self.especulacoes_descartadas += len(tarefas)
+        tarefas.clear()
+
+    def _processar_clima(self, pergunta: str, resultado=None):
         try:
-            resultado = agente_clima.responder_clima(pergunta)
+            if resultado is None:
+                resultado = agente_clima.responder_clima(pergunta)
             print("\nRESPOSTA:\n")
             print(resultado)
             print()
+            return resultado
         except Exception as e:
             print(f"Erro ao buscar clima: {e}\n")
+            return None
 
-    def _processar_trilhas(self, pergunta: str):
+    def _processar_trilhas(self, pergunta: str, documentos=None):
         chain_tuple = self.agentes_inicializados['trilhas']
 
         try:
-            resposta, docs, mapas, self.chat_history = agente_trilhas.processar_pergunta_com_mapas(
+            resposta, docs, mapas, _ = agente_trilhas.processar_pergunta_com_mapas(
                 chain_tuple,
                 pergunta,
-                self.chat_history
+                self.historico.mensagens(),
+                documentos
             )
+            return resposta, mapas
         except Exception as e:
             print(f"Erro no agente de trilhas: {e}\n")
+            return None, []
 
-    def _processar_geral(self, pergunta: str):
+    def _processar_geral(self, pergunta: str, documentos=None):
         chain_tuple = self.agentes_inicializados['rag']
 
         try:
-            resposta, docs, self.chat_history = agente_rag.processar_pergunta_langchain(
+            resposta, docs, _ = agente_rag.processar_pergunta_langchain(
                 chain_tuple,
                 pergunta,
-                self.chat_history
+                self.historico.mensagens(),
+                documentos
             )
+            return resposta
         except Exception as e:
             print(f"Erro no agente geral: {e}\n")
+            return None
+
+    def estatisticas(self):
+        return {
+            "roteador": self.roteador.estatisticas() if self.roteador else None,
+            "cache_respostas": self.cache_respostas.estatisticas() if self.cache_respostas else None,
+            "historico": self.historico.estatisticas(),
+            "especulacao": {
+                "usadas": self.especulacoes_usadas,
+                "descartadas": self.especulacoes_descartadas,
+                "latencia_economizada_s": round(self.latencia_economizada, 3),
+            },
+        }
 
     def limpar_historico(self):
-        self.chat_history = []
+        self.historico.limpar()
         print("\nHistórico de conversa limpo.\n")
 
 
@@ -236,6 +396,7 @@ def modo_interativo():
     print("  • 'sair'  - encerrar o programa")
     print("  • 'limpar' - limpar histórico")
     print("  • 'ajuda' - ver exemplos de perguntas")
+    print("  • 'estatisticas' - roteamento local, cache e histórico")
     print("=" * 70 + "\n")
 
     while True:
@@ -255,6 +416,12 @@ def modo_interativo():
                 orquestrador.limpar_historico()
                 continue
 
+            if entrada.lower() in ['estatisticas', 'estatísticas', 'stats']:
+                for nome, valores in orquestrador.estatisticas().items():
+                    print(f"{nome}: {valores}")
+                print()
+                continue
+
             if entrada.lower() in ['ajuda', 'help', 'exemplos']:
                 print("\n" + "=" * 70)
                 print("EXEMPLOS DE PERGUNTAS:")
@@ -1,17 +1,23 @@
-import chromadb
 import os
+import re
+import sys
+import time
+import tempfile
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_groq import ChatGroq
 from langchain_core.documents import Document
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from dotenv import load_dotenv
+from busca_hibrida import criar_retriever
+from montagem_contexto import montar_contexto, formatar_economia, formatar_tempos, descrever_trecho
+from recursos_compartilhados import obter_llm, obter_embeddings, obter_vectorstore, obter_cliente_chroma
 from PIL import Image
 import numpy as np
 from io import BytesIO
 import base64
-from datetime import datetime
+from armazenamento_imagens import ArmazemImagens, TAMANHO_TILE, QUALIDADE_TILE
+from indice_mapas import obter_indice
+from cache_colecao import obter_cache
+from cache_lru import CacheLRU
 
 load_dotenv()
 
@@ -22,23 +28,25 @@ COLLECTION_NAME_IMAGENS = "Imagens_PDF_Collection"
 TOP_K_TEXTO = 5
 TOP_K_IMAGENS = 3
 
+# busca vetorial + BM25 (fusão por RRF); False usa só a busca vetorial
+BUSCA_HIBRIDA = True
+
+# parte vetorial da busca: "chroma" ou "memmap" (busca exata numa cópia dos vetores
+# mapeada em memória, ver indice_memmap.py)
+BUSCA_VETORIAL = "chroma"
+
+# tiles, níveis da pirâmide montados e PNGs de mapas antigos, prontos para exibição;
+# limitado em itens e em bytes
+CACHE_MAPAS_ITENS = 32
+CACHE_MAPAS_BYTES = 128 * 1024 * 1024
+
 groq_api_key = os.getenv("GROQ_API_KEY")
 if not groq_api_key:
     print("\nA variável GROQ_API_KEY não foi encontrada no arquivo .env.")
     exit(1)
 
-llm = ChatGroq(
-    groq_api_key=groq_api_key,
-    model_name="llama-3.3-70b-versatile",
-    temperature=0.3,
-    max_tokens=2000
-)
-
-embeddings = HuggingFaceEmbeddings(
-    model_name="all-MiniLM-L6-v2",
-    model_kwargs={'device': 'cpu'},
-    encode_kwargs={'normalize_embeddings': True}
-)
+llm = obter_llm()
+embeddings = obter_embeddings()
 
 
 def inicializar_vectorstores():
@@ -48,16 +56,12 @@ def inicializar_vectorstores():
             "Execute primeiro o processamento dos PDFs."
         )
 
-    vectorstore_texto = Chroma(
-        collection_name=COLLECTION_NAME_TEXTO,
-        embedding_function=embeddings,
-        persist_directory=DB_FOLDER_TEXTO
-    )
+    vectorstore_texto = obter_vectorstore(DB_FOLDER_TEXTO, COLLECTION_NAME_TEXTO)
 
     vectorstore_imagens = None
     if os.path.exists(DB_FOLDER_IMAGENS):
         try:
-            client = chromadb.PersistentClient(path=DB_FOLDER_IMAGENS)
+            client = obter_cliente_chroma(DB_FOLDER_IMAGENS)
             collection_imagens = client.get_collection(name=COLLECTION_NAME_IMAGENS)
             vectorstore_imagens = collection_imagens
             print(f"Banco de imagens carregado: {collection_imagens.count()} imagens disponíveis\n")
@@ -74,59 +78,8 @@ def buscar_mapas_relevantes(vectorstore_imagens, query_text, top_k=TOP_K_IMAGENS
         return []
 
     try:
-        keywords = query_text.lower().split()
-
-        trilha_keywords = [
-            'cascatinha', 'taunay', 'pico', 'tijuca', 'mirante',
-            'mayrink', 'excelsior', 'imperador', 'conde', 'estrada',
-            'caminho', 'trilha', 'vale', 'floresta', 'cachoeira'
-        ]
-
-        results = vectorstore_imagens.get(include=['metadatas', 'documents'])
-
-        if not results['ids']:
-            return []
-
-        mapas_pontuados = []
-
-        for doc_id, metadata, document in zip(
-            results['ids'],
-            results['metadatas'],
-            results['documents']
-        ):
-            arquivo = metadata.get('arquivo_pdf', '').lower()
-            caminho = metadata.get('caminho_relativo', '').lower()
-            doc_text = document.lower() if document else ''
-
-            score = 0
-
-            for keyword in keywords:
-                if len(keyword) > 2:
-                    if keyword in arquivo:
-                        score += 3
-                    if keyword in caminho:
-                        score += 2
-                    if keyword in doc_text:
-                        score += 1
-
-            for trilha_kw in trilha_keywords:
-                if trilha_kw in arquivo or trilha_kw in caminho:
-                    score += 1
-
-            if score > 0:
-                mapas_pontuados.append({
-                    'id': doc_id,
-                    'arquivo': metadata.get('arquivo_pdf', 'Desconhecido'),
-                    'pagina': metadata.get('pagina', '?'),
-                    'caminho': metadata.get('caminho_relativo', ''),
-                    'dimensoes': metadata.get('dimensoes', ''),
-                    'relevancia': score,
-                    'metodo': metadata.get('metodo_extracao', 'desconhecido')
-                })
-
-        mapas_pontuados.sort(key=lambda x: x['relevancia'], reverse=True)
-
-        return mapas_pontuados[:top_k]
+        indice = obter_indice(vectorstore_imagens, DB_FOLDER_IMAGENS)
+        return indice.buscar(query_text, top_k)
 
     except Exception as e:
         print(f"Erro ao buscar mapas: {e}")
@@ -137,6 +90,17 @@ def buscar_mapas_relevantes(vectorstore_imagens, query_text, top_k=TOP_K_IMAGENS
 
 def recuperar_imagem_do_banco(vectorstore_imagens, doc_id):
     try:
+        metadata = obter_cache(vectorstore_imagens, DB_FOLDER_IMAGENS).por_id.get(doc_id)
+
+        # bancos atuais: a imagem fica comprimida no armazém em disco, o Chroma só guarda a chave
+        if metadata and metadata.get('imagem_chave'):
+            img = ArmazemImagens.do_banco(DB_FOLDER_IMAGENS).abrir(metadata['imagem_chave'])
+            if img is None:
+                print(f"Arquivo da imagem não encontrado no armazém: {metadata['imagem_chave']}")
+                return None, None
+            return img, metadata
+
+        # bancos antigos: os pixels 224x224 (ou 448x448) estão no campo de embeddings
         result = vectorstore_imagens.get(ids=[doc_id], include=['embeddings', 'metadatas'])
 
         if result is None or 'embeddings' not in result:
@@ -180,32 +144,171 @@ def recuperar_imagem_do_banco(vectorstore_imagens, doc_id):
         return None, None
 
 
-def exibir_mapa_do_banco(vectorstore_imagens, mapa_info):
-    try:
-        img, metadata = recuperar_imagem_do_banco(vectorstore_imagens, mapa_info['id'])
+cache_mapas = CacheLRU(max_itens=CACHE_MAPAS_ITENS, max_bytes=CACHE_MAPAS_BYTES)
 
-        if img is None:
-            print("Não foi possível recuperar a imagem")
-            return None
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        nome_base = mapa_info['arquivo'].replace('.pdf', '').replace(' ', '_')
-        filename = f"mapa_{nome_base}_p{mapa_info['pagina']}_{timestamp}.png"
-        output_path = os.path.join(os.path.dirname(__file__), filename)
+def obter_png_mapa(vectorstore_imagens, mapa_id, tamanho=None):
+    # PNG do mapa pronto para enviar ou exibir; tamanho=None usa a ampliação padrão
+    chave = (mapa_id, tuple(tamanho) if tamanho else None)
+    png = cache_mapas.obter(chave)
+    if png is not None:
+        return png
 
-        if img.size[0] == 448:
+    img, metadata = recuperar_imagem_do_banco(vectorstore_imagens, mapa_id)
+    if img is None:
+        return None
+
+    if tamanho:
+        new_size = tuple(tamanho)
+    else:
+        if metadata.get('imagem_chave'):
+            scale_factor = 1
+        elif img.size[0] == 448:
             scale_factor = 3
         elif img.size[0] == 224:
             scale_factor = 6
         else:
             scale_factor = 3
-
         new_size = (img.size[0] * scale_factor, img.size[1] * scale_factor)
-        img_display = img.resize(new_size, Image.Resampling.LANCZOS)
-        img_display.save(output_path, quality=100, optimize=False)
+
+    img_display = img if new_size == img.size else img.resize(new_size, Image.Resampling.LANCZOS)
+
+    buffer = BytesIO()
+    img_display.save(buffer, format="PNG", optimize=False)
+    png = buffer.getvalue()
+
+    cache_mapas.guardar(chave, png)
+    return png
+
+
+def info_tiles_mapa(vectorstore_imagens, mapa_id):
+    # descritor da pirâmide (níveis, colunas e linhas de tiles) ou None se o mapa não tem tiles
+    metadata = obter_cache(vectorstore_imagens, DB_FOLDER_IMAGENS).por_id.get(mapa_id)
+    if not metadata or not metadata.get('imagem_chave'):
+        return None
+    return ArmazemImagens.do_banco(DB_FOLDER_IMAGENS).info_piramide(metadata['imagem_chave'])
+
+
+def obter_tile_mapa(vectorstore_imagens, mapa_id, nivel, x, y):
+    # bytes WebP de um tile; o nível 0 é a miniatura, os demais só são lidos quando pedidos
+    chave = (mapa_id, "tile", nivel, x, y)
+    tile = cache_mapas.obter(chave)
+    if tile is not None:
+        return tile
+
+    metadata = obter_cache(vectorstore_imagens, DB_FOLDER_IMAGENS).por_id.get(mapa_id) or {}
+    armazem = ArmazemImagens.do_banco(DB_FOLDER_IMAGENS)
+
+    if metadata.get('imagem_chave') and armazem.tem_piramide(metadata['imagem_chave']):
+        tile = armazem.ler_tile(metadata['imagem_chave'], nivel, x, y)
+    elif nivel == 0 and x == 0 and y == 0:
+        # mapas indexados antes da pirâmide: a miniatura é gerada a partir da imagem inteira
+        img, _ = recuperar_imagem_do_banco(vectorstore_imagens, mapa_id)
+        if img is not None:
+            img = img.convert("RGB")
+            img.thumbnail((TAMANHO_TILE, TAMANHO_TILE), Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            img.save(buffer, format="WEBP", quality=80)
+            tile = buffer.getvalue()
+
+    if tile is not None:
+        cache_mapas.guardar(chave, tile)
+    return tile
+
+
+def obter_miniatura_mapa(vectorstore_imagens, mapa_id):
+    return obter_tile_mapa(vectorstore_imagens, mapa_id, 0, 0, 0)
+
+
+def obter_vista_mapa(vectorstore_imagens, mapa_id, nivel, janela=None):
+    # WebP de um nível da pirâmide montado só com os tiles que cobrem a janela
+    # (x0, y0, x1, y1, em pixels do nível; None = nível inteiro). A imagem original
+    # não é aberta: cada tile vem de obter_tile_mapa e fica no cache
+    info = info_tiles_mapa(vectorstore_imagens, mapa_id)
+    descritor = next((n for n in (info or {}).get('niveis', []) if n['nivel'] == nivel), None)
+    if descritor is None:
+        return None
+
+    x0, y0, x1, y1 = janela or (0, 0, descritor['largura'], descritor['altura'])
+    x0, y0 = max(0, x0), max(0, y0)
+    x1, y1 = min(descritor['largura'], x1), min(descritor['altura'], y1)
+    if x0 >= x1 or y0 >= y1:
+        return None
+
+    tamanho_tile = info['tamanho_tile']
+    colunas = range(x0 // tamanho_tile, (x1 - 1) // tamanho_tile + 1)
+    linhas = range(y0 // tamanho_tile, (y1 - 1) // tamanho_tile + 1)
+
+    # um único tile já está codificado: é devolvido como está
+    if len(colunas) == 1 and len(linhas) == 1 and janela is None:
+        return obter_tile_mapa(vectorstore_imagens, mapa_id, nivel, colunas[0], linhas[0])
+
+    chave = (mapa_id, "vista", nivel, (x0, y0, x1, y1))
+    vista = cache_mapas.obter(chave)
+    if vista is not None:
+        return vista
+
+    img = Image.new("RGB", (x1 - x0, y1 - y0))
+    for y in linhas:
+        for x in colunas:
+            tile = obter_tile_mapa(vectorstore_imagens, mapa_id, nivel, x, y)
+            if tile is None:
+                return None
+            img.paste(Image.open(BytesIO(tile)), (x * tamanho_tile - x0, y * tamanho_tile - y0))
+
+    buffer = BytesIO()
+    img.save(buffer, format="WEBP", quality=QUALIDADE_TILE)
+    vista = buffer.getvalue()
+
+    cache_mapas.guardar(chave, vista)
+    return vista
+
+
+def estatisticas_cache_mapas():
+    return cache_mapas.estatisticas()
+
+
+def exibir_mapa_do_banco(vectorstore_imagens, mapa_info, nivel=0):
+    # por padrão mostra a miniatura (nível 0 da pirâmide, um tile pequeno); níveis maiores
+    # são montados a partir dos tiles. Só mapas indexados antes da pirâmide (nivel=None)
+    # ainda leem a imagem inteira e a convertem em PNG
+    try:
+        if nivel is None:
+            conteudo, extensao, sufixo = obter_png_mapa(vectorstore_imagens, mapa_info['id']), "png", ""
+        elif nivel == 0:
+            conteudo, extensao, sufixo = obter_miniatura_mapa(vectorstore_imagens, mapa_info['id']), "webp", "_miniatura"
+        else:
+            conteudo, extensao, sufixo = obter_vista_mapa(vectorstore_imagens, mapa_info['id'], nivel), "webp", f"_nivel{nivel}"
+
+        if conteudo is None:
+            print("Não foi possível recuperar a imagem")
+            return None
+
+        # o nome leva a chave da imagem no armazém (hash dos pixels) ou, em bancos antigos,
+        # o id do mapa: imagens diferentes da mesma página não disputam o mesmo arquivo
+        metadata = obter_cache(vectorstore_imagens, DB_FOLDER_IMAGENS).por_id.get(mapa_info['id']) or {}
+        chave = metadata.get('imagem_chave')
+        identificador = re.sub(r"[^\w.-]", "_", chave or str(mapa_info['id']))
+        nome_base = mapa_info['arquivo'].replace('.pdf', '').replace(' ', '_')
+        filename = f"mapa_{nome_base}_p{mapa_info['pagina']}_{identificador}{sufixo}.{extensao}"
+        output_path = os.path.join(os.path.dirname(__file__), filename)
+
+        # com a chave de conteúdo, um arquivo existente é sempre a mesma imagem; sem ela o
+        # arquivo é regravado. A gravação vai para um temporário único e só então substitui
+        # o destino, então dois usuários pedindo o mesmo mapa nunca leem um arquivo pela metade
+        if not (chave and os.path.exists(output_path)):
+            descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(output_path), suffix=".tmp")
+            try:
+                with os.fdopen(descritor, "wb") as f:
+                    f.write(conteudo)
+                os.replace(temporario, output_path)
+            except BaseException:
+                if os.path.exists(temporario):
+                    os.remove(temporario)
+                raise
 
         try:
-            img_display.show()
+            Image.open(BytesIO(conteudo)).show()
         except:
             pass
 
@@ -218,6 +321,8 @@ def exibir_mapa_do_banco(vectorstore_imagens, mapa_info):
         return None
 
 
+
+
 def criar_prompt_template():
     template = """Você é um guia especializado em trilhas do Parque Nacional da Tijuca.
 
@@ -255,59 +360,113 @@ PERGUNTA: {question}"""
     ])
 
 
-def criar_chain_rag(vectorstore_texto, vectorstore_imagens):
+def criar_chain_rag(vectorstore_texto, vectorstore_imagens, busca_vetorial=BUSCA_VETORIAL):
     from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.runnables import RunnableLambda
 
-    retriever = vectorstore_texto.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": TOP_K_TEXTO}
-    )
+    retriever = criar_retriever(vectorstore_texto, embeddings, DB_FOLDER_TEXTO, TOP_K_TEXTO, busca_vetorial, BUSCA_HIBRIDA)
 
     prompt = criar_prompt_template()
 
-    def format_docs(docs):
-        return "\n\n".join([
-            f"[Fonte: {doc.metadata.get('arquivo', 'Desconhecido')} - Parte {doc.metadata.get('parte', '?')}]\n{doc.page_content}"
-            for doc in docs
-        ])
-
-    def buscar_info_mapas(query):
-        if vectorstore_imagens is None:
-            return "Nenhum mapa disponível no momento."
-
-        mapas = buscar_mapas_relevantes(vectorstore_imagens, query)
-        if not mapas:
-            return "Nenhum mapa encontrado para esta consulta."
-
-        info = "Mapas disponíveis:\n"
-        for i, mapa in enumerate(mapas, 1):
-            info += f"{i}. {mapa['arquivo']} (Página {mapa['pagina']}) - Score: {mapa['relevancia']}\n"
-        return info
-
-    retrieval_chain = (
+    geracao_chain = (
         {
-            "context": lambda x: format_docs(retriever.invoke(x["question"])),
+            "context": lambda x: x["contexto"],
             "question": lambda x: x["question"],
-            "chat_history": lambda x: x.get("chat_history", []),
-            "mapas_info": lambda x: buscar_info_mapas(x["question"])
+            "chat_history": lambda x: x.get("chat_history", [])
         }
         | prompt
         | llm
         | StrOutputParser()
     )
 
+    # documentos e mapas são buscados uma vez por pergunta (ou recebidos prontos em
+    # "documentos" e "mapas") e devolvidos junto com a resposta e o tempo de cada etapa
+    def executar(x):
+        tempos = {}
+
+        inicio = time.perf_counter()
+        documentos = x.get("documentos")
+        if documentos is None:
+            documentos = retriever.invoke(x["question"])
+        tempos["recuperacao"] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        mapas = x.get("mapas")
+        if mapas is None:
+            mapas = buscar_mapas_relevantes(vectorstore_imagens, x["question"]) if vectorstore_imagens else []
+        tempos["mapas"] = time.perf_counter() - inicio
+
+        # trechos escolhidos por MMR, sem o overlap entre chunks vizinhos e dentro do orçamento
+        inicio = time.perf_counter()
+        contexto, documentos, economia = montar_contexto(
+            documentos, vectorstore_texto, descrever_trecho, retriever=retriever
+        )
+        tempos["contexto"] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        resposta = geracao_chain.invoke({**x, "contexto": contexto})
+        tempos["geracao"] = time.perf_counter() - inicio
+
+        return {"resposta": resposta, "documentos": documentos, "mapas": mapas, "contexto": economia,
+                "tempos": tempos}
+
+    retrieval_chain = RunnableLambda(executar)
+
     return retrieval_chain, retriever, vectorstore_imagens
 
 
-def processar_pergunta_com_mapas(chain_tuple, pergunta, chat_history=None):
+def oferecer_mapas(vectorstore_imagens, mapas, ampliar=True):
+    # pergunta qual mapa exibir (também usado pelo orquestrador ao repetir uma resposta do
+    # cache, com ampliar=False: a resposta repetida só reabre a miniatura)
+    if not mapas:
+        return
+
+    print("Deseja visualizar algum mapa? (número ou 'não')")
+    for i, mapa in enumerate(mapas, 1):
+        print(f"[{i}] {mapa['arquivo']} - Página {mapa['pagina']}")
+
+    escolha = input("Escolha: ").strip()
+    if escolha.isdigit() and 1 <= int(escolha) <= len(mapas):
+        mapa_escolhido = mapas[int(escolha) - 1]
+        if not exibir_mapa_do_banco(vectorstore_imagens, mapa_escolhido):
+            return
+
+        # sem terminal (bot do Discord, Streamlit) ninguém responderia às ampliações
+        if not ampliar or not sys.stdin.isatty():
+            return
+
+        # cada ampliação mostra o próximo nível da pirâmide, lido dos tiles já gerados;
+        # sem pirâmide resta abrir a imagem original de uma vez
+        info = info_tiles_mapa(vectorstore_imagens, mapa_escolhido['id'])
+        if not info:
+            print("Abrir o mapa em resolução completa? (s/n)")
+            if input("Escolha: ").strip().lower() in ['s', 'sim']:
+                exibir_mapa_do_banco(vectorstore_imagens, mapa_escolhido, nivel=None)
+            return
+
+        for descritor in info['niveis'][1:]:
+            print(f"Ampliar o mapa ({descritor['largura']}x{descritor['altura']} px)? (s/n)")
+            if input("Escolha: ").strip().lower() not in ['s', 'sim']:
+                break
+            if not exibir_mapa_do_banco(vectorstore_imagens, mapa_escolhido, nivel=descritor['nivel']):
+                break
+
+
+def processar_pergunta_com_mapas(chain_tuple, pergunta, chat_history=None, documentos=None):
     chain, retriever, vectorstore_imagens = chain_tuple
 
     if chat_history is None:
         chat_history = []
 
     try:
-        documentos = retriever.invoke(pergunta)
-        mapas = buscar_mapas_relevantes(vectorstore_imagens, pergunta) if vectorstore_imagens else []
+        resultado = chain.invoke({
+            "question": pergunta,
+            "chat_history": chat_history,
+            "documentos": documentos
+        })
+        resposta = resultado["resposta"]
+        documentos = resultado["documentos"]
+        mapas = resultado["mapas"]
 
         if documentos:
             fontes = {doc.metadata['arquivo'] for doc in documentos if 'arquivo' in doc.metadata}
@@ -319,24 +478,14 @@ def processar_pergunta_com_mapas(chain_tuple, pergunta, chat_history=None):
             for i, mapa in enumerate(mapas, 1):
                 print(f"{i}. {mapa['arquivo']} (Página {mapa['pagina']}) - Score {mapa['relevancia']}")
 
-        resposta = chain.invoke({
-            "question": pergunta,
-            "chat_history": chat_history
-        })
+        print(f"Contexto: {formatar_economia(resultado['contexto'])}")
+        print(f"Tempos: {formatar_tempos(resultado['tempos'])}")
 
         print("\nResposta:")
         print(resposta)
         print()
 
-        if mapas:
-            print("Deseja visualizar algum mapa? (número ou 'não')")
-            for i, mapa in enumerate(mapas, 1):
-                print(f"[{i}] {mapa['arquivo']} - Página {mapa['pagina']}")
-
-            escolha = input("Escolha: ").strip()
-            if escolha.isdigit() and 1 <= int(escolha) <= len(mapas):
-                mapa_escolhido = mapas[int(escolha) - 1]
-                exibir_mapa_do_banco(vectorstore_imagens, mapa_escolhido)
+        oferecer_mapas(vectorstore_imagens, mapas)
 
         chat_history.append(HumanMessage(content=pergunta))
         chat_history.append(AIMessage(content=resposta))
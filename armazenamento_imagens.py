@@ -0,0 +1,179 @@
+import os
+import json
+import math
+import shutil
+import hashlib
+from io import BytesIO
+from PIL import Image
+
+NOME_PASTA_IMAGENS = "imagens"
+FORMATO_PADRAO = "WEBP"
+QUALIDADE_PADRAO = 90
+
+# WebP não aceita lados maiores que isso; acima do limite a imagem vai em PNG
+LADO_MAXIMO_WEBP = 16383
+
+EXTENSOES = {"WEBP": ".webp", "PNG": ".png", "JPEG": ".jpg"}
+
+# pirâmide de tiles: o nível 0 cabe num único tile (a miniatura) e cada nível seguinte
+# dobra a resolução até chegar à imagem original
+TAMANHO_TILE = 256
+FORMATO_TILE = "WEBP"
+QUALIDADE_TILE = 80
+NOME_DESCRITOR_PIRAMIDE = "piramide.json"
+
+
+class ArmazemImagens:
+    # Imagens comprimidas em disco, endereçadas pelo hash dos pixels. O Chroma guarda
+    # apenas um descritor pequeno e a chave; o arquivo só é lido quando o mapa é exibido.
+
+    def __init__(self, pasta, formato=FORMATO_PADRAO, qualidade=QUALIDADE_PADRAO):
+        self.pasta = pasta
+        self.formato = formato.upper()
+        self.qualidade = qualidade
+
+    @classmethod
+    def do_banco(cls, db_folder, **kwargs):
+        return cls(os.path.join(db_folder, NOME_PASTA_IMAGENS), **kwargs)
+
+    @staticmethod
+    def calcular_chave(img):
+        h = hashlib.sha256()
+        h.update(f"{img.mode}:{img.size[0]}x{img.size[1]}:".encode())
+        h.update(img.tobytes())
+        return h.hexdigest()[:32]
+
+    def _formato_para(self, img):
+        if self.formato == "WEBP" and max(img.size) > LADO_MAXIMO_WEBP:
+            return "PNG"
+        return self.formato
+
+    def caminho(self, chave):
+        # subpastas pelo prefixo da chave para não acumular milhares de arquivos num diretório
+        subpasta = os.path.join(self.pasta, chave[:2])
+        for extensao in EXTENSOES.values():
+            caminho = os.path.join(subpasta, chave + extensao)
+            if os.path.exists(caminho):
+                return caminho
+        return None
+
+    def salvar(self, img):
+        # devolve (chave, caminho_relativo, bytes_gravados); imagens já armazenadas não são recodificadas
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+
+        chave = self.calcular_chave(img)
+        existente = self.caminho(chave)
+        if existente:
+            return chave, os.path.relpath(existente, self.pasta), os.path.getsize(existente)
+
+        formato = self._formato_para(img)
+        subpasta = os.path.join(self.pasta, chave[:2])
+        os.makedirs(subpasta, exist_ok=True)
+        destino = os.path.join(subpasta, chave + EXTENSOES[formato])
+
+        buffer = BytesIO()
+        if formato == "PNG":
+            img.save(buffer, format="PNG", optimize=True)
+        else:
+            img.save(buffer, format=formato, quality=self.qualidade, method=4)
+
+        temporario = destino + ".tmp"
+        with open(temporario, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(temporario, destino)
+
+        return chave, os.path.relpath(destino, self.pasta), len(buffer.getvalue())
+
+    def abrir(self, chave):
+        caminho = self.caminho(chave)
+        if caminho is None:
+            return None
+
+        img = Image.open(caminho)
+        img.load()
+        return img
+
+    def remover(self, chave):
+        caminho = self.caminho(chave)
+        if caminho:
+            os.remove(caminho)
+        shutil.rmtree(self._pasta_tiles(chave), ignore_errors=True)
+
+    def _pasta_tiles(self, chave):
+        return os.path.join(self.pasta, chave[:2], chave + "_tiles")
+
+    def tem_piramide(self, chave):
+        return os.path.exists(os.path.join(self._pasta_tiles(chave), NOME_DESCRITOR_PIRAMIDE))
+
+    def gerar_piramide(self, chave, img, tamanho_tile=TAMANHO_TILE):
+        # gera os tiles a partir da imagem original e devolve o descritor da pirâmide
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+
+        largura, altura = img.size
+        nivel_max = max(0, math.ceil(math.log2(max(largura, altura) / tamanho_tile)))
+        extensao = EXTENSOES[FORMATO_TILE]
+
+        destino = self._pasta_tiles(chave)
+        temporario = destino + ".tmp"
+        shutil.rmtree(temporario, ignore_errors=True)
+
+        niveis = []
+        atual = img
+        for nivel in range(nivel_max, -1, -1):
+            if nivel < nivel_max:
+                atual = atual.reduce(2)
+
+            pasta_nivel = os.path.join(temporario, str(nivel))
+            os.makedirs(pasta_nivel, exist_ok=True)
+
+            colunas = math.ceil(atual.width / tamanho_tile)
+            linhas = math.ceil(atual.height / tamanho_tile)
+            for y in range(linhas):
+                for x in range(colunas):
+                    caixa = (
+                        x * tamanho_tile, y * tamanho_tile,
+                        min((x + 1) * tamanho_tile, atual.width), min((y + 1) * tamanho_tile, atual.height)
+                    )
+                    atual.crop(caixa).save(
+                        os.path.join(pasta_nivel, f"{x}_{y}{extensao}"),
+                        format=FORMATO_TILE, quality=QUALIDADE_TILE
+                    )
+
+            niveis.append({"nivel": nivel, "largura": atual.width, "altura": atual.height,
+                           "colunas": colunas, "linhas": linhas})
+
+        descritor = {
+            "tamanho_tile": tamanho_tile,
+            "formato": FORMATO_TILE,
+            "niveis": sorted(niveis, key=lambda n: n["nivel"]),
+        }
+        with open(os.path.join(temporario, NOME_DESCRITOR_PIRAMIDE), "w", encoding="utf-8") as f:
+            json.dump(descritor, f)
+
+        # a pasta só aparece completa: uma ingestão interrompida não deixa pirâmide pela metade
+        shutil.rmtree(destino, ignore_errors=True)
+        os.replace(temporario, destino)
+        return descritor
+
+    def info_piramide(self, chave):
+        try:
+            with open(os.path.join(self._pasta_tiles(chave), NOME_DESCRITOR_PIRAMIDE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except OSError:
+            return None
+
+    def ler_tile(self, chave, nivel, x, y):
+        caminho = os.path.join(self._pasta_tiles(chave), str(nivel), f"{x}_{y}{EXTENSOES[FORMATO_TILE]}")
+        if not os.path.exists(caminho):
+            return None
+        with open(caminho, "rb") as f:
+            return f.read()
+
+    def tamanho_total(self):
+        total = 0
+        for raiz, _, arquivos in os.walk(self.pasta):
+            total += sum(os.path.getsize(os.path.join(raiz, a)) for a in arquivos)
+        return total
+
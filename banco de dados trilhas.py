@@ -1,26 +1,71 @@
 import chromadb
 import os
-import uuid
-import tkinter as tk
-from tkinter import filedialog, messagebox
+import sys
+import json
+import time
+import shutil
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from PIL import Image
 import numpy as np
 from chromadb.utils import embedding_functions
-import base64
 from io import BytesIO
 import fitz
-
-pdf_folder = filedialog.askdirectory(
-    title="Selecione a pasta com os PDFs (imagens)",
-    initialdir=os.path.expanduser("~")
+from armazenamento_imagens import ArmazemImagens
+from indice_mapas import IndiceMapas, caminho_indice
+from cache_colecao import marcar_nova_versao
+from deduplicacao import (
+    calcular_hash_perceptual, imagens_equivalentes, IndiceHashPerceptual, DISTANCIA_MAXIMA_HASH,
+    DIFERENCA_MAXIMA_BLOCO
+)
+from manifesto_ingestao import (
+    carregar_manifesto, novo_manifesto, salvar_manifesto, identificar_arquivos,
+    registrar_arquivo, remover_registro, iniciar_execucao, execucao_interrompida,
+    concluir_execucao
 )
 
 db_folder = os.path.join(os.path.dirname(__file__), "Banco de dados imagens trilhas")
 COLLECTION_NAME = "Imagens_PDF_Collection"
 
+# incremental: só processa PDFs novos ou alterados (via manifesto de hashes);
+# False refaz a coleção inteira (equivale a --completo)
+MODO_INCREMENTAL = True
+
+# renderização das páginas: resolução, pool de processos (1 = sem pool) e fração
+# da página coberta por imagens embutidas a partir da qual a renderização é dispensada
+DPI_RENDERIZACAO = 300
+NUM_WORKERS = os.cpu_count() or 1
+LIMIAR_COBERTURA = 0.9
+
+# imagens visualmente iguais (pHash a até DISTANCIA_MAXIMA_HASH bits, confirmado pelos
+# pixels) viram um único registro, com a lista de todas as páginas de origem em "fontes_json"
+CAMPOS_FONTE = ("arquivo_pdf", "caminho_relativo", "pasta", "pagina", "indice_imagem")
+
+# pirâmide de tiles (WebP, vários níveis de zoom) gerada para cada imagem nova; o agente
+# mostra a miniatura na hora e só busca os tiles de zoom maior quando pedidos
+GERAR_TILES = True
+
+# imagens acumuladas antes de cada upsert no Chroma (1 = uma chamada por imagem)
+TAMANHO_LOTE_IMAGENS = 64
+
+
+def selecionar_pasta_interativa():
+    # só usado sem --pdfs; o tkinter fica fora do import para rodar em servidores sem interface
+    try:
+        from tkinter import filedialog
+        return filedialog.askdirectory(
+            title="Selecione a pasta com os PDFs (imagens)",
+            initialdir=os.path.expanduser("~")
+        )
+    except Exception as e:
+        print(f"Não foi possível abrir a janela de seleção: {e}")
+        return None
+
 
-def validar_ambiente():
+def validar_ambiente(pdf_folder):
     if not os.path.exists(pdf_folder):
         raise FileNotFoundError(f"Pasta não encontrada: {pdf_folder}")
 
@@ -42,19 +87,101 @@ def validar_ambiente():
     return pdfs
 
 
-def extrair_imagens_pdf(caminho_pdf):
-    imagens = []
+def interpretar_paginas(texto):
+    # "1-3,7" -> {1, 2, 3, 7}; vazio ou None -> todas as páginas
+    if not texto:
+        return None
+
+    paginas = set()
+    for parte in texto.split(","):
+        parte = parte.strip()
+        if "-" in parte:
+            inicio, fim = parte.split("-", 1)
+            paginas.update(range(int(inicio), int(fim) + 1))
+        elif parte:
+            paginas.add(int(parte))
+    return paginas
+
+
+def _cobertura_imagens(pagina, lista):
+    # fração da página ocupada pelas imagens embutidas (união aproximada numa grade 64x64)
+    area = pagina.rect
+    if area.is_empty:
+        return 0.0
+
+    grade = np.zeros((64, 64), dtype=bool)
+    for img_info in lista:
+        try:
+            retangulos = pagina.get_image_rects(img_info[0])
+        except Exception:
+            continue
+
+        for r in retangulos:
+            r = r & area
+            if r.is_empty:
+                continue
+            x0 = int((r.x0 - area.x0) / area.width * 64)
+            x1 = int(np.ceil((r.x1 - area.x0) / area.width * 64))
+            y0 = int((r.y0 - area.y0) / area.height * 64)
+            y1 = int(np.ceil((r.y1 - area.y0) / area.height * 64))
+            grade[y0:y1, x0:x1] = True
+
+    return float(grade.mean())
+
+
+def _renderizar_pagina(caminho_pdf, pagina_num, dpi):
+    # roda dentro dos workers: cada um abre o PDF e devolve só os pixels de uma página
+    with fitz.open(caminho_pdf) as doc:
+        matriz = fitz.Matrix(dpi / 72, dpi / 72)
+        pix = doc[pagina_num].get_pixmap(matrix=matriz, alpha=False)
+        return pix.width, pix.height, pix.samples
+
+
+def extrair_imagens_pdf(caminho_pdf, dpi=DPI_RENDERIZACAO, paginas=None, executor=None,
+                        num_workers=1, limiar_cobertura=LIMIAR_COBERTURA):
+    # gera (img, info) uma imagem por vez. Páginas cujas imagens embutidas já cobrem
+    # quase toda a área não são renderizadas. Com executor, as renderizações rodam no
+    # pool com no máximo uma página adiantada por worker (num_workers do pool).
+    # Um PDF que não abre levanta a exceção para quem consome o gerador: tratado como
+    # "sem imagens", ele entraria no manifesto e nunca seria tentado de novo
+    doc = fitz.open(caminho_pdf)
+
+    pendentes = deque()
+    limite_pendentes = max(1, num_workers)
+
+    def imagem_renderizada(pagina_num, resultado):
+        largura, altura, samples = resultado
+        img = Image.frombytes("RGB", [largura, altura], samples)
+
+        info = {
+            'pagina': pagina_num + 1,
+            'indice_imagem': 1,
+            'dimensoes_originais': img.size,
+            'modo': img.mode,
+            'formato': 'rendered_page',
+            'tamanho_bytes': len(samples),
+            'metodo': 'renderizada',
+            'dpi': dpi
+        }
+        print(f"      → Página {pagina_num + 1}: {img.size[0]}x{img.size[1]} pixels")
+        return img, info
+
     try:
-        doc = fitz.open(caminho_pdf)
         print(f"     {len(doc)} página(s)")
 
         total_embutidas = 0
+        paginas_puladas = 0
 
         for pagina_num in range(len(doc)):
+            if paginas is not None and pagina_num + 1 not in paginas:
+                continue
+
             pagina = doc[pagina_num]
             lista = pagina.get_images(full=True)
 
             for img_index, img_info in enumerate(lista):
+                # o yield fica fora do try: um except ali capturaria o GeneratorExit de
+                # quem para de consumir o gerador no meio
                 try:
                     xref = img_info[0]
                     base_image = doc.extract_image(xref)
@@ -63,97 +190,248 @@ def extrair_imagens_pdf(caminho_pdf):
 
                     img = Image.open(BytesIO(image_bytes))
 
-                    if img.size[0] >= 100 and img.size[1] >= 100:
-                        info = {
-                            'pagina': pagina_num + 1,
-                            'indice_imagem': img_index + 1,
-                            'dimensoes_originais': img.size,
-                            'modo': img.mode,
-                            'formato': ext,
-                            'tamanho_bytes': len(image_bytes),
-                            'metodo': 'embutida'
-                        }
-
-                        imagens.append((img, info))
-                        total_embutidas += 1
-                except:
-                    continue
+                    if img.size[0] < 100 or img.size[1] < 100:
+                        continue
 
-        if total_embutidas > 0:
-            print(f"       {total_embutidas} imagem(ns) embutida(s) extraída(s)")
+                    info = {
+                        'pagina': pagina_num + 1,
+                        'indice_imagem': img_index + 1,
+                        'dimensoes_originais': img.size,
+                        'modo': img.mode,
+                        'formato': ext,
+                        'tamanho_bytes': len(image_bytes),
+                        'metodo': 'embutida'
+                    }
+                except Exception:
+                    continue
 
-        print("      Renderizando páginas...")
+                total_embutidas += 1
+                yield img, info
 
-        for pagina_num in range(len(doc)):
-            pagina = doc[pagina_num]
-            matriz = fitz.Matrix(300 / 72, 300 / 72)
-            pix = pagina.get_pixmap(matrix=matriz, alpha=False)
+            if lista and _cobertura_imagens(pagina, lista) >= limiar_cobertura:
+                paginas_puladas += 1
+                continue
 
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            if executor is None:
+                yield imagem_renderizada(pagina_num, _renderizar_pagina(caminho_pdf, pagina_num, dpi))
+                continue
 
-            info = {
-                'pagina': pagina_num + 1,
-                'indice_imagem': 1,
-                'dimensoes_originais': img.size,
-                'modo': img.mode,
-                'formato': 'rendered_page',
-                'tamanho_bytes': len(pix.samples),
-                'metodo': 'renderizada',
-                'dpi': 300
-            }
+            pendentes.append((pagina_num, executor.submit(_renderizar_pagina, caminho_pdf, pagina_num, dpi)))
+            if len(pendentes) >= limite_pendentes:
+                pagina_pronta, futuro = pendentes.popleft()
+                yield imagem_renderizada(pagina_pronta, futuro.result())
 
-            imagens.append((img, info))
-            print(f"      → Página {pagina_num + 1}: {img.size[0]}x{img.size[1]} pixels")
+        while pendentes:
+            pagina_pronta, futuro = pendentes.popleft()
+            yield imagem_renderizada(pagina_pronta, futuro.result())
 
+        if total_embutidas > 0:
+            print(f"       {total_embutidas} imagem(ns) embutida(s) extraída(s)")
+        if paginas_puladas > 0:
+            print(f"       {paginas_puladas} página(s) não renderizada(s): cobertas pelas imagens embutidas")
+
+    # falhas de renderização (inclusive BrokenProcessPool) sobem para processar_pdfs, que
+    # conta o arquivo como erro e não o registra: senão as páginas perdidas nunca voltariam
+    finally:
+        for _, futuro in pendentes:
+            futuro.cancel()
         doc.close()
-        return imagens
-
-    except Exception as e:
-        print(f"    Erro ao processar PDF: {e}")
-        return []
 
 
 def extrair_features_imagem(img):
+    # descritor compacto (luminância 8x8 + histograma de cor 4x4x4, normalizado); os pixels
+    # ficam no armazém de imagens, não no Chroma
     try:
         if img.mode != 'RGB':
             img = img.convert('RGB')
 
-        img_resized = img.resize((224, 224))
-        img_array = np.array(img_resized).astype('float32') / 255.0
-        embedding = img_array.flatten().tolist()
+        miniatura = np.asarray(img.convert('L').resize((8, 8), Image.Resampling.BOX), dtype=np.float32).ravel()
+        miniatura -= miniatura.mean()
 
-        return embedding
+        cores = np.asarray(img.resize((64, 64), Image.Resampling.BOX), dtype=np.uint8).reshape(-1, 3) // 64
+        indices = cores[:, 0].astype(np.int32) * 16 + cores[:, 1] * 4 + cores[:, 2]
+        histograma = np.bincount(indices, minlength=64).astype(np.float32)
+
+        def normalizar(v):
+            norma = np.linalg.norm(v)
+            return v / norma if norma > 0 else v
+
+        descritor = normalizar(np.concatenate([normalizar(miniatura), normalizar(histograma)]))
+        return descritor.tolist()
 
     except Exception as e:
         print(f"    Erro ao processar imagem: {e}")
         return None
 
 
-def imagem_para_base64(img, max_size=(800, 800)):
+def limpar_colecao_existente(client, collection_name):
+    # recria a coleção: a dimensão dos vetores pode ter mudado entre versões da ingestão
     try:
-        copia = img.copy()
-        copia.thumbnail(max_size, Image.Resampling.LANCZOS)
+        client.delete_collection(name=collection_name)
+        print("    Coleção anterior removida\n")
+    except Exception as e:
+        print(f"    Aviso ao limpar coleção: {e}\n")
 
-        buffer = BytesIO()
-        copia.save(buffer, format="JPEG")
-        return base64.b64encode(buffer.getvalue()).decode()
+    return client.get_or_create_collection(
+        name=collection_name,
+        metadata={"description": "Imagens extraídas de PDFs"}
+    )
 
-    except:
-        return None
+
+def parametros_ingestao(collection_name=COLLECTION_NAME, dpi=DPI_RENDERIZACAO, paginas=None):
+    # qualquer mudança aqui invalida o manifesto e força a reconstrução completa
+    return {
+        "colecao": collection_name, "embedding": "descritor_128", "armazenamento": "arquivos",
+        "versao_ids": 2, "dpi": dpi, "paginas": sorted(paginas) if paginas else None,
+        "limiar_cobertura": LIMIAR_COBERTURA, "distancia_maxima_hash": DISTANCIA_MAXIMA_HASH,
+        "diferenca_maxima_bloco": DIFERENCA_MAXIMA_BLOCO
+    }
+
+
+def gerar_id_imagem(chave):
+    # um registro por imagem distinta: o id vem do conteúdo, não da página de origem
+    return f"img-{chave}"
+
+
+def buscar_original(indice, registros, armazem, img, phash):
+    # o pHash só aponta candidatos; o primeiro cujos pixels batem com os da imagem nova é
+    # tratado como a mesma imagem. Sem essa confirmação, mapas de trilhas diferentes
+    # desenhados sobre a mesma base virariam um registro só
+    for candidato in indice.buscar_candidatos(phash):
+        chave = registros.get(candidato, {}).get("imagem_chave")
+        armazenada = armazem.abrir(chave) if chave else None
+        if armazenada is not None and imagens_equivalentes(img, armazenada):
+            return candidato
+    return None
+
+
+def fontes_do_registro(metadata):
+    return json.loads(metadata.get("fontes_json") or "[]")
+
+
+def aplicar_fontes(metadata, fontes):
+    # a primeira fonte preenche os campos avulsos, que a busca por palavras-chave e a
+    # exibição continuam lendo como antes
+    metadata.update({campo: fontes[0][campo] for campo in CAMPOS_FONTE})
+    metadata["fontes_json"] = json.dumps(fontes, ensure_ascii=False)
+    metadata["num_fontes"] = len(fontes)
+
+
+def documento_do_registro(metadata):
+    return " | ".join(
+        f"{f['caminho_relativo']}_p{f['pagina']}_i{f['indice_imagem']}" for f in fontes_do_registro(metadata)
+    )
+
+
+def atualizar_registros(collection, registros, ids):
+    # reenvia os vetores já gravados: sem eles o Chroma recalcularia embeddings a partir do texto
+    if not ids:
+        return
+
+    embeddings = collection.get(ids=ids, include=["embeddings"])
+    collection.update(
+        ids=embeddings["ids"],
+        embeddings=embeddings["embeddings"],
+        documents=[documento_do_registro(registros[i]) for i in embeddings["ids"]],
+        metadatas=[registros[i] for i in embeddings["ids"]]
+    )
+
+
+def carregar_registros_imagens(collection):
+    # metadados de todas as imagens já indexadas e o índice de hashes perceptuais; o
+    # Chroma é a única fonte de verdade, então nada disso precisa ir para o manifesto
+    resultado = collection.get(include=["metadatas"])
+    registros = {}
+    indice = IndiceHashPerceptual()
+
+    for id_imagem, metadata in zip(resultado["ids"], resultado["metadatas"]):
+        metadata = dict(metadata or {})
+        registros[id_imagem] = metadata
+        if metadata.get("phash"):
+            indice.adicionar(id_imagem, int(metadata["phash"], 16))
+
+    return registros, indice
 
 
-def limpar_colecao_existente(collection):
+def desvincular_arquivo(collection, armazem, indice, registros, caminho_relativo):
+    # tira as fontes do arquivo de cada imagem; imagens sem nenhuma fonte restante saem
+    # do Chroma, do índice e do armazém, as demais passam a apontar para a próxima fonte
+    apagar, atualizar = [], []
+
+    for id_imagem, metadata in registros.items():
+        fontes = fontes_do_registro(metadata)
+        restantes = [f for f in fontes if f["caminho_relativo"] != caminho_relativo]
+        if len(restantes) == len(fontes):
+            continue
+
+        if restantes:
+            aplicar_fontes(metadata, restantes)
+            atualizar.append(id_imagem)
+        else:
+            apagar.append(id_imagem)
+
+    if apagar:
+        collection.delete(ids=apagar)
+        for id_imagem in apagar:
+            indice.remover(id_imagem)
+            armazem.remover(registros.pop(id_imagem)["imagem_chave"])
+
+    atualizar_registros(collection, registros, atualizar)
+
+    return len(apagar), len(atualizar)
+
+
+def descartar_arquivo_com_erro(collection, armazem, indice, registros, caminho_relativo, lote):
+    # desfaz o que um arquivo interrompido deixou: as imagens do lote não gravado saem do
+    # índice, de registros e do armazém, e as já gravadas perdem a fonte deste arquivo,
+    # como na próxima execução, que vai processá-lo de novo
+    for id_imagem, _, metadata in lote:
+        indice.remover(id_imagem)
+        registros.pop(id_imagem, None)
+        if not any(outro.get("imagem_chave") == metadata["imagem_chave"] for outro in registros.values()):
+            armazem.remover(metadata["imagem_chave"])
+    lote.clear()
+
     try:
-        results = collection.get()
-        if results['ids']:
-            collection.delete(ids=results['ids'])
-            print(f"    Removidos {len(results['ids'])} itens antigos\n")
+        desvincular_arquivo(collection, armazem, indice, registros, caminho_relativo)
     except Exception as e:
-        print(f"    Aviso ao limpar coleção: {e}\n")
+        print(f"    Aviso: não foi possível desfazer as imagens de '{caminho_relativo}': {e}")
+
+
+def gravar_lote_imagens(collection, lote):
+    # lote: [(id, embedding, documento, metadata), ...]. Devolve os ids gravados; se o
+    # upsert do lote falhar, regrava item a item para saber exatamente quais falharam.
+    if not lote:
+        return []
+
+    try:
+        collection.upsert(
+            ids=[item[0] for item in lote],
+            embeddings=[item[1] for item in lote],
+            documents=[item[2] for item in lote],
+            metadatas=[item[3] for item in lote]
+        )
+        return [item[0] for item in lote]
+
+    except Exception as e:
+        print(f"        Erro ao gravar lote de {len(lote)} imagem(ns): {e} — gravando uma a uma")
+
+    gravados = []
+    for id_imagem, embedding, documento, metadata in lote:
+        try:
+            collection.upsert(ids=[id_imagem], embeddings=[embedding], documents=[documento], metadatas=[metadata])
+            gravados.append(id_imagem)
+        except Exception as e:
+            print(f"        Erro ao gravar imagem {documento}: {e}")
 
+    return gravados
 
-def processar_pdfs():
-    pdfs = validar_ambiente()
+
+def processar_pdfs(pdf_folder, db_folder=db_folder, collection_name=COLLECTION_NAME,
+                   completo=not MODO_INCREMENTAL, reiniciar=False, dpi=DPI_RENDERIZACAO,
+                   paginas=None, num_workers=NUM_WORKERS, tamanho_lote=TAMANHO_LOTE_IMAGENS,
+                   gerar_tiles=GERAR_TILES):
+    pdfs = validar_ambiente(pdf_folder)
 
     os.makedirs(db_folder, exist_ok=True)
 
@@ -161,17 +439,65 @@ def processar_pdfs():
     client = chromadb.PersistentClient(path=db_folder)
 
     collection = client.get_or_create_collection(
-        name=COLLECTION_NAME,
+        name=collection_name,
         metadata={"description": "Imagens extraídas de PDFs"}
     )
+    armazem = ArmazemImagens.do_banco(db_folder)
+
+    parametros = parametros_ingestao(collection_name, dpi, paginas)
+    manifesto, compativel = carregar_manifesto(db_folder, parametros)
+    reconstrucao = False
+    retomada = False
+
+    if compativel and execucao_interrompida(manifesto) and not reiniciar:
+        # a execução anterior pode ter gravado na coleção sem chegar a refazer os índices
+        retomada = True
+        print(f"    Retomando execução interrompida (iniciada em {manifesto['execucao']['inicio']})")
+    elif completo or not compativel:
+        if not completo:
+            print("    Manifesto ausente ou com outros parâmetros — reconstrução completa")
+        collection = limpar_colecao_existente(client, collection_name)
+        shutil.rmtree(armazem.pasta, ignore_errors=True)
+        manifesto = novo_manifesto(parametros)
+        reconstrucao = True
+        iniciar_execucao(manifesto, completa=True)
+    else:
+        iniciar_execucao(manifesto, completa=False)
+    salvar_manifesto(db_folder, manifesto)
+
+    estado, novos, alterados, inalterados, removidos = identificar_arquivos(
+        manifesto,
+        {caminho_relativo: caminho_pdf for caminho_pdf, caminho_relativo in pdfs}
+    )
+
+    print(f" Novos: {len(novos)} | Alterados: {len(alterados)} | "
+          f"Inalterados: {len(inalterados)} | Removidos: {len(removidos)}\n")
+
+    registros, indice = carregar_registros_imagens(collection)
 
-    limpar_colecao_existente(collection)
+    for caminho_relativo in removidos:
+        remover_registro(manifesto, caminho_relativo)
+        apagadas, mantidas = desvincular_arquivo(collection, armazem, indice, registros, caminho_relativo)
+        salvar_manifesto(db_folder, manifesto)
+        print(f"    Imagens de '{caminho_relativo}' removidas (arquivo não existe mais): "
+              f"{apagadas} apagada(s), {mantidas} mantida(s) por outras fontes")
+
+    pdfs = [(caminho_pdf, rel) for caminho_pdf, rel in pdfs if rel in novos or rel in alterados]
 
     total_imagens = 0
+    total_falhas = 0
+    total_duplicatas = 0
+    total_piramides = 0
+    tempo_total_tiles = 0.0
+    tempo_total_gravacao = 0.0
     pdfs_processados = 0
     pdfs_com_erro = 0
+    pdfs_sem_imagens = 0
     inicio_geral = datetime.now()
 
+    executor = ProcessPoolExecutor(max_workers=num_workers) if num_workers > 1 else None
+    print(f"Renderizando a {dpi} DPI com {num_workers} worker(s)")
+
     for idx, (caminho_pdf, caminho_relativo) in enumerate(pdfs, 1):
         nome_pdf = os.path.basename(caminho_pdf)
         pasta_rel = os.path.dirname(caminho_relativo)
@@ -180,84 +506,250 @@ def processar_pdfs():
         if pasta_rel:
             print(f"     Pasta: {pasta_rel}")
 
+        # imagens ainda não gravadas no Chroma; numa falha saem de registros e do índice
+        lote = []
+
         try:
             inicio = datetime.now()
-            imagens_extraidas = extrair_imagens_pdf(caminho_pdf)
-
-            if not imagens_extraidas:
-                print("    Nenhuma imagem encontrada — pulando arquivo")
-                pdfs_com_erro += 1
-                continue
+            imagens_extraidas = extrair_imagens_pdf(caminho_pdf, dpi=dpi, paginas=paginas, executor=executor,
+                                                    num_workers=num_workers)
 
+            imagens_lidas = 0
             imagens_ok = 0
+            falhas = 0
+            duplicatas = 0
+            tempo_gravacao = 0.0
+            ids_arquivo = []
+            # imagens já gravadas que ganharam uma fonte nova neste arquivo
+            atualizadas = set()
+
+            def descarregar_lote():
+                nonlocal imagens_ok, falhas, tempo_gravacao
+                inicio_gravacao = time.perf_counter()
+                gravados = gravar_lote_imagens(
+                    collection,
+                    [(id_imagem, embedding, documento_do_registro(metadata), metadata)
+                     for id_imagem, embedding, metadata in lote]
+                )
+                tempo_gravacao += time.perf_counter() - inicio_gravacao
+
+                # o que não foi gravado sai do índice para não servir de original a duplicatas
+                for id_imagem, _, _ in lote:
+                    if id_imagem not in gravados:
+                        indice.remover(id_imagem)
+                        registros.pop(id_imagem, None)
+
+                ids_arquivo.extend(gravados)
+                imagens_ok += len(gravados)
+                falhas += len(lote) - len(gravados)
+                lote.clear()
+
+            # também para arquivos novos: limpa o que uma execução interrompida deixou gravado pela metade
+            desvincular_arquivo(collection, armazem, indice, registros, caminho_relativo)
 
             for img, info in imagens_extraidas:
+                imagens_lidas += 1
                 try:
+                    fonte = {
+                        "arquivo_pdf": nome_pdf,
+                        "caminho_relativo": caminho_relativo,
+                        "pasta": pasta_rel if pasta_rel else "raiz",
+                        "pagina": info['pagina'],
+                        "indice_imagem": info['indice_imagem'],
+                    }
+
+                    phash = calcular_hash_perceptual(img)
+                    original = buscar_original(indice, registros, armazem, img, phash)
+
+                    if original is not None:
+                        # mesma imagem já indexada: só acrescenta a página de origem
+                        metadata = registros[original]
+                        fontes = fontes_do_registro(metadata)
+                        if fonte not in fontes:
+                            aplicar_fontes(metadata, fontes + [fonte])
+                            if all(item[0] != original for item in lote):
+                                atualizadas.add(original)
+                        if original not in ids_arquivo:
+                            ids_arquivo.append(original)
+                        duplicatas += 1
+                        continue
+
                     embedding = extrair_features_imagem(img)
                     if embedding is None:
+                        falhas += 1
                         continue
 
-                    img_base64 = imagem_para_base64(img)
+                    chave, caminho_imagem, bytes_gravados = armazem.salvar(img)
+
+                    niveis_tiles = 0
+                    if gerar_tiles:
+                        inicio_tiles = time.perf_counter()
+                        piramide = armazem.info_piramide(chave) or armazem.gerar_piramide(chave, img)
+                        tempo_total_tiles += time.perf_counter() - inicio_tiles
+                        niveis_tiles = len(piramide["niveis"])
+                        total_piramides += 1
 
                     metadata = {
-                        "arquivo_pdf": nome_pdf,
-                        "caminho_relativo": caminho_relativo,
-                        "pasta": pasta_rel if pasta_rel else "raiz",
-                        "pagina": info['pagina'],
-                        "indice_imagem": info['indice_imagem'],
                         "dimensoes": f"{info['dimensoes_originais'][0]}x{info['dimensoes_originais'][1]}",
                         "formato": info['formato'],
                         "tamanho_kb": round(info['tamanho_bytes'] / 1024, 2),
+                        "imagem_chave": chave,
+                        "imagem_arquivo": caminho_imagem,
+                        "tamanho_armazenado_kb": round(bytes_gravados / 1024, 2),
+                        "phash": f"{phash:016x}",
+                        "tiles_niveis": niveis_tiles,
                         "data_processamento": datetime.now().isoformat(),
                     }
+                    aplicar_fontes(metadata, [fonte])
 
-                    if img_base64:
-                        metadata["preview_base64"] = img_base64[:1000]
-
-                    doc_id = f"{caminho_relativo}_p{info['pagina']}_i{info['indice_imagem']}"
+                    id_imagem = gerar_id_imagem(chave)
+                    registros[id_imagem] = metadata
+                    indice.adicionar(id_imagem, phash)
 
-                    collection.add(
-                        ids=[str(uuid.uuid4())],
-                        embeddings=[embedding],
-                        documents=[doc_id],
-                        metadatas=[metadata]
-                    )
-
-                    imagens_ok += 1
-                    total_imagens += 1
+                    lote.append((id_imagem, embedding, metadata))
+                    if len(lote) >= tamanho_lote:
+                        descarregar_lote()
 
                 except Exception as e:
                     print(f"        Erro ao processar imagem: {e}")
+                    falhas += 1
                     continue
 
+            descarregar_lote()
+
+            atualizar_registros(collection, registros, [i for i in atualizadas if i in registros])
+
+            total_imagens += imagens_ok
+            total_falhas += falhas
+            total_duplicatas += duplicatas
+            tempo_total_gravacao += tempo_gravacao
+
+            if not imagens_lidas:
+                # registrado sem ids: PDFs sem mapas não são renderizados de novo a cada execução
+                print("    Nenhuma imagem encontrada — arquivo registrado sem imagens")
+                registrar_arquivo(manifesto, caminho_relativo, estado[caminho_relativo], [])
+                salvar_manifesto(db_folder, manifesto)
+                pdfs_sem_imagens += 1
+                continue
+
+            if falhas:
+                # imagens que não foram gravadas só voltam se o arquivo ficar fora do manifesto
+                print(f"     {falhas} imagem(ns) com erro — arquivo não registrado, será reprocessado")
+                pdfs_com_erro += 1
+                continue
+
+            registrar_arquivo(manifesto, caminho_relativo, estado[caminho_relativo], ids_arquivo)
+            salvar_manifesto(db_folder, manifesto)
+
             tempo_decorrido = (datetime.now() - inicio).total_seconds()
             print(f"     {imagens_ok} imagem(ns) processada(s) em {tempo_decorrido:.2f}s")
+            if imagens_ok:
+                print(f"     {tempo_decorrido / imagens_ok * 1000:.1f} ms/imagem "
+                      f"(gravação no Chroma: {tempo_gravacao / imagens_ok * 1000:.1f} ms/imagem, lotes de {tamanho_lote})")
+            if duplicatas:
+                print(f"     {duplicatas} imagem(ns) repetida(s) vinculada(s) a imagens já armazenadas")
 
             pdfs_processados += 1
 
         except Exception as e:
             print(f"    Erro ao processar PDF: {e}")
             pdfs_com_erro += 1
+            descartar_arquivo_com_erro(collection, armazem, indice, registros, caminho_relativo, lote)
+            if isinstance(e, BrokenProcessPool):
+                # um worker morreu: os próximos arquivos ganham um pool novo
+                executor.shutdown(wait=False)
+                executor = ProcessPoolExecutor(max_workers=num_workers)
             continue
 
+    if executor is not None:
+        executor.shutdown()
+
+    concluir_execucao(manifesto)
+    salvar_manifesto(db_folder, manifesto)
+
+    # índice de palavras-chave usado pelo agente de trilhas para achar os mapas; o
+    # marcador de versão avisa os agentes em execução que os metadados mudaram. Sem
+    # arquivos novos, alterados ou removidos, índice e marcador ficam como estão
+    houve_alteracao = reconstrucao or retomada or bool(pdfs) or bool(removidos)
+    indice_mapas = None
+    if houve_alteracao or not os.path.exists(caminho_indice(db_folder)):
+        marcador = marcar_nova_versao(db_folder)
+        indice_mapas = IndiceMapas.da_colecao(collection, versao=[collection.count(), marcador])
+        indice_mapas.salvar(caminho_indice(db_folder))
+
     tempo_total = (datetime.now() - inicio_geral).total_seconds()
 
     print("\n" + "=" * 60)
     print("RESUMO DO PROCESSAMENTO")
     print("=" * 60)
     print(f" PDFs processados: {pdfs_processados}")
+    print(f" PDFs inalterados (pulados): {len(inalterados)}")
+    print(f" PDFs removidos do índice: {len(removidos)}")
+    print(f" PDFs sem imagens: {pdfs_sem_imagens}")
     print(f" PDFs com erro: {pdfs_com_erro}")
     print(f" Total de imagens extraídas: {total_imagens}")
+    print(f" Imagens repetidas (não armazenadas de novo): {total_duplicatas}")
+    print(f" Imagens distintas no banco: {len(registros)}")
+    print(f" Imagens com erro: {total_falhas}")
+    if total_imagens:
+        print(f" Tempo por imagem: {tempo_total / total_imagens * 1000:.1f} ms "
+              f"(gravação: {tempo_total_gravacao / total_imagens * 1000:.1f} ms, lotes de {tamanho_lote})")
+    if indice_mapas is not None:
+        print(f" Índice de mapas: {len(indice_mapas)} imagem(ns) em {caminho_indice(db_folder)}")
+    else:
+        print(" Índice de mapas: coleção sem alterações, índice mantido")
+    if total_piramides:
+        print(f" Pirâmides de tiles: {total_piramides} ({tempo_total_tiles / total_piramides * 1000:.1f} ms/imagem)")
+    print(f" Armazém de imagens: {armazem.tamanho_total() / (1024 * 1024):.1f} MB em {armazem.pasta}")
     print(f" Tempo total: {tempo_total:.1f}s")
     print(f" Banco salvo em: {db_folder}")
-    print(f" Coleção: {COLLECTION_NAME}")
+    print(f" Coleção: {collection_name}")
     print("=" * 60)
 
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extrai as imagens e mapas dos PDFs de trilhas e indexa no ChromaDB."
+    )
+    parser.add_argument("--pdfs", help="pasta com os PDFs, incluindo subpastas (sem este argumento, abre a janela de seleção)")
+    parser.add_argument("--banco", default=db_folder, help="pasta do banco ChromaDB")
+    parser.add_argument("--colecao", default=COLLECTION_NAME, help="nome da coleção")
+    parser.add_argument("--dpi", type=int, default=DPI_RENDERIZACAO, help="resolução da renderização das páginas")
+    parser.add_argument("--paginas", help="páginas a processar, por exemplo 1-3,7 (padrão: todas)")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="processos para renderização")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_IMAGENS,
+                        help="imagens por upsert no Chroma (1 reproduz a gravação uma a uma)")
+    parser.add_argument("--sem-tiles", action="store_true",
+                        help="não gera a pirâmide de tiles das imagens novas")
+    parser.add_argument("--completo", action="store_true",
+                        help="refaz a coleção inteira em vez de indexar só o que mudou")
+    parser.add_argument("--reiniciar", action="store_true",
+                        help="ignora o checkpoint de uma execução interrompida")
+    args = parser.parse_args(argv)
+
+    pdf_folder = args.pdfs or selecionar_pasta_interativa()
+    if not pdf_folder:
+        parser.error("informe a pasta dos PDFs com --pdfs")
+
+    processar_pdfs(
+        pdf_folder,
+        db_folder=args.banco,
+        collection_name=args.colecao,
+        completo=args.completo or not MODO_INCREMENTAL,
+        reiniciar=args.reiniciar,
+        dpi=args.dpi,
+        paginas=interpretar_paginas(args.paginas),
+        num_workers=args.workers,
+        tamanho_lote=max(1, args.lote),
+        gerar_tiles=GERAR_TILES and not args.sem_tiles
+    )
+
+
 if __name__ == "__main__":
     try:
-        processar_pdfs()
+        main()
     except Exception as e:
         print(f"\nErro na execução: {e}")
         import traceback
         traceback.print_exc()
+        sys.exit(1)
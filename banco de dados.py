@@ -1,24 +1,62 @@
 import chromadb
 import pdfplumber
 import os
-import uuid
-import tkinter as tk
-from tkinter import filedialog, messagebox
+import math
+import sys
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from chromadb.utils import embedding_functions
-
-pdf_folder = filedialog.askdirectory(
-    title="Selecione a pasta com os arquivos PDF",
-    initialdir=os.path.expanduser("~")
+from manifesto_ingestao import (
+    carregar_manifesto, novo_manifesto, salvar_manifesto, identificar_arquivos,
+    registrar_arquivo, remover_registro, iniciar_execucao, execucao_interrompida,
+    concluir_execucao
 )
+from deduplicacao import IndiceMinHash
+from busca_hibrida import IndiceBM25, caminho_indice_bm25
+from cache_colecao import marcar_nova_versao
 
 db_folder = os.path.join(os.path.dirname(__file__), "Banco de dados")
 COLLECTION_NAME = "PlanoManejo_Tijuca"
-CHUNK_SIZE = 1000
-OVERLAP = 200
+CHUNK_TOKENS = 160
+OVERLAP_TOKENS = 32
+
+# extração paralela: 1 worker = modo sequencial, sem pool de processos
+NUM_WORKERS = os.cpu_count() or 1
+PAGINAS_POR_TAREFA = 8
+
+# mesmo modelo usado pelos agentes na consulta; os vetores são calculados aqui em lotes
+# fixos e gravados prontos no Chroma, em upserts de tamanho limitado
+MODELO_EMBEDDING = "all-MiniLM-L6-v2"
+TAMANHO_LOTE_EMBEDDING = 32
+TAMANHO_LOTE_UPSERT = 256
+
+# chunks quase idênticos (cabeçalhos, texto legal, tabelas repetidas) são descartados
+# na ingestão; as assinaturas MinHash ficam salvas ao lado do banco
+DEDUPLICAR = True
+NOME_INDICE_DUPLICATAS = "indice_minhash.npz"
+
+# incremental: só extrai/indexa PDFs novos ou alterados (via manifesto de hashes);
+# False refaz a coleção inteira (equivale a --completo)
+MODO_INCREMENTAL = True
+
+
+def selecionar_pasta_interativa():
+    # só usado sem --pdfs; o tkinter fica fora do import para rodar em servidores sem interface
+    try:
+        from tkinter import filedialog
+        return filedialog.askdirectory(
+            title="Selecione a pasta com os arquivos PDF",
+            initialdir=os.path.expanduser("~")
+        )
+    except Exception as e:
+        print(f"Não foi possível abrir a janela de seleção: {e}")
+        return None
 
 
-def validar_ambiente():
+def validar_ambiente(pdf_folder):
     if not os.path.exists(pdf_folder):
         raise FileNotFoundError(f"Pasta não encontrada: {pdf_folder}")
 
@@ -30,55 +68,193 @@ def validar_ambiente():
     return pdfs
 
 
-def extrair_texto_pdf(caminho_pdf):
-    texto = ""
+def _contar_paginas(caminho_pdf):
+    # None indica que o PDF não abriu: é diferente de um PDF lido sem páginas
     try:
         with pdfplumber.open(caminho_pdf) as pdf:
-            print(f"Processando {len(pdf.pages)} páginas...")
-            for i, page in enumerate(pdf.pages, 1):
-                try:
-                    t = page.extract_text()
-                    if t:
-                        texto += t + "\n"
+            return len(pdf.pages)
+    except Exception as e:
+        print(f"Erro ao abrir PDF {os.path.basename(caminho_pdf)}: {e}")
+        return None
+
+
+def _extrair_intervalo_paginas(caminho_pdf, inicio, fim):
+    # roda dentro dos workers: devolve [(numero_pagina, texto), ...] do intervalo [inicio, fim),
+    # com texto None nas páginas que deram erro.
+    # Se o PDF não abrir, a exceção sobe até processar_pdfs, que não registra o arquivo:
+    # um PDF ilegível não pode entrar no manifesto como "sem texto"
+    paginas = []
+    with pdfplumber.open(caminho_pdf) as pdf:
+        for i in range(inicio, fim):
+            try:
+                t = pdf.pages[i].extract_text()
+            except Exception as e:
+                print(f"Erro na página {i + 1}: {e}")
+                paginas.append((i + 1, None))
+                continue
+            paginas.append((i + 1, t or ""))
+
+    return paginas
+
+
+def extrair_paginas_pdfs(caminhos_pdf, num_workers=NUM_WORKERS, paginas_por_tarefa=PAGINAS_POR_TAREFA):
+    # gera (caminho_pdf, total_paginas, paginas, tempos) na ordem dos arquivos (total_paginas
+    # None = o PDF não abriu e paginas não deve ser consumido), onde paginas é
+    # um iterador de (numero_pagina, texto) e tempos["extracao"] acumula o tempo de parede
+    # que o chamador passou esperando o texto das páginas já consumidas. Com num_workers > 1,
+    # arquivos e intervalos de páginas são distribuídos num pool de processos, com poucas
+    # tarefas adiantadas para manter a memória limitada; o que os workers adiantam enquanto
+    # o chamador calcula embeddings não conta como espera, então o ganho do pool aparece aqui.
+    # tempos["paginas_com_erro"] conta as páginas cujo texto não pôde ser extraído.
+    def entregar(paginas, tempos):
+        for numero_pagina, texto in paginas:
+            if texto is None:
+                tempos["paginas_com_erro"] += 1
+            yield numero_pagina, texto or ""
+
+    if num_workers <= 1:
+        def paginas_sequenciais(caminho_pdf, total, tempos):
+            for inicio in range(0, total or 0, paginas_por_tarefa):
+                inicio_espera = time.perf_counter()
+                paginas = _extrair_intervalo_paginas(
+                    caminho_pdf, inicio, min(inicio + paginas_por_tarefa, total)
+                )
+                tempos["extracao"] += time.perf_counter() - inicio_espera
+                yield from entregar(paginas, tempos)
+
+        for caminho_pdf in caminhos_pdf:
+            total = _contar_paginas(caminho_pdf)
+            tempos = {"extracao": 0.0, "paginas_com_erro": 0}
+            yield caminho_pdf, total, paginas_sequenciais(caminho_pdf, total, tempos), tempos
+        return
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        totais = list(executor.map(_contar_paginas, caminhos_pdf))
+
+        tarefas = deque(
+            (caminho_pdf, inicio, min(inicio + paginas_por_tarefa, total))
+            for caminho_pdf, total in zip(caminhos_pdf, totais)
+            for inicio in range(0, total or 0, paginas_por_tarefa)
+        )
+        pendentes = deque()
+        limite_pendentes = num_workers * 2
+
+        def abastecer():
+            while tarefas and len(pendentes) < limite_pendentes:
+                pendentes.append(executor.submit(_extrair_intervalo_paginas, *tarefas.popleft()))
+
+        def paginas_do_arquivo(total, tempos):
+            for _ in range(math.ceil((total or 0) / paginas_por_tarefa)):
+                inicio_espera = time.perf_counter()
+                abastecer()
+                paginas = pendentes.popleft().result()
+                tempos["extracao"] += time.perf_counter() - inicio_espera
+                yield from entregar(paginas, tempos)
+
+        for caminho_pdf, total in zip(caminhos_pdf, totais):
+            tempos = {"extracao": 0.0, "paginas_com_erro": 0}
+            paginas = paginas_do_arquivo(total, tempos)
+            yield caminho_pdf, total, paginas, tempos
+
+            # garante que as tarefas do arquivo sejam consumidas mesmo se o chamador parar antes;
+            # um erro aqui já fez o chamador contar o arquivo como falha
+            try:
+                for _ in paginas:
+                    pass
+            except Exception:
+                pass
+
+
+def validar_tamanho_chunk(chunk_tokens, overlap_tokens):
+    # com overlap >= tamanho a janela nunca anda: cada token novo geraria um chunk
+    if not 0 <= overlap_tokens < chunk_tokens:
+        raise ValueError("overlap_tokens deve ser >= 0 e menor que chunk_tokens")
+
+
+def gerar_chunks_paginados(paginas, chunk_tokens=CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    # consome (numero_pagina, texto) à medida que as páginas são extraídas e gera
+    # (texto_chunk, pagina_inicial, pagina_final). Tamanho e overlap contam tokens
+    # separados por espaço; só a janela do chunk atual fica em memória. Os parâmetros são
+    # conferidos na chamada, não quando a primeira página chega
+    validar_tamanho_chunk(chunk_tokens, overlap_tokens)
+    return _gerar_chunks_paginados(paginas, chunk_tokens, overlap_tokens)
+
+
+def _gerar_chunks_paginados(paginas, chunk_tokens, overlap_tokens):
+    janela = deque()
+    tokens_novos = 0
+
+    def montar_chunk():
+        return " ".join(token for token, _ in janela), janela[0][1], janela[-1][1]
+
+    for numero_pagina, texto in paginas:
+        if not texto:
+            continue
 
-                    if i % 10 == 0:
-                        print(f"  → Página {i}/{len(pdf.pages)}")
+        for token in texto.split():
+            janela.append((token, numero_pagina))
+            tokens_novos += 1
 
-                except Exception as e:
-                    print(f"Erro na página {i}: {e}")
-                    continue
+            if len(janela) >= chunk_tokens:
+                yield montar_chunk()
+                for _ in range(chunk_tokens - overlap_tokens):
+                    janela.popleft()
+                tokens_novos = 0
+
+    if tokens_novos:
+        yield montar_chunk()
 
-    except Exception as e:
-        print(f"Erro ao abrir PDF: {e}")
-        return ""
 
-    return texto
+def carregar_funcao_embedding():
+    return embedding_functions.SentenceTransformerEmbeddingFunction(
+        model_name=MODELO_EMBEDDING,
+        device="cpu",
+        normalize_embeddings=True
+    )
 
 
-def criar_chunks_com_overlap(texto, chunk_size=CHUNK_SIZE, overlap=OVERLAP):
-    if not texto or not texto.strip():
-        return []
+def gravar_chunks_em_lotes(collection, funcao_embedding, itens,
+                           tamanho_lote_upsert=TAMANHO_LOTE_UPSERT,
+                           tamanho_lote_embedding=TAMANHO_LOTE_EMBEDDING):
+    # itens: iterável de (id, documento, metadata). Só um lote de upsert fica em memória
+    # por vez, então o consumo não cresce com o tamanho do PDF.
+    # Devolve (total_gravado, segundos_embedding, segundos_upsert).
+    total = 0
+    tempo_embedding = 0.0
+    tempo_upsert = 0.0
+    lote = []
 
-    texto = ' '.join(texto.split())
-    chunks = []
-    inicio = 0
+    def gravar_lote():
+        nonlocal total, tempo_embedding, tempo_upsert
+        documentos = [documento for _, documento, _ in lote]
 
-    while inicio < len(texto):
-        fim = inicio + chunk_size
+        inicio = time.perf_counter()
+        vetores = []
+        for i in range(0, len(documentos), tamanho_lote_embedding):
+            vetores.extend(funcao_embedding(documentos[i:i + tamanho_lote_embedding]))
+        tempo_embedding += time.perf_counter() - inicio
 
-        if fim < len(texto):
-            ultimo_espaco = texto.rfind(' ', inicio, fim)
-            if ultimo_espaco > inicio:
-                fim = ultimo_espaco
+        inicio = time.perf_counter()
+        collection.upsert(
+            ids=[id_chunk for id_chunk, _, _ in lote],
+            embeddings=vetores,
+            documents=documentos,
+            metadatas=[metadata for _, _, metadata in lote]
+        )
+        tempo_upsert += time.perf_counter() - inicio
 
-        chunk = texto[inicio:fim].strip()
+        total += len(lote)
+        lote.clear()
 
-        if chunk:
-            chunks.append(chunk)
+    for item in itens:
+        lote.append(item)
+        if len(lote) >= tamanho_lote_upsert:
+            gravar_lote()
 
-        inicio = fim - overlap if fim < len(texto) else fim
+    if lote:
+        gravar_lote()
 
-    return chunks
+    return total, tempo_embedding, tempo_upsert
 
 
 def limpar_colecao_existente(collection):
@@ -91,82 +267,287 @@ def limpar_colecao_existente(collection):
         print(f"Aviso ao limpar coleção: {e}\n")
 
 
-def processar_pdfs():
-    pdfs = validar_ambiente()
+def parametros_ingestao(collection_name=COLLECTION_NAME):
+    # qualquer mudança aqui invalida o manifesto e força a reconstrução completa; parâmetros
+    # inválidos param a ingestão antes de a coleção ser tocada, e não arquivo por arquivo
+    validar_tamanho_chunk(CHUNK_TOKENS, OVERLAP_TOKENS)
+    parametros = {"colecao": collection_name, "chunk_tokens": CHUNK_TOKENS, "overlap_tokens": OVERLAP_TOKENS, "versao_ids": 2}
+    if DEDUPLICAR:
+        parametros["deduplicacao"] = IndiceMinHash().parametros()
+    return parametros
+
+
+def gerar_id_chunk(hash_arquivo, indice):
+    return f"{hash_arquivo[:16]}-{indice}"
+
+
+def remover_chunks_arquivo(collection, nome_arquivo, ids):
+    # ids do manifesto + filtro por arquivo, para limpar também chunks de versões antigas
+    if ids:
+        collection.delete(ids=ids)
+    collection.delete(where={"arquivo": nome_arquivo})
+
+
+def processar_pdfs(pdf_folder, db_folder=db_folder, collection_name=COLLECTION_NAME,
+                   num_workers=NUM_WORKERS, completo=not MODO_INCREMENTAL, reiniciar=False):
+    pdfs = validar_ambiente(pdf_folder)
     os.makedirs(db_folder, exist_ok=True)
 
     print("Inicializando ChromaDB...")
     client = chromadb.PersistentClient(path=db_folder)
-    collection = client.get_or_create_collection(name=COLLECTION_NAME)
-
-    limpar_colecao_existente(collection)
+    collection = client.get_or_create_collection(name=collection_name)
+
+    print(f"Carregando modelo de embeddings ({MODELO_EMBEDDING})...")
+    funcao_embedding = carregar_funcao_embedding()
+
+    parametros = parametros_ingestao(collection_name)
+    manifesto, compativel = carregar_manifesto(db_folder, parametros)
+    reconstrucao = False
+    retomada = False
+
+    if compativel and execucao_interrompida(manifesto) and not reiniciar:
+        # a execução anterior pode ter gravado na coleção sem chegar a refazer os índices
+        retomada = True
+        print(f"Retomando execução interrompida (iniciada em {manifesto['execucao']['inicio']})")
+    elif completo or not compativel:
+        if not completo:
+            print("Manifesto ausente ou com outros parâmetros — reconstrução completa")
+        if DEDUPLICAR:
+            # o índice vazio vai para o disco antes de a coleção ser apagada: uma reconstrução
+            # interrompida e retomada não pode carregar as assinaturas dos chunks apagados
+            IndiceMinHash().salvar(os.path.join(db_folder, NOME_INDICE_DUPLICATAS))
+        limpar_colecao_existente(collection)
+        manifesto = novo_manifesto(parametros)
+        reconstrucao = True
+        iniciar_execucao(manifesto, completa=True)
+    else:
+        iniciar_execucao(manifesto, completa=False)
+    salvar_manifesto(db_folder, manifesto)
+
+    estado, novos, alterados, inalterados, removidos = identificar_arquivos(
+        manifesto,
+        {nome_arquivo: os.path.join(pdf_folder, nome_arquivo) for nome_arquivo in pdfs}
+    )
+
+    caminho_indice_duplicatas = os.path.join(db_folder, NOME_INDICE_DUPLICATAS)
+    indice_duplicatas = None
+    if DEDUPLICAR:
+        # numa reconstrução o arquivo já foi zerado acima: as assinaturas antigas apontariam
+        # para chunks que não existem mais e descartariam conteúdo novo como duplicata
+        indice_duplicatas = IndiceMinHash.carregar(caminho_indice_duplicatas)
+
+    if indice_duplicatas is not None:
+        # quem teve chunks descartados por repetirem um arquivo que mudou ou saiu
+        # precisa ser reprocessado, senão aquele conteúdo some do índice
+        afetados = set(alterados) | set(removidos)
+        for nome_arquivo in list(inalterados):
+            if afetados & set(manifesto["arquivos"][nome_arquivo].get("duplicatas_de", [])):
+                inalterados.remove(nome_arquivo)
+                alterados.append(nome_arquivo)
+
+        for nome_arquivo in novos + alterados + removidos:
+            indice_duplicatas.remover_arquivo(nome_arquivo)
+
+    print(f"Novos: {len(novos)} | Alterados: {len(alterados)} | "
+          f"Inalterados: {len(inalterados)} | Removidos: {len(removidos)}\n")
+
+    for nome_arquivo in removidos:
+        remover_chunks_arquivo(collection, nome_arquivo, remover_registro(manifesto, nome_arquivo))
+        salvar_manifesto(db_folder, manifesto)
+        print(f"Chunks de '{nome_arquivo}' removidos (arquivo não existe mais)")
+
+    pdfs = [nome_arquivo for nome_arquivo in pdfs if nome_arquivo in novos or nome_arquivo in alterados]
 
     total_chunks = 0
+    total_duplicatas = 0
     pdfs_processados = 0
     pdfs_com_erro = 0
+    pdfs_sem_texto = 0
+
+    total_paginas = 0
+    tempo_total_extracao = 0.0
+    tempo_total_embedding = 0.0
 
     inicio_geral = datetime.now()
 
-    for idx, nome_arquivo in enumerate(pdfs, 1):
+    caminhos = [os.path.join(pdf_folder, nome_arquivo) for nome_arquivo in pdfs]
+    print(f"Extraindo texto com {num_workers} worker(s)...")
+    extracao = extrair_paginas_pdfs(caminhos, num_workers=num_workers)
+
+    for idx, (nome_arquivo, (caminho_pdf, num_paginas, paginas, tempos)) in enumerate(zip(pdfs, extracao), 1):
         print(f"\n[{idx}/{len(pdfs)}]  {nome_arquivo}")
-        caminho_pdf = os.path.join(pdf_folder, nome_arquivo)
 
         try:
             inicio = datetime.now()
-            texto = extrair_texto_pdf(caminho_pdf)
+            if num_paginas is None:
+                raise OSError("não foi possível abrir o PDF")
+            print(f"Processando {num_paginas} páginas...")
+
+            hash_arquivo = estado[nome_arquivo]["hash"]
+            ids = []
+            duplicatas = 0
+            duplicatas_de = set()
+
+            # também para arquivos novos: limpa o que uma execução interrompida deixou gravado pela metade
+            ids_antigos = manifesto["arquivos"].get(nome_arquivo, {}).get("ids", [])
+            remover_chunks_arquivo(collection, nome_arquivo, ids_antigos)
+
+            data_processamento = datetime.now().isoformat()
+
+            def itens_do_arquivo():
+                nonlocal duplicatas
+                chunks = gerar_chunks_paginados(paginas)
+                for i, (chunk, pagina_inicial, pagina_final) in enumerate(chunks):
+                    id_chunk = gerar_id_chunk(hash_arquivo, i)
+
+                    if indice_duplicatas is not None:
+                        assinatura = indice_duplicatas.calcular_assinatura(chunk)
+                        original = indice_duplicatas.buscar_duplicata(assinatura)
+                        if original is not None:
+                            duplicatas += 1
+                            duplicatas_de.add(indice_duplicatas.arquivos[original])
+                            continue
+                        indice_duplicatas.adicionar(id_chunk, assinatura, nome_arquivo)
+
+                    ids.append(id_chunk)
+                    yield id_chunk, chunk, {
+                        "arquivo": nome_arquivo,
+                        "parte": i + 1,
+                        "pagina": pagina_inicial,
+                        "pagina_final": pagina_final,
+                        "total_paginas": num_paginas,
+                        "data_processamento": data_processamento
+                    }
 
-            if not texto.strip():
-                print("Nenhum texto extraído — pulando arquivo")
-                pdfs_com_erro += 1
+            gravados, tempo_embedding, tempo_upsert = gravar_chunks_em_lotes(
+                collection, funcao_embedding, itens_do_arquivo()
+            )
+
+            total_paginas += num_paginas
+            tempo_total_extracao += tempos["extracao"]
+            if num_paginas and tempos["extracao"] > 0:
+                print(f"  → extração: {num_paginas / tempos['extracao']:.1f} páginas/s "
+                      f"({tempos['extracao']:.1f}s de espera, {num_workers} worker(s))")
+
+            if not gravados and not duplicatas:
+                # só um PDF lido por inteiro e sem texto é registrado; com páginas que falharam
+                # ele fica fora do manifesto e é tentado de novo na próxima execução
+                if tempos["paginas_com_erro"]:
+                    raise OSError(f"{tempos['paginas_com_erro']} página(s) sem leitura e nenhum texto extraído")
+                # registrado sem ids: PDFs só com imagens escaneadas não são relidos a cada execução
+                print("Nenhum texto extraído — arquivo registrado sem chunks")
+                registrar_arquivo(manifesto, nome_arquivo, estado[nome_arquivo], [])
+                salvar_manifesto(db_folder, manifesto)
+                pdfs_sem_texto += 1
                 continue
 
-            chunks = criar_chunks_com_overlap(texto)
+            tempo_total_embedding += tempo_embedding + tempo_upsert
+            print(f"  → {gravados / max(tempo_embedding + tempo_upsert, 1e-6):.1f} chunks/s "
+                  f"(embedding {tempo_embedding:.1f}s, gravação {tempo_upsert:.1f}s)")
 
-            if not chunks:
-                print("Nenhum chunk criado — pulando arquivo")
-                pdfs_com_erro += 1
-                continue
+            if duplicatas:
+                print(f"  → {duplicatas} chunk(s) quase duplicado(s) descartado(s)")
 
-            collection.add(
-                ids=[str(uuid.uuid4()) for _ in chunks],
-                documents=chunks,
-                metadatas=[
-                    {
-                        "arquivo": nome_arquivo,
-                        "parte": i + 1,
-                        "total_partes": len(chunks),
-                        "tamanho_original": len(texto),
-                        "data_processamento": datetime.now().isoformat()
-                    }
-                    for i in range(len(chunks))
-                ]
+            if indice_duplicatas is not None:
+                indice_duplicatas.salvar(caminho_indice_duplicatas)
+            registrar_arquivo(
+                manifesto, nome_arquivo, estado[nome_arquivo], ids,
+                duplicatas_removidas=duplicatas,
+                duplicatas_de=sorted(duplicatas_de - {nome_arquivo})
             )
+            salvar_manifesto(db_folder, manifesto)
 
             tempo_decorrido = (datetime.now() - inicio).total_seconds()
-            print(f"{len(chunks)} chunks criados em {tempo_decorrido:.1f}s")
+            print(f"{gravados} chunks criados em {tempo_decorrido:.1f}s")
 
-            total_chunks += len(chunks)
+            total_chunks += gravados
+            total_duplicatas += duplicatas
             pdfs_processados += 1
 
         except Exception as e:
             print(f"Erro ao processar: {e}")
+            # as assinaturas do arquivo entraram no índice antes da gravação; sem tirá-las,
+            # os próximos arquivos descartariam como duplicata um conteúdo que não foi salvo
+            if indice_duplicatas is not None:
+                indice_duplicatas.remover_arquivo(nome_arquivo)
             pdfs_com_erro += 1
             continue
 
+    if indice_duplicatas is not None:
+        indice_duplicatas.salvar(caminho_indice_duplicatas)
+    concluir_execucao(manifesto)
+    salvar_manifesto(db_folder, manifesto)
+
+    # índice lexical (BM25) usado pelos agentes junto com a busca vetorial. Uma execução
+    # que não tocou na coleção mantém o índice e o marcador: trocar o marcador invalidaria
+    # todos os caches dos agentes sem motivo
+    inicio_bm25 = time.perf_counter()
+    houve_alteracao = reconstrucao or retomada or bool(pdfs) or bool(removidos)
+    indice_bm25 = None
+    if houve_alteracao or not os.path.exists(caminho_indice_bm25(db_folder)):
+        marcador = marcar_nova_versao(db_folder)
+        indice_bm25 = IndiceBM25.da_colecao(collection, versao=[collection.count(), marcador])
+        indice_bm25.salvar(caminho_indice_bm25(db_folder))
+    tempo_bm25 = time.perf_counter() - inicio_bm25
+
     tempo_total = (datetime.now() - inicio_geral).total_seconds()
 
     print("\nRESUMO DO PROCESSAMENTO")
     print(f"PDFs processados com sucesso: {pdfs_processados}")
+    print(f"PDFs inalterados (pulados): {len(inalterados)}")
+    print(f"PDFs removidos do índice: {len(removidos)}")
+    print(f"PDFs sem texto extraível: {pdfs_sem_texto}")
     print(f"PDFs com erro: {pdfs_com_erro}")
     print(f"Total de chunks criados: {total_chunks}")
+    if indice_duplicatas is not None:
+        print(f"Chunks quase duplicados descartados: {total_duplicatas}")
+    print(f"Total de páginas lidas: {total_paginas}")
+    if indice_bm25 is not None:
+        print(f"Índice BM25: {len(indice_bm25)} chunks em {tempo_bm25:.1f}s")
+    else:
+        print("Índice BM25: coleção sem alterações, índice mantido")
+    if tempo_total_embedding > 0:
+        print(f"Vazão de indexação: {total_chunks / tempo_total_embedding:.1f} chunks/s")
+    if tempo_total_extracao > 0:
+        print(f"Vazão de extração: {total_paginas / tempo_total_extracao:.1f} páginas/s "
+              f"em {tempo_total_extracao:.1f}s de espera ({num_workers} worker(s))")
     print(f"Tempo total: {tempo_total:.1f}s")
     print(f"Banco salvo em: {db_folder}")
 
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extrai o texto dos PDFs do plano de manejo e indexa no ChromaDB."
+    )
+    parser.add_argument("--pdfs", help="pasta com os PDFs (sem este argumento, abre a janela de seleção)")
+    parser.add_argument("--banco", default=db_folder, help="pasta do banco ChromaDB")
+    parser.add_argument("--colecao", default=COLLECTION_NAME, help="nome da coleção")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="processos para extração de texto")
+    parser.add_argument("--completo", action="store_true",
+                        help="refaz a coleção inteira em vez de indexar só o que mudou")
+    parser.add_argument("--reiniciar", action="store_true",
+                        help="ignora o checkpoint de uma execução interrompida")
+    args = parser.parse_args(argv)
+
+    pdf_folder = args.pdfs or selecionar_pasta_interativa()
+    if not pdf_folder:
+        parser.error("informe a pasta dos PDFs com --pdfs")
+
+    processar_pdfs(
+        pdf_folder,
+        db_folder=args.banco,
+        collection_name=args.colecao,
+        num_workers=args.workers,
+        completo=args.completo or not MODO_INCREMENTAL,
+        reiniciar=args.reiniciar
+    )
+
+
 if __name__ == "__main__":
     try:
-        processar_pdfs()
+        main()
     except Exception as e:
         print(f"\nErro na leitura: {e}")
         import traceback
         traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from types import SimpleNamespace
+from indice_memmap import IndiceMemmap, RetrieverMemmap, ARQUIVO_VETORES, exportar_colecao
+from cache_colecao import versao_colecao
+
+# Compara a busca vetorial do Chroma com o RetrieverMemmap usado pelos agentes: tempo de
+# partida a frio (abrir o banco/índice + primeira consulta, num processo novo),
+# latência por consulta, vazão em lote e quantos dos k vizinhos exatos o HNSW devolve.
+# As consultas são vetores da própria coleção com ruído, então o modelo de embeddings
+# não entra na medida (é o mesmo custo nos dois lados): o retriever recebe um
+# "modelo" que devolve o próprio vetor da consulta. O índice é exportado numa pasta
+# temporária: o benchmark não troca nem converte o índice que os agentes estão usando.
+
+DB_FOLDER_PADRAO = r"C:\chroma\banco"
+COLECAO_PADRAO = "PlanoManejo_Tijuca"
+
+
+class VetorComoEmbedding:
+    def embed_query(self, vetor):
+        return vetor
+
+    def embed_documents(self, vetores):
+        return vetores
+
+
+def criar_retriever(collection, banco, k, pasta):
+    # mesmo caminho dos agentes: conferência de versão da coleção + busca + Documents
+    return RetrieverMemmap(vectorstore=SimpleNamespace(_collection=collection),
+                           embeddings=VetorComoEmbedding(), db_folder=banco, k=k, pasta_indice=pasta)
+
+
+def gerar_consultas(indice, quantidade, semente=0):
+    rng = np.random.default_rng(semente)
+    base = np.asarray(indice.vetores[rng.integers(0, len(indice), quantidade)], dtype=np.float32)
+    consultas = base + rng.normal(scale=0.05, size=base.shape).astype(np.float32)
+    return consultas / np.linalg.norm(consultas, axis=1, keepdims=True)
+
+
+def partida_fria(backend, banco, colecao, k, pasta):
+    # roda num processo filho: importa, abre e responde a primeira consulta
+    inicio = time.perf_counter()
+    import chromadb
+    collection = chromadb.PersistentClient(path=banco).get_collection(colecao)
+    if backend == "chroma":
+        dimensao = len(collection.get(limit=1, include=["embeddings"])["embeddings"][0])
+        collection.query(query_embeddings=[[1.0] * dimensao], n_results=k)
+    else:
+        # o cliente do Chroma também é aberto aqui: o retriever confere a versão da coleção
+        dimensao = np.load(os.path.join(pasta, ARQUIVO_VETORES), mmap_mode="r").shape[1]
+        criar_retriever(collection, banco, k, pasta).buscar_documentos(np.ones(dimensao, dtype=np.float32), k)
+    print(json.dumps({"segundos": time.perf_counter() - inicio}))
+
+
+def medir_partida_fria(backend, banco, colecao, k, repeticoes, pasta):
+    tempos = []
+    for _ in range(repeticoes):
+        saida = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--partida-fria", backend,
+             "--banco", banco, "--colecao", colecao, "--k", str(k), "--pasta-indice", pasta],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if saida.returncode != 0:
+            print(saida.stderr)
+            return None
+        tempos.append(json.loads(saida.stdout.strip().splitlines()[-1])["segundos"])
+    return float(np.median(tempos))
+
+
+def latencias_ms(funcao, consultas):
+    tempos = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        funcao(consulta)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return np.asarray(tempos)
+
+
+def comparar(banco, colecao, k, num_consultas, repeticoes, float16):
+    pasta_temporaria = tempfile.mkdtemp(prefix="benchmark_memmap_")
+    try:
+        _comparar(banco, colecao, k, num_consultas, repeticoes, float16, os.path.join(pasta_temporaria, "indice"))
+    finally:
+        shutil.rmtree(pasta_temporaria, ignore_errors=True)
+
+
+def _comparar(banco, colecao, k, num_consultas, repeticoes, float16, pasta):
+    import chromadb
+    collection = chromadb.PersistentClient(path=banco).get_collection(colecao)
+
+    inicio = time.perf_counter()
+    total = exportar_colecao(collection, pasta, versao_colecao(collection, banco), "float16" if float16 else "float32")
+    print(f"Exportação: {total} vetores em {time.perf_counter() - inicio:.2f}s "
+          f"({'float16' if float16 else 'float32'})")
+
+    indice = IndiceMemmap.carregar(pasta)
+    consultas = gerar_consultas(indice, num_consultas)
+    retriever = criar_retriever(collection, banco, k, pasta)
+
+    def buscar_chroma(consulta):
+        return collection.query(query_embeddings=[consulta.tolist()], n_results=k, include=["documents", "metadatas"])
+
+    def buscar_memmap(consulta):
+        return retriever.buscar_documentos(consulta, k)
+
+    # aquecimento: a primeira consulta de cada lado paga o carregamento
+    buscar_chroma(consultas[0])
+    buscar_memmap(consultas[0])
+
+    tempos_chroma = latencias_ms(buscar_chroma, consultas)
+    tempos_memmap = latencias_ms(buscar_memmap, consultas)
+
+    inicio = time.perf_counter()
+    retriever.buscar_lote(consultas, k)
+    tempo_lote = time.perf_counter() - inicio
+
+    acertos = 0
+    for consulta, exatos in zip(consultas, indice.buscar_vetores(consultas, k)):
+        ids_chroma = set(buscar_chroma(consulta)["ids"][0])
+        acertos += len(ids_chroma & {indice.ids[posicao] for posicao, _ in exatos})
+    revocacao = acertos / (len(consultas) * min(k, total)) if total else 0.0
+
+    fria_chroma = medir_partida_fria("chroma", banco, colecao, k, repeticoes, pasta)
+    fria_memmap = medir_partida_fria("memmap", banco, colecao, k, repeticoes, pasta)
+
+    print(f"\n{'backend':<10}{'fria (s)':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'consultas/s':>13}")
+    print(f"{'chroma':<10}{fria_chroma or float('nan'):>10.3f}{np.percentile(tempos_chroma, 50):>10.3f}"
+          f"{np.percentile(tempos_chroma, 95):>10.3f}{1000 / tempos_chroma.mean():>13.0f}")
+    print(f"{'memmap':<10}{fria_memmap or float('nan'):>10.3f}{np.percentile(tempos_memmap, 50):>10.3f}"
+          f"{np.percentile(tempos_memmap, 95):>10.3f}{1000 / tempos_memmap.mean():>13.0f}")
+    print(f"\nmemmap em lote: {len(consultas) / tempo_lote:.0f} consultas/s ({len(consultas)} de uma vez)")
+    print(f"Revocação do Chroma (HNSW) contra a busca exata, top-{k}: {revocacao:.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compara a busca do Chroma com a busca exata no índice memmap."
+    )
+    parser.add_argument("--banco", default=DB_FOLDER_PADRAO, help="pasta do banco ChromaDB")
+    parser.add_argument("--colecao", default=COLECAO_PADRAO, help="nome da coleção")
+    parser.add_argument("--k", type=int, default=5, help="documentos por consulta")
+    parser.add_argument("--consultas", type=int, default=200, help="consultas medidas")
+    parser.add_argument("--repeticoes", type=int, default=3, help="partidas a frio por backend")
+    parser.add_argument("--float16", action="store_true", help="exporta os vetores em float16")
+    parser.add_argument("--partida-fria", help=argparse.SUPPRESS)
+    parser.add_argument("--pasta-indice", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.partida_fria:
+        partida_fria(args.partida_fria, args.banco, args.colecao, args.k, args.pasta_indice)
+        return
+
+    comparar(args.banco, args.colecao, args.k, args.consultas, args.repeticoes, args.float16)
+
+
+if __name__ == "__main__":
+    main()
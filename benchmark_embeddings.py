@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+
+# Compara os backends de embeddings (ver recursos_compartilhados.criar_modelo_embeddings):
+# tempo de carga, latência por pergunta, vazão em lote e memória residente de pico.
+# Cada backend roda num processo separado para a memória de um não contaminar a do outro.
+# Também confere se os vetores continuam compatíveis com o índice gerado pelo backend de
+# referência: o cosseno mínimo entre os dois tem que ficar acima da tolerância.
+
+BACKENDS_PADRAO = ["pytorch", "onnx_int8"]
+BACKEND_REFERENCIA = "pytorch"
+TOLERANCIA_COSSENO = 0.99
+
+PERGUNTAS = [
+    "Quais trilhas existem no parque?",
+    "Qual a distância da trilha do Pico da Tijuca?",
+    "Como chegar na Cachoeira dos Primatas?",
+    "Qual o horário de funcionamento do parque?",
+    "É permitido levar animais de estimação?",
+    "Onde fica o Centro de Visitantes?",
+    "Quais espécies de aves podem ser vistas na Floresta da Tijuca?",
+    "Qual o nível de dificuldade da trilha da Pedra Bonita?",
+    "Existe estacionamento perto da Vista Chinesa?",
+    "O que diz o plano de manejo sobre o uso público?",
+    "Posso acampar dentro do parque?",
+    "Qual a história do reflorestamento feito pelo Major Archer?",
+]
+
+TRECHOS = [
+    "O Parque Nacional da Tijuca é uma unidade de conservação de proteção integral "
+    "localizada no município do Rio de Janeiro, com cerca de 3.953 hectares.",
+    "A trilha do Pico da Tijuca tem aproximadamente 3,5 km de extensão e nível de "
+    "dificuldade moderado, com trechos de escadaria esculpida na rocha.",
+    "O zoneamento do plano de manejo define zonas de uso intensivo, uso extensivo, "
+    "recuperação, primitiva e histórico-cultural, cada uma com normas próprias.",
+    "O reflorestamento iniciado em 1861 pelo Major Manuel Gomes Archer recuperou as "
+    "nascentes que abasteciam a cidade, devastadas pelas plantações de café.",
+    "A visitação é permitida das 8h às 17h e o acesso de veículos é controlado nas "
+    "portarias da Floresta da Tijuca, Paineiras e Pedra Bonita.",
+    "Entre as espécies da fauna registradas no parque estão o macaco-prego, o "
+    "bugio, a preguiça-de-três-dedos e mais de 200 espécies de aves.",
+]
+
+
+def memoria_pico_mb():
+    # RSS de pico do processo atual; resource não existe no Windows, onde psutil é a alternativa
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+
+def medir_backend(backend, repeticoes, tamanho_lote, saida):
+    # roda dentro do processo filho e grava as medidas em JSON e os vetores em .npy
+    from recursos_compartilhados import criar_modelo_embeddings
+
+    inicio = time.perf_counter()
+    modelo, _ = criar_modelo_embeddings(backend)
+    modelo.embed_query(PERGUNTAS[0])
+    tempo_carga = time.perf_counter() - inicio
+
+    latencias = []
+    for _ in range(repeticoes):
+        for pergunta in PERGUNTAS:
+            inicio = time.perf_counter()
+            modelo.embed_query(pergunta)
+            latencias.append(time.perf_counter() - inicio)
+
+    lote = (TRECHOS * (tamanho_lote // len(TRECHOS) + 1))[:tamanho_lote]
+    inicio = time.perf_counter()
+    modelo.embed_documents(lote)
+    tempo_lote = time.perf_counter() - inicio
+
+    vetores = np.asarray(
+        [modelo.embed_query(p) for p in PERGUNTAS] + modelo.embed_documents(TRECHOS),
+        dtype=np.float32
+    )
+    np.save(saida + ".npy", vetores)
+
+    latencias_ms = np.asarray(latencias) * 1000
+    with open(saida + ".json", "w", encoding="utf-8") as f:
+        json.dump({
+            "backend": backend,
+            "carga_s": tempo_carga,
+            "latencia_p50_ms": float(np.percentile(latencias_ms, 50)),
+            "latencia_p95_ms": float(np.percentile(latencias_ms, 95)),
+            "vazao_textos_s": len(lote) / tempo_lote if tempo_lote > 0 else 0.0,
+            "rss_pico_mb": memoria_pico_mb(),
+        }, f)
+
+
+def executar_em_processo(backend, repeticoes, tamanho_lote, pasta):
+    saida = os.path.join(pasta, backend)
+    comando = [
+        sys.executable, os.path.abspath(__file__), "--medir", backend,
+        "--repeticoes", str(repeticoes), "--lote", str(tamanho_lote), "--saida", saida,
+    ]
+    processo = subprocess.run(comando, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if processo.returncode != 0:
+        print(f"Erro: o backend {backend} falhou (código {processo.returncode})")
+        return None, None
+
+    with open(saida + ".json", "r", encoding="utf-8") as f:
+        medidas = json.load(f)
+    return medidas, np.load(saida + ".npy")
+
+
+def formatar(valor, casas=1):
+    return "n/d" if valor is None else f"{valor:.{casas}f}"
+
+
+def comparar(backends, repeticoes, tamanho_lote, tolerancia):
+    resultados = {}
+    with tempfile.TemporaryDirectory() as pasta:
+        for backend in backends:
+            print(f"Medindo {backend}...")
+            medidas, vetores = executar_em_processo(backend, repeticoes, tamanho_lote, pasta)
+            if medidas is not None:
+                resultados[backend] = (medidas, vetores)
+
+    if not resultados:
+        return False
+
+    print(f"\n{'backend':<12}{'carga (s)':>11}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+          f"{'textos/s':>10}{'RSS (MB)':>10}")
+    for backend, (medidas, _) in resultados.items():
+        print(f"{backend:<12}{formatar(medidas['carga_s'], 2):>11}"
+              f"{formatar(medidas['latencia_p50_ms'], 2):>10}"
+              f"{formatar(medidas['latencia_p95_ms'], 2):>10}"
+              f"{formatar(medidas['vazao_textos_s']):>10}"
+              f"{formatar(medidas['rss_pico_mb']):>10}")
+
+    if BACKEND_REFERENCIA not in resultados:
+        print(f"\nSem o backend {BACKEND_REFERENCIA} não há como conferir a compatibilidade dos vetores")
+        return len(resultados) == len(backends)
+
+    compativel = True
+    referencia = resultados[BACKEND_REFERENCIA][1]
+    print(f"\nCosseno com {BACKEND_REFERENCIA} (tolerância {tolerancia}):")
+    for backend, (_, vetores) in resultados.items():
+        if backend == BACKEND_REFERENCIA:
+            continue
+        # os dois lados já saem normalizados, então o produto escalar é o cosseno
+        cossenos = np.sum(vetores * referencia, axis=1)
+        ok = cossenos.min() >= tolerancia
+        compativel = compativel and ok
+        print(f"  {backend}: mínimo {cossenos.min():.4f}, médio {cossenos.mean():.4f} "
+              f"-> {'ok' if ok else 'FORA DA TOLERÂNCIA'}")
+
+    return compativel and len(resultados) == len(backends)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compara latência, vazão e memória dos backends de embeddings."
+    )
+    parser.add_argument("--backends", nargs="+", default=BACKENDS_PADRAO,
+                        help="backends a comparar (pytorch, onnx_int8, onnx)")
+    parser.add_argument("--repeticoes", type=int, default=5, help="passadas pelas perguntas de teste")
+    parser.add_argument("--lote", type=int, default=256, help="textos no teste de vazão")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_COSSENO,
+                        help="cosseno mínimo aceito contra o backend de referência")
+    parser.add_argument("--medir", help=argparse.SUPPRESS)
+    parser.add_argument("--saida", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.medir:
+        medir_backend(args.medir, args.repeticoes, args.lote, args.saida)
+        return
+
+    if not comparar(args.backends, args.repeticoes, args.lote, args.tolerancia):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
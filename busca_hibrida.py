@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import unicodedata
+from typing import Any
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from cache_colecao import versao_verificada
+from indice_memmap import RetrieverMemmap
+
+NOME_INDICE_BM25 = "indice_bm25.json"
+
+# parâmetros usuais do BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# candidatos buscados em cada lista antes da fusão e constante do Reciprocal Rank Fusion
+CANDIDATOS_FUSAO = 20
+RRF_K = 60
+
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "de", "da", "do", "das", "dos", "em", "na", "no",
+    "nas", "nos", "e", "ou", "que", "para", "por", "com", "se", "ao", "aos", "como",
+    "qual", "quais", "onde", "quando", "sobre", "mais", "me", "eu", "voce", "tem", "ha",
+    "pelo", "pela", "sao", "esta", "isso", "este", "essa", "esse", "ser", "sua", "seu"
+}
+
+
+def tokenizar(texto):
+    # sem acentos e em minúsculas: "Taunay", "taunáy" e "TAUNAY" caem no mesmo termo
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in re.findall(r"\w+", texto) if len(t) > 1 and t not in STOPWORDS]
+
+
+def caminho_indice_bm25(db_folder):
+    return os.path.join(db_folder, NOME_INDICE_BM25)
+
+
+class IndiceBM25:
+    # Índice invertido dos chunks de texto com pontuação BM25. Os pesos de cada par
+    # (termo, chunk) são calculados uma vez; a consulta só soma as listas dos termos.
+
+    def __init__(self, ids, frequencias, comprimentos, versao=None):
+        # frequencias: {termo: ([posições], [tf])}
+        self.ids = list(ids)
+        self.versao = versao
+        self._frequencias = frequencias
+        self._comprimentos = list(comprimentos)
+
+        n = len(self.ids)
+        comprimentos = np.asarray(self._comprimentos, dtype=np.float32)
+        media = float(comprimentos.mean()) if n else 0.0
+        normalizacao = BM25_K1 * (1 - BM25_B + BM25_B * comprimentos / media) if media else comprimentos
+
+        self._pesos = {}
+        for termo, (posicoes, tfs) in frequencias.items():
+            posicoes = np.asarray(posicoes, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            idf = np.log(1 + (n - len(posicoes) + 0.5) / (len(posicoes) + 0.5))
+            self._pesos[termo] = (posicoes, idf * tfs * (BM25_K1 + 1) / (tfs + normalizacao[posicoes]))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def dos_textos(cls, ids, textos, versao=None):
+        frequencias = {}
+        comprimentos = []
+        for posicao, texto in enumerate(textos):
+            tokens = tokenizar(texto or "")
+            comprimentos.append(len(tokens))
+            contagem = {}
+            for token in tokens:
+                contagem[token] = contagem.get(token, 0) + 1
+            for token, tf in contagem.items():
+                lista = frequencias.setdefault(token, ([], []))
+                lista[0].append(posicao)
+                lista[1].append(tf)
+        return cls(ids, frequencias, comprimentos, versao)
+
+    @classmethod
+    def da_colecao(cls, collection, versao=None):
+        resultado = collection.get(include=["documents"])
+        return cls.dos_textos(resultado["ids"], resultado["documents"], versao)
+
+    def buscar(self, consulta, k):
+        # devolve [(id, pontuação)] dos k melhores chunks com pontuação positiva
+        if not self.ids:
+            return []
+
+        pontuacao = np.zeros(len(self.ids), dtype=np.float32)
+        for termo in tokenizar(consulta):
+            if termo in self._pesos:
+                posicoes, pesos = self._pesos[termo]
+                pontuacao[posicoes] += pesos
+
+        candidatos = np.flatnonzero(pontuacao > 0)
+        if len(candidatos) > k:
+            candidatos = candidatos[np.argpartition(-pontuacao[candidatos], k - 1)[:k]]
+        candidatos = candidatos[np.argsort(-pontuacao[candidatos], kind="stable")]
+        return [(self.ids[i], float(pontuacao[i])) for i in candidatos]
+
+    def salvar(self, caminho):
+        temporario = caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({
+                "versao": self.versao,
+                "ids": self.ids,
+                "comprimentos": self._comprimentos,
+                "frequencias": self._frequencias,
+            }, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho):
+        with open(caminho, "r", encoding="utf-8") as f:
+            dados = json.load(f)
+        return cls(dados["ids"], dados["frequencias"], dados["comprimentos"], dados.get("versao"))
+
+
+_indices = {}
+
+
+def obter_indice_bm25(collection, db_folder):
+    # carrega o índice salvo na ingestão; se não existir ou for de outra versão da
+    # coleção, reconstrói a partir dos textos do Chroma e salva para a próxima vez. A
+    # versão vem da verificação com intervalo: a consulta não passa pelo Chroma a cada pergunta
+    chave = (db_folder, collection.name)
+    versao = versao_verificada(collection, db_folder)
+
+    indice = _indices.get(chave)
+    if indice is not None and indice.versao == versao:
+        return indice
+
+    caminho = caminho_indice_bm25(db_folder)
+    indice = None
+    if os.path.exists(caminho):
+        try:
+            indice = IndiceBM25.carregar(caminho)
+        except Exception as e:
+            print(f"Aviso: índice BM25 ilegível ({e}), reconstruindo")
+
+    if indice is None or indice.versao != versao:
+        print("Construindo índice BM25 dos textos...")
+        indice = IndiceBM25.da_colecao(collection, versao)
+        try:
+            indice.salvar(caminho)
+        except OSError as e:
+            print(f"Aviso: não foi possível salvar o índice BM25: {e}")
+
+    _indices[chave] = indice
+    return indice
+
+
+class RetrieverHibrido(BaseRetriever):
+    # Junta a busca vetorial do Chroma com a BM25 por Reciprocal Rank Fusion: nomes
+    # próprios (Mayrink, Taunay, Excelsior) que o modelo de embeddings em inglês
+    # posiciona mal entram pela lista lexical sem precisar aumentar o k.
+
+    vectorstore: Any
+    db_folder: str
+    k: int = 5
+    candidatos: int = CANDIDATOS_FUSAO
+    rrf_k: int = RRF_K
+    # opcional: outro backend para a parte vetorial (ex.: RetrieverMemmap), com buscar_documentos(consulta, k)
+    retriever_vetorial: Any = None
+
+    def vetores_dos_documentos(self, documentos):
+        # só a parte vetorial em memória (memmap) tem os vetores; None = ler do Chroma
+        if hasattr(self.retriever_vetorial, "vetores_dos_documentos"):
+            return self.retriever_vetorial.vetores_dos_documentos(documentos)
+        return None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        collection = self.vectorstore._collection
+
+        if self.retriever_vetorial is not None:
+            vetoriais = self.retriever_vetorial.buscar_documentos(query, self.candidatos)
+        else:
+            vetoriais = self.vectorstore.similarity_search(query, k=self.candidatos)
+        lexicais = obter_indice_bm25(collection, self.db_folder).buscar(query, self.candidatos)
+
+        pontuacao = {}
+        documentos = {}
+        for posicao, doc in enumerate(vetoriais):
+            id_chunk = doc.id or doc.page_content
+            pontuacao[id_chunk] = pontuacao.get(id_chunk, 0.0) + 1.0 / (self.rrf_k + posicao + 1)
+            documentos[id_chunk] = doc
+        for posicao, (id_chunk, _) in enumerate(lexicais):
+            pontuacao[id_chunk] = pontuacao.get(id_chunk, 0.0) + 1.0 / (self.rrf_k + posicao + 1)
+
+        escolhidos = sorted(pontuacao, key=lambda i: -pontuacao[i])[:self.k]
+
+        # chunks que só vieram da BM25 são lidos do Chroma
+        faltantes = [i for i in escolhidos if i not in documentos]
+        if faltantes:
+            resultado = collection.get(ids=faltantes, include=["documents", "metadatas"])
+            for id_chunk, texto, metadata in zip(resultado["ids"], resultado["documents"], resultado["metadatas"]):
+                documentos[id_chunk] = Document(id=id_chunk, page_content=texto, metadata=metadata or {})
+
+        return [documentos[i] for i in escolhidos if i in documentos]
+
+
+def criar_retriever(vectorstore, embeddings, db_folder, k, busca_vetorial="chroma", busca_hibrida=True):
+    # parte vetorial no Chroma ou no índice memmap ("memmap"), com ou sem a fusão com o BM25
+    retriever_vetorial = None
+    if busca_vetorial == "memmap":
+        retriever_vetorial = RetrieverMemmap(vectorstore=vectorstore, embeddings=embeddings, db_folder=db_folder, k=k)
+
+    if busca_hibrida:
+        return RetrieverHibrido(vectorstore=vectorstore, db_folder=db_folder, k=k,
+                                retriever_vetorial=retriever_vetorial)
+    if retriever_vetorial is not None:
+        return retriever_vetorial
+    return vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": k})
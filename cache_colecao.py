@@ -0,0 +1,114 @@
+import os
+import time
+import uuid
+
+NOME_MARCADOR_VERSAO = "versao_colecao.txt"
+
+# a versão da coleção (count() no Chroma + leitura do marcador) é conferida no máximo uma
+# vez por intervalo; uma ingestão nova regrava o marcador e é percebida na hora pelo mtime
+INTERVALO_VERIFICACAO_VERSAO = 30.0
+
+
+def caminho_marcador(db_folder):
+    return os.path.join(db_folder, NOME_MARCADOR_VERSAO)
+
+
+def marcar_nova_versao(db_folder):
+    # chamado pela ingestão ao terminar: qualquer alteração na coleção, mesmo sem mudar a
+    # contagem (imagens substituídas, fontes vinculadas), invalida os caches dos agentes
+    marcador = uuid.uuid4().hex
+    caminho = caminho_marcador(db_folder)
+    with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+        f.write(marcador)
+    os.replace(caminho + ".tmp", caminho)
+    return marcador
+
+
+def ler_marcador(db_folder):
+    try:
+        with open(caminho_marcador(db_folder), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def versao_colecao(collection, db_folder):
+    # contagem + marcador da última ingestão; usada por todos os caches e índices dos agentes
+    return [collection.count(), ler_marcador(db_folder)]
+
+
+def _mtime_marcador(db_folder):
+    try:
+        return os.path.getmtime(caminho_marcador(db_folder))
+    except OSError:
+        return None
+
+
+# (instante da última consulta, mtime do marcador naquele momento, versão) por coleção
+_verificacoes = {}
+
+
+def versao_verificada(collection, db_folder, intervalo_verificacao=INTERVALO_VERIFICACAO_VERSAO):
+    # versao_colecao para o caminho das consultas: dentro do intervalo, e com o marcador
+    # intocado, devolve a última versão lida sem chamar o Chroma (só um stat do marcador)
+    chave = (db_folder, collection.name)
+    agora = time.monotonic()
+    mtime = _mtime_marcador(db_folder)
+
+    ultima = _verificacoes.get(chave)
+    if ultima is not None and ultima[1] == mtime and agora - ultima[0] < intervalo_verificacao:
+        return ultima[2]
+
+    versao = versao_colecao(collection, db_folder)
+    _verificacoes[chave] = (agora, mtime, versao)
+    return versao
+
+
+class CacheColecao:
+    # Metadados e documentos da coleção de imagens em memória. A leitura completa do
+    # Chroma só acontece na primeira consulta e quando a versão (contagem + marcador
+    # gravado pela ingestão) muda; as demais consultas custam um count().
+
+    def __init__(self, collection, db_folder):
+        self.collection = collection
+        self.db_folder = db_folder
+        self.versao = None
+        self.ids = []
+        self.metadatas = []
+        self.documents = []
+        self.por_id = {}
+        self.recargas = 0
+
+    def versao_atual(self):
+        return versao_colecao(self.collection, self.db_folder)
+
+    def atualizar(self):
+        versao = self.versao_atual()
+        if versao != self.versao:
+            resultado = self.collection.get(include=['metadatas', 'documents'])
+            self.ids = resultado['ids']
+            self.metadatas = resultado['metadatas']
+            self.documents = resultado['documents']
+            self.por_id = {id_item: metadata for id_item, metadata in zip(self.ids, self.metadatas)}
+            self.versao = versao
+            self.recargas += 1
+        return self.versao
+
+
+_caches = {}
+
+
+def cache_da_colecao(collection, db_folder):
+    # um cache por banco e coleção, compartilhado por todos os chamadores do processo;
+    # devolvido sem atualizar (quem só precisa da versão não paga a leitura da coleção)
+    chave = (db_folder, collection.name)
+    cache = _caches.get(chave)
+    if cache is None:
+        cache = _caches[chave] = CacheColecao(collection, db_folder)
+    return cache
+
+
+def obter_cache(collection, db_folder):
+    cache = cache_da_colecao(collection, db_folder)
+    cache.atualizar()
+    return cache
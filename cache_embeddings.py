@@ -0,0 +1,98 @@
+import re
+import sqlite3
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from cache_lru import CacheLRU
+
+MAXIMO_CONSULTAS_MEMORIA = 2048
+
+
+def normalizar_consulta(texto):
+    # o all-MiniLM-L6-v2 usa tokenizador sem distinção de maiúsculas e que separa por
+    # espaços, então caixa e espaços extras não mudam o vetor e podem sair da chave
+    return re.sub(r"\s+", " ", texto).strip().lower()
+
+
+class EmbeddingsComCache(Embeddings):
+    # Envolve um modelo de embeddings e guarda os vetores das perguntas: primeiro numa
+    # LRU em memória, depois (opcional) num SQLite em disco que sobrevive a reinícios.
+    # Os documentos passam direto para o modelo; só as consultas se repetem.
+
+    def __init__(self, modelo, nome_modelo, caminho_disco=None, max_itens=MAXIMO_CONSULTAS_MEMORIA):
+        self.modelo = modelo
+        self.nome_modelo = nome_modelo
+        self.memoria = CacheLRU(max_itens=max_itens, max_bytes=max_itens * 4096, tamanho=lambda v: len(v) * 8)
+        self.acertos_disco = 0
+        self.calculadas = 0
+
+        self._disco = None
+        self._lock_disco = threading.Lock()
+        if caminho_disco:
+            try:
+                self._disco = sqlite3.connect(caminho_disco, check_same_thread=False)
+                self._disco.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "modelo TEXT, consulta TEXT, vetor BLOB, PRIMARY KEY (modelo, consulta))"
+                )
+                self._disco.commit()
+            except sqlite3.Error as e:
+                print(f"Aviso: cache de embeddings em disco indisponível ({e})")
+                self._disco = None
+
+    def _ler_disco(self, consulta):
+        if self._disco is None:
+            return None
+        with self._lock_disco:
+            linha = self._disco.execute(
+                "SELECT vetor FROM embeddings WHERE modelo = ? AND consulta = ?",
+                (self.nome_modelo, consulta)
+            ).fetchone()
+        if linha is None:
+            return None
+        return np.frombuffer(linha[0], dtype=np.float32).tolist()
+
+    def _gravar_disco(self, consulta, vetor):
+        if self._disco is None:
+            return
+        try:
+            with self._lock_disco:
+                self._disco.execute(
+                    "INSERT OR REPLACE INTO embeddings (modelo, consulta, vetor) VALUES (?, ?, ?)",
+                    (self.nome_modelo, consulta, np.asarray(vetor, dtype=np.float32).tobytes())
+                )
+                self._disco.commit()
+        except sqlite3.Error as e:
+            print(f"Aviso: falha ao gravar no cache de embeddings: {e}")
+
+    def embed_query(self, text):
+        consulta = normalizar_consulta(text)
+
+        vetor = self.memoria.obter(consulta)
+        if vetor is not None:
+            return list(vetor)
+
+        vetor = self._ler_disco(consulta)
+        if vetor is not None:
+            self.acertos_disco += 1
+        else:
+            vetor = self.modelo.embed_query(consulta)
+            self.calculadas += 1
+            self._gravar_disco(consulta, vetor)
+
+        self.memoria.guardar(consulta, vetor)
+        return list(vetor)
+
+    def embed_documents(self, texts):
+        return self.modelo.embed_documents(texts)
+
+    def estatisticas(self):
+        memoria = self.memoria.estatisticas()
+        consultas = memoria["acertos"] + memoria["falhas"]
+        return {
+            "consultas": consultas,
+            "acertos_memoria": memoria["acertos"],
+            "acertos_disco": self.acertos_disco,
+            "calculadas": self.calculadas,
+            "taxa_acerto": (memoria["acertos"] + self.acertos_disco) / consultas if consultas else 0.0,
+        }
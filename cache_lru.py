@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+
+
+class CacheLRU:
+    # Cache limitado por quantidade de itens e pela soma dos tamanhos; ao passar de um
+    # dos limites, os itens usados há mais tempo saem primeiro. Seguro entre threads
+    # (o bot do Discord e o Streamlit atendem perguntas em paralelo).
+
+    def __init__(self, max_itens=128, max_bytes=64 * 1024 * 1024, tamanho=len):
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self._tamanho = tamanho
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave):
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave][0]
+            self.falhas += 1
+            return None
+
+    def guardar(self, chave, valor):
+        tamanho = self._tamanho(valor)
+        with self._lock:
+            if tamanho > self.max_bytes:
+                return
+
+            if chave in self._itens:
+                self._bytes -= self._itens.pop(chave)[1]
+
+            self._itens[chave] = (valor, tamanho)
+            self._bytes += tamanho
+
+            while len(self._itens) > self.max_itens or self._bytes > self.max_bytes:
+                _, (_, tamanho_removido) = self._itens.popitem(last=False)
+                self._bytes -= tamanho_removido
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._itens)
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "itens": len(self._itens),
+                "bytes": self._bytes,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+            }
@@ -0,0 +1,160 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# similaridade de cosseno mínima entre perguntas para reaproveitar a resposta
+LIMIAR_SIMILARIDADE = 0.92
+
+# validade das respostas por categoria, em segundos: o clima muda rápido, o resto não
+TTL_POR_CATEGORIA = {
+    "clima": 10 * 60,
+    "trilhas": 24 * 60 * 60,
+    "geral": 24 * 60 * 60,
+}
+TTL_PADRAO = 60 * 60
+
+MAXIMO_RESPOSTAS = 512
+
+# perguntas que se apoiam na conversa anterior ("e dela?", "quanto tempo leva essa?"),
+# incluindo demonstrativos contraídos com preposição ("nessa trilha", "daquele mirante")
+PADRAO_REFERENCIA = re.compile(
+    r"\b(ela|ele|elas|eles|dela|dele|delas|deles|nela|nele|isso|isto|disso|nisso|"
+    r"essa|esse|esta|este|essas|esses|estas|estes|aquela|aquele|aquelas|aqueles|aquilo|"
+    r"dessa|desse|dessas|desses|desta|deste|destas|destes|"
+    r"nessa|nesse|nessas|nesses|nesta|neste|nestas|nestes|"
+    r"daquela|daquele|daquelas|daqueles|daquilo|naquela|naquele|naquelas|naqueles|naquilo|"
+    r"lá|ali|mesma|mesmo|anterior|acima|também)\b"
+)
+PALAVRAS_MINIMAS_SEM_CONTEXTO = 4
+
+# qualificadores de tempo que o agente_clima usa para escolher entre o tempo atual, um dia
+# da previsão ou os próximos dias: "vai chover hoje?" e "vai chover amanhã?" são quase
+# iguais para o modelo de embeddings, mas pedem respostas diferentes
+QUALIFICADORES_TEMPORAIS = {
+    "hoje": ("hoje",),
+    "amanha": ("amanhã", "amanha"),
+    "depois_de_amanha": ("depois de amanhã", "depois de amanha"),
+    "agora": ("agora", "no momento", "nesse momento", "clima atual"),
+    "proximos_dias": ("próximos dias", "proximos dias", "próximos 3 dias", "proximos 3 dias"),
+}
+
+
+def depende_do_historico(pergunta, chat_history):
+    # sem histórico nada depende dele; com histórico, perguntas curtas, que começam
+    # com "e" ou que usam pronomes e demonstrativos são tratadas como continuação
+    if not chat_history:
+        return False
+
+    texto = pergunta.lower()
+    palavras = texto.split()
+    return (
+        len(palavras) < PALAVRAS_MINIMAS_SEM_CONTEXTO
+        or palavras[0] == "e"
+        or PADRAO_REFERENCIA.search(texto) is not None
+    )
+
+
+def qualificadores_temporais(pergunta):
+    texto = pergunta.lower()
+    return frozenset(
+        nome for nome, expressoes in QUALIFICADORES_TEMPORAIS.items()
+        if any(expressao in texto for expressao in expressoes)
+    )
+
+
+class CacheRespostas:
+    # Respostas já geradas, indexadas pelo vetor da pergunta. Uma pergunta nova reutiliza
+    # a resposta da mais parecida se o cosseno passar do limiar e a entrada ainda estiver
+    # dentro do TTL da sua categoria. Respostas de clima só valem para perguntas com os
+    # mesmos qualificadores de tempo. Acima do limite de tamanho sai a menos usada.
+
+    def __init__(self, embeddings, limiar=LIMIAR_SIMILARIDADE, ttl_por_categoria=None,
+                 max_itens=MAXIMO_RESPOSTAS, relogio=time.time):
+        # relogio: função que devolve o instante atual em segundos (os testes passam um controlável)
+        self.embeddings = embeddings
+        self.limiar = limiar
+        self.ttl_por_categoria = dict(TTL_POR_CATEGORIA if ttl_por_categoria is None else ttl_por_categoria)
+        self.max_itens = max_itens
+        self.relogio = relogio
+        self._entradas = OrderedDict()
+        self._proximo_id = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.expiradas = 0
+
+    def _vetor(self, pergunta):
+        vetor = np.asarray(self.embeddings.embed_query(pergunta), dtype=np.float32)
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma > 0 else vetor
+
+    def _expirada(self, entrada, agora):
+        ttl = self.ttl_por_categoria.get(entrada["categoria"], TTL_PADRAO)
+        return agora - entrada["criada_em"] > ttl
+
+    def buscar(self, pergunta):
+        # devolve (categoria, resposta, similaridade, extras) ou None; extras é o que foi
+        # guardado junto com a resposta (ex.: os mapas oferecidos pelo agente de trilhas)
+        vetor = self._vetor(pergunta)
+        qualificadores = qualificadores_temporais(pergunta)
+        agora = self.relogio()
+
+        with self._lock:
+            for chave in [c for c, e in self._entradas.items() if self._expirada(e, agora)]:
+                del self._entradas[chave]
+                self.expiradas += 1
+
+            if not self._entradas:
+                self.falhas += 1
+                return None
+
+            chaves = list(self._entradas)
+            matriz = np.stack([self._entradas[c]["vetor"] for c in chaves])
+            similaridades = matriz @ vetor
+            for posicao, chave in enumerate(chaves):
+                entrada = self._entradas[chave]
+                if entrada["categoria"] == "clima" and entrada["qualificadores"] != qualificadores:
+                    similaridades[posicao] = -1.0
+            melhor = int(np.argmax(similaridades))
+
+            if similaridades[melhor] < self.limiar:
+                self.falhas += 1
+                return None
+
+            chave = chaves[melhor]
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            entrada = self._entradas[chave]
+            return entrada["categoria"], entrada["resposta"], float(similaridades[melhor]), entrada["extras"]
+
+    def guardar(self, pergunta, categoria, resposta, extras=None):
+        vetor = self._vetor(pergunta)
+        with self._lock:
+            self._entradas[self._proximo_id] = {
+                "vetor": vetor,
+                "categoria": categoria,
+                "resposta": resposta,
+                "qualificadores": qualificadores_temporais(pergunta),
+                "extras": extras or {},
+                "criada_em": self.relogio(),
+            }
+            self._proximo_id += 1
+            while len(self._entradas) > self.max_itens:
+                self._entradas.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "itens": len(self._entradas),
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "expiradas": self.expiradas,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+            }
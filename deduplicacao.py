@@ -0,0 +1,274 @@
+import os
+import zlib
+import numpy as np
+from PIL import Image
+
+NUM_PERMUTACOES = 64
+NUM_BANDAS = 16
+TAMANHO_SHINGLE = 5
+LIMIAR_SIMILARIDADE = 0.8
+
+# hash perceptual (pHash) das imagens: 64 bits das frequências baixas da DCT 32x32;
+# imagens com distância de Hamming até DISTANCIA_MAXIMA_HASH são candidatas a serem a
+# mesma. Mapas de trilhas diferentes sobre a mesma base do parque ficam perto no pHash,
+# então o candidato só é aceito se os pixels também baterem (imagens_equivalentes)
+DISTANCIA_MAXIMA_HASH = 6
+NUM_SEGMENTOS_HASH = 8
+
+# confirmação por pixels: as duas imagens são reduzidas a um tamanho comum (o da menor,
+# com o lado maior limitado a LADO_MAXIMO_COMPARACAO) e nenhum bloco de
+# TAMANHO_BLOCO_COMPARACAO px pode ter diferença média acima do limite. O mesmo mapa em
+# outra resolução passa; um traçado de trilha a mais muda poucos pixels no total, mas
+# muito dentro dos blocos que cruza. Proporções diferentes não são a mesma imagem
+DIFERENCA_MAXIMA_PROPORCAO = 0.02
+LADO_MAXIMO_COMPARACAO = 1024
+TAMANHO_BLOCO_COMPARACAO = 32
+DIFERENCA_MAXIMA_BLOCO = 8.0
+
+# primo de Mersenne 2^31 - 1: a * x cabe em uint64 para a, x < 2^32
+_PRIMO = np.uint64((1 << 31) - 1)
+
+
+class IndiceMinHash:
+    # Assinaturas MinHash dos chunks já indexados, com LSH por bandas para achar
+    # candidatos a quase-duplicata sem comparar contra a coleção inteira.
+
+    def __init__(self, num_permutacoes=NUM_PERMUTACOES, num_bandas=NUM_BANDAS,
+                 tamanho_shingle=TAMANHO_SHINGLE, limiar=LIMIAR_SIMILARIDADE, semente=42):
+        if num_permutacoes % num_bandas:
+            raise ValueError("num_permutacoes deve ser múltiplo de num_bandas")
+
+        self.num_permutacoes = num_permutacoes
+        self.num_bandas = num_bandas
+        self.linhas_por_banda = num_permutacoes // num_bandas
+        self.tamanho_shingle = tamanho_shingle
+        self.limiar = limiar
+
+        rng = np.random.default_rng(semente)
+        self._a = rng.integers(1, int(_PRIMO), num_permutacoes, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIMO), num_permutacoes, dtype=np.uint64)
+
+        self.assinaturas = {}
+        self.arquivos = {}
+        self._buckets = [{} for _ in range(num_bandas)]
+
+    def parametros(self):
+        return {
+            "num_permutacoes": self.num_permutacoes,
+            "num_bandas": self.num_bandas,
+            "tamanho_shingle": self.tamanho_shingle,
+            "limiar": self.limiar,
+        }
+
+    def calcular_assinatura(self, texto):
+        palavras = texto.lower().split()
+        if not palavras:
+            return None
+
+        n = self.tamanho_shingle
+        shingles = {
+            " ".join(palavras[i:i + n])
+            for i in range(max(1, len(palavras) - n + 1))
+        }
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        ) % _PRIMO
+
+        permutados = (np.outer(hashes, self._a) + self._b) % _PRIMO
+        return permutados.min(axis=0)
+
+    def _chaves_bandas(self, assinatura):
+        r = self.linhas_por_banda
+        return [assinatura[i * r:(i + 1) * r].tobytes() for i in range(self.num_bandas)]
+
+    def buscar_duplicata(self, assinatura):
+        # devolve o id de um chunk já indexado com similaridade estimada >= limiar, ou None
+        candidatos = set()
+        for banda, chave in enumerate(self._chaves_bandas(assinatura)):
+            candidatos.update(self._buckets[banda].get(chave, ()))
+
+        melhor, melhor_similaridade = None, self.limiar
+        for id_chunk in candidatos:
+            similaridade = float(np.mean(self.assinaturas[id_chunk] == assinatura))
+            if similaridade >= melhor_similaridade:
+                melhor, melhor_similaridade = id_chunk, similaridade
+
+        return melhor
+
+    def adicionar(self, id_chunk, assinatura, arquivo):
+        self.assinaturas[id_chunk] = assinatura
+        self.arquivos[id_chunk] = arquivo
+        for banda, chave in enumerate(self._chaves_bandas(assinatura)):
+            self._buckets[banda].setdefault(chave, []).append(id_chunk)
+
+    def remover(self, id_chunk):
+        assinatura = self.assinaturas.pop(id_chunk, None)
+        self.arquivos.pop(id_chunk, None)
+        if assinatura is None:
+            return
+
+        for banda, chave in enumerate(self._chaves_bandas(assinatura)):
+            ids = self._buckets[banda].get(chave)
+            if ids and id_chunk in ids:
+                ids.remove(id_chunk)
+                if not ids:
+                    del self._buckets[banda][chave]
+
+    def remover_arquivo(self, arquivo):
+        for id_chunk in [i for i, a in self.arquivos.items() if a == arquivo]:
+            self.remover(id_chunk)
+
+    def __len__(self):
+        return len(self.assinaturas)
+
+    def salvar(self, caminho):
+        ids = list(self.assinaturas)
+        temporario = caminho + ".tmp.npz"
+        np.savez(
+            temporario,
+            ids=np.array(ids, dtype=str),
+            arquivos=np.array([self.arquivos[i] for i in ids], dtype=str),
+            assinaturas=(
+                np.stack([self.assinaturas[i] for i in ids])
+                if ids else np.empty((0, self.num_permutacoes), dtype=np.uint64)
+            ),
+            parametros=np.array([self.num_permutacoes, self.num_bandas, self.tamanho_shingle, self.limiar])
+        )
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho, **parametros):
+        # devolve um índice vazio se o arquivo não existir ou foi gerado com outros parâmetros
+        indice = cls(**parametros)
+        if not os.path.exists(caminho):
+            return indice
+
+        try:
+            with np.load(caminho) as dados:
+                salvos = list(dados["parametros"])
+                atuais = [indice.num_permutacoes, indice.num_bandas, indice.tamanho_shingle, indice.limiar]
+                if salvos != atuais:
+                    print("Aviso: índice de duplicatas gerado com outros parâmetros, começando vazio")
+                    return indice
+
+                for id_chunk, arquivo, assinatura in zip(dados["ids"], dados["arquivos"], dados["assinaturas"]):
+                    indice.adicionar(str(id_chunk), assinatura, str(arquivo))
+        except Exception as e:
+            print(f"Aviso: índice de duplicatas ilegível ({e}), começando vazio")
+            return cls(**parametros)
+
+        return indice
+
+
+def _matriz_dct(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matriz = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matriz[0, :] /= np.sqrt(2.0)
+    return matriz
+
+
+_DCT_32 = _matriz_dct(32)
+
+
+def calcular_hash_perceptual(img):
+    cinza = np.asarray(img.convert("L").resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64)
+    frequencias = (_DCT_32 @ cinza @ _DCT_32.T)[:8, :8].ravel()
+
+    # o termo DC (brilho médio) fica fora da mediana para não dominar a comparação
+    bits = frequencias > np.median(frequencias[1:])
+
+    valor = 0
+    for bit in bits:
+        valor = (valor << 1) | int(bit)
+    return valor
+
+
+def imagens_equivalentes(img_a, img_b, tamanho_bloco=TAMANHO_BLOCO_COMPARACAO,
+                         diferenca_maxima=DIFERENCA_MAXIMA_BLOCO):
+    # compara as duas imagens em tons de cinza, bloco a bloco, num tamanho comum
+    proporcao_a = img_a.width / img_a.height
+    proporcao_b = img_b.width / img_b.height
+    if abs(proporcao_a - proporcao_b) > DIFERENCA_MAXIMA_PROPORCAO * proporcao_a:
+        return False
+
+    menor = img_a if img_a.width * img_a.height <= img_b.width * img_b.height else img_b
+    escala = min(1.0, LADO_MAXIMO_COMPARACAO / max(menor.size))
+    largura = max(1, round(menor.width * escala))
+    altura = max(1, round(menor.height * escala))
+
+    def reduzir(img):
+        cinza = img.convert("L")
+        if cinza.size != (largura, altura):
+            cinza = cinza.resize((largura, altura), Image.Resampling.BOX)
+        return np.asarray(cinza, dtype=np.int16)
+
+    diferenca = np.abs(reduzir(img_a) - reduzir(img_b))
+
+    # blocos completos; as bordas que sobram entram como um bloco a mais em cada eixo
+    linhas = -(-altura // tamanho_bloco)
+    colunas = -(-largura // tamanho_bloco)
+    preenchida = np.zeros((linhas * tamanho_bloco, colunas * tamanho_bloco), dtype=np.float32)
+    contagem = np.zeros_like(preenchida)
+    preenchida[:altura, :largura] = diferenca
+    contagem[:altura, :largura] = 1
+
+    soma = preenchida.reshape(linhas, tamanho_bloco, colunas, tamanho_bloco).sum(axis=(1, 3))
+    pixels = contagem.reshape(linhas, tamanho_bloco, colunas, tamanho_bloco).sum(axis=(1, 3))
+    return bool((soma / pixels).max() <= diferenca_maxima)
+
+
+class IndiceHashPerceptual:
+    # Busca por distância de Hamming com múltiplos índices: os 64 bits são divididos em
+    # segmentos e, pelo princípio da casa dos pombos, qualquer hash a distância menor que
+    # o número de segmentos coincide exatamente com a consulta em pelo menos um deles.
+
+    def __init__(self, distancia_maxima=DISTANCIA_MAXIMA_HASH, num_segmentos=NUM_SEGMENTOS_HASH):
+        if distancia_maxima >= num_segmentos:
+            raise ValueError("distancia_maxima deve ser menor que num_segmentos")
+
+        self.distancia_maxima = distancia_maxima
+        self.num_segmentos = num_segmentos
+        self.bits_segmento = 64 // num_segmentos
+        self.hashes = {}
+        self._tabelas = [{} for _ in range(num_segmentos)]
+
+    def _segmentos(self, valor):
+        mascara = (1 << self.bits_segmento) - 1
+        return [(valor >> (i * self.bits_segmento)) & mascara for i in range(self.num_segmentos)]
+
+    def buscar_candidatos(self, valor):
+        # ids dentro da distância máxima, do mais próximo para o mais distante
+        candidatos = set()
+        for tabela, segmento in zip(self._tabelas, self._segmentos(valor)):
+            candidatos.update(tabela.get(segmento, ()))
+
+        distancias = [(bin(self.hashes[id_item] ^ valor).count("1"), id_item) for id_item in candidatos]
+        return [id_item for distancia, id_item in sorted(distancias) if distancia <= self.distancia_maxima]
+
+    def buscar(self, valor):
+        # devolve o id mais próximo dentro da distância máxima, ou None
+        candidatos = self.buscar_candidatos(valor)
+        return candidatos[0] if candidatos else None
+
+    def adicionar(self, id_item, valor):
+        self.hashes[id_item] = valor
+        for tabela, segmento in zip(self._tabelas, self._segmentos(valor)):
+            tabela.setdefault(segmento, set()).add(id_item)
+
+    def remover(self, id_item):
+        valor = self.hashes.pop(id_item, None)
+        if valor is None:
+            return
+
+        for tabela, segmento in zip(self._tabelas, self._segmentos(valor)):
+            ids = tabela.get(segmento)
+            if ids:
+                ids.discard(id_item)
+                if not ids:
+                    del tabela[segmento]
+
+    def __len__(self):
+        return len(self.hashes)
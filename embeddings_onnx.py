@@ -0,0 +1,121 @@
+import os
+import shutil
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# o mesmo all-MiniLM-L6-v2 dos agentes, exportado em ONNX pelo próprio repositório do modelo;
+# a quantização int8 dinâmica é feita localmente na primeira execução
+MODELO_HF = "sentence-transformers/all-MiniLM-L6-v2"
+PASTA_MODELOS_ONNX = os.path.join(os.path.dirname(__file__), "modelos_onnx")
+ARQUIVO_MODELO = "model.onnx"
+ARQUIVO_MODELO_INT8 = "model_int8.onnx"
+ARQUIVO_TOKENIZER = "tokenizer.json"
+
+# limite de tokens do all-MiniLM-L6-v2 no sentence-transformers e textos por chamada ao ONNX Runtime
+TAMANHO_MAXIMO_TOKENS = 256
+TAMANHO_LOTE = 32
+
+# o modelo int8 só é aceito se os vetores ficarem a um cosseno mínimo dos do modelo
+# original nestes textos; o ONNX float32 exportado reproduz o sentence-transformers,
+# então serve de referência sem precisar do PyTorch (benchmark_embeddings.py compara com ele)
+TOLERANCIA_COSSENO = 0.99
+TEXTOS_VERIFICACAO = [
+    "Quais trilhas existem no parque?",
+    "Como chegar na Cachoeira dos Primatas?",
+    "Qual o horário de funcionamento do parque?",
+    "A trilha do Pico da Tijuca tem aproximadamente 3,5 km de extensão e nível de "
+    "dificuldade moderado, com trechos de escadaria esculpida na rocha.",
+    "O reflorestamento iniciado em 1861 pelo Major Manuel Gomes Archer recuperou as "
+    "nascentes que abasteciam a cidade, devastadas pelas plantações de café.",
+]
+
+
+def preparar_modelo_onnx(pasta=PASTA_MODELOS_ONNX, quantizar=True):
+    # baixa o modelo ONNX e o tokenizer se ainda não estiverem na pasta e gera a versão int8
+    os.makedirs(pasta, exist_ok=True)
+    modelo = os.path.join(pasta, ARQUIVO_MODELO)
+    tokenizer = os.path.join(pasta, ARQUIVO_TOKENIZER)
+
+    if not os.path.exists(modelo) or not os.path.exists(tokenizer):
+        from huggingface_hub import hf_hub_download
+        print(f"Baixando {MODELO_HF} em ONNX...")
+        for origem, destino in (("onnx/model.onnx", modelo), ("tokenizer.json", tokenizer)):
+            shutil.copyfile(hf_hub_download(MODELO_HF, origem), destino)
+
+    modelo_int8 = os.path.join(pasta, ARQUIVO_MODELO_INT8)
+    if quantizar and not os.path.exists(modelo_int8):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print("Quantizando o modelo para int8...")
+        temporario = os.path.join(pasta, "tmp_" + ARQUIVO_MODELO_INT8)
+        quantize_dynamic(modelo, temporario, weight_type=QuantType.QInt8)
+
+        # conferido uma vez, antes de o arquivo int8 passar a ser usado
+        minimo = cosseno_minimo(pasta, modelo, temporario)
+        if minimo < TOLERANCIA_COSSENO:
+            os.remove(temporario)
+            raise RuntimeError(
+                f"modelo int8 incompatível com o índice (cosseno mínimo {minimo:.4f} < "
+                f"{TOLERANCIA_COSSENO}); use BACKEND_EMBEDDING=onnx ou pytorch"
+            )
+        print(f"Modelo int8 conferido (cosseno mínimo {minimo:.4f})")
+        os.replace(temporario, modelo_int8)
+
+    return modelo_int8 if quantizar else modelo
+
+
+def cosseno_minimo(pasta, modelo_referencia, modelo, textos=TEXTOS_VERIFICACAO):
+    # os dois lados saem normalizados: o produto escalar é o cosseno
+    referencia = np.asarray(EmbeddingsOnnx(pasta, caminho_modelo=modelo_referencia).embed_documents(textos))
+    vetores = np.asarray(EmbeddingsOnnx(pasta, caminho_modelo=modelo).embed_documents(textos))
+    return float(np.sum(referencia * vetores, axis=1).min())
+
+
+class EmbeddingsOnnx(Embeddings):
+    # Mesmo cálculo do sentence-transformers (média dos tokens ponderada pela máscara de
+    # atenção e normalização L2), mas rodando no ONNX Runtime, sem PyTorch. Os vetores
+    # ficam compatíveis com o índice gerado pelo modelo original (ver benchmark_embeddings.py).
+
+    def __init__(self, pasta=PASTA_MODELOS_ONNX, quantizado=True, num_threads=None, caminho_modelo=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        # caminho_modelo: um .onnx específico, sem passar pela preparação (usado na conferência do int8)
+        caminho_modelo = caminho_modelo or preparar_modelo_onnx(pasta, quantizar=quantizado)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(pasta, ARQUIVO_TOKENIZER))
+        self.tokenizer.enable_truncation(max_length=TAMANHO_MAXIMO_TOKENS)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        opcoes = ort.SessionOptions()
+        opcoes.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            opcoes.intra_op_num_threads = num_threads
+        self.sessao = ort.InferenceSession(caminho_modelo, opcoes, providers=["CPUExecutionProvider"])
+
+        self._entradas = {entrada.name for entrada in self.sessao.get_inputs()}
+        saidas = [saida.name for saida in self.sessao.get_outputs()]
+        self._saida = "last_hidden_state" if "last_hidden_state" in saidas else saidas[0]
+
+    def _codificar(self, textos):
+        vetores = []
+        for inicio in range(0, len(textos), TAMANHO_LOTE):
+            codificados = self.tokenizer.encode_batch(textos[inicio:inicio + TAMANHO_LOTE])
+            ids = np.array([c.ids for c in codificados], dtype=np.int64)
+            mascara = np.array([c.attention_mask for c in codificados], dtype=np.int64)
+
+            entradas = {"input_ids": ids, "attention_mask": mascara}
+            if "token_type_ids" in self._entradas:
+                entradas["token_type_ids"] = np.zeros_like(ids)
+
+            tokens = self.sessao.run([self._saida], entradas)[0]
+            pesos = mascara[..., None].astype(np.float32)
+            media = (tokens * pesos).sum(axis=1) / np.clip(pesos.sum(axis=1), 1e-9, None)
+            media /= np.clip(np.linalg.norm(media, axis=1, keepdims=True), 1e-12, None)
+            vetores.extend(media.tolist())
+        return vetores
+
+    def embed_documents(self, texts):
+        return self._codificar(list(texts))
+
+    def embed_query(self, text):
+        return self._codificar([text])[0]
@@ -0,0 +1,126 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from montagem_contexto import contar_tokens, cortar_tokens
+
+# turnos (pergunta + resposta) mantidos na íntegra; os mais antigos viram resumo
+TURNOS_RECENTES = 4
+
+# teto de tokens (estimados) do histórico enviado em cada pergunta, resumo incluído
+MAX_TOKENS_HISTORICO = 1500
+
+PROMPT_RESUMO = """Você resume conversas entre um visitante e o assistente do Parque Nacional da Tijuca.
+
+Atualize o resumo abaixo com os novos turnos. Mantenha trilhas, locais, nomes, datas e
+preferências do visitante que possam ser retomados depois. Use no máximo 6 frases, sem
+comentários sobre o resumo.
+
+RESUMO ATUAL:
+{resumo}
+
+NOVOS TURNOS:
+{turnos}"""
+
+
+class HistoricoConversa:
+    # Histórico do orquestrador com tamanho limitado: os últimos turnos ficam como estão
+    # e os anteriores são incorporados a um resumo gerado pelo LLM numa thread à parte,
+    # fora do caminho da pergunta. Enquanto o resumo não fica pronto, os turnos que saíram
+    # continuam sendo enviados (dentro do teto), então nada se perde no intervalo.
+
+    def __init__(self, llm, turnos_recentes=TURNOS_RECENTES, max_tokens=MAX_TOKENS_HISTORICO):
+        self.llm = llm
+        self.turnos_recentes = turnos_recentes
+        self.max_tokens = max_tokens
+        self.resumo = ""
+        self.resumos_gerados = 0
+        self._recentes = []
+        self._pendentes = []
+        self._geracao = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="resumo-historico")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._recentes) + len(self._pendentes) + (1 if self.resumo else 0)
+
+    def adicionar(self, pergunta, resposta):
+        with self._lock:
+            self._recentes.append((pergunta, resposta))
+            saiu = False
+            while len(self._recentes) > self.turnos_recentes:
+                self._pendentes.append(self._recentes.pop(0))
+                saiu = True
+        if saiu:
+            self._executor.submit(self._resumir)
+
+    def _resumir(self):
+        with self._lock:
+            lote = list(self._pendentes)
+            resumo_atual = self.resumo
+            geracao = self._geracao
+        if not lote:
+            return
+
+        turnos = "\n".join(f"Visitante: {pergunta}\nAssistente: {resposta}" for pergunta, resposta in lote)
+        try:
+            novo_resumo = self.llm.invoke(
+                PROMPT_RESUMO.format(resumo=resumo_atual or "(vazio)", turnos=turnos)
+            ).content.strip()
+        except Exception as e:
+            # os turnos continuam pendentes e entram no próximo resumo
+            print(f"Aviso: não foi possível resumir o histórico ({e})")
+            return
+
+        with self._lock:
+            if geracao != self._geracao:
+                return
+            self.resumo = novo_resumo
+            del self._pendentes[:len(lote)]
+            self.resumos_gerados += 1
+
+    def mensagens(self):
+        # lista de mensagens para o MessagesPlaceholder, do resumo ao turno mais recente;
+        # acima do teto saem primeiro os turnos mais antigos e, por último, o resumo é cortado
+        with self._lock:
+            resumo = self.resumo
+            turnos = self._pendentes + self._recentes
+
+        def custo(turno):
+            return contar_tokens(turno[0]) + contar_tokens(turno[1])
+
+        gasto = sum(custo(turno) for turno in turnos)
+        while turnos and gasto > self.max_tokens:
+            gasto -= custo(turnos.pop(0))
+
+        mensagens = []
+        prefixo = "Resumo da conversa anterior: "
+        disponivel = self.max_tokens - gasto - contar_tokens(prefixo)
+        if resumo and disponivel > 0:
+            mensagens.append(SystemMessage(content=prefixo + cortar_tokens(resumo, disponivel)))
+
+        for pergunta, resposta in turnos:
+            mensagens.append(HumanMessage(content=pergunta))
+            mensagens.append(AIMessage(content=resposta))
+        return mensagens
+
+    def limpar(self):
+        with self._lock:
+            self._recentes.clear()
+            self._pendentes.clear()
+            self.resumo = ""
+            # um resumo em andamento de antes da limpeza é descartado quando terminar
+            self._geracao += 1
+
+    def aguardar(self):
+        # espera os resumos já agendados (útil ao encerrar ou em testes)
+        self._executor.submit(lambda: None).result()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "turnos_recentes": len(self._recentes),
+                "turnos_pendentes": len(self._pendentes),
+                "resumos_gerados": self.resumos_gerados,
+                "tokens_resumo": contar_tokens(self.resumo),
+            }
@@ -0,0 +1,225 @@
+import os
+import json
+import numpy as np
+from cache_colecao import cache_da_colecao, versao_verificada
+
+NOME_INDICE_MAPAS = "indice_mapas.json"
+
+# pesos da busca por palavras-chave: nome do PDF, caminho relativo e texto do documento
+PESOS_CAMPOS = {"arquivo": 3, "caminho": 2, "documento": 1}
+
+# cada um destes termos no nome ou caminho do PDF soma 1 ponto, mesmo sem a pergunta citá-lo
+TRILHA_KEYWORDS = [
+    'cascatinha', 'taunay', 'pico', 'tijuca', 'mirante',
+    'mayrink', 'excelsior', 'imperador', 'conde', 'estrada',
+    'caminho', 'trilha', 'vale', 'floresta', 'cachoeira'
+]
+
+TAMANHO_MINIMO_PALAVRA = 3
+
+# palavras já resolvidas em posições; perguntas sobre trilhas repetem quase sempre os mesmos termos
+MAXIMO_PALAVRAS_MEMORIZADAS = 4096
+
+
+def caminho_indice(db_folder):
+    return os.path.join(db_folder, NOME_INDICE_MAPAS)
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceMapas:
+    # Índice invertido dos mapas: cada campo tem listas de posições por token (o texto
+    # separado por espaços). Uma palavra da pergunta sem espaços é substring do campo se e
+    # somente se é substring de algum token, então a pontuação é a mesma da varredura
+    # completa; os tokens candidatos saem de um índice de trigramas do vocabulário.
+
+    def __init__(self, versao=None):
+        self.versao = versao
+        self.registros = []
+        self.postings = {campo: {} for campo in PESOS_CAMPOS}
+        self.bonus = []
+        self._trigramas = {campo: {} for campo in PESOS_CAMPOS}
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.registros)
+
+    def adicionar(self, id_mapa, metadata, documento):
+        metadata = metadata or {}
+        posicao = len(self.registros)
+
+        self.registros.append({
+            'id': id_mapa,
+            'arquivo': metadata.get('arquivo_pdf', 'Desconhecido'),
+            'pagina': metadata.get('pagina', '?'),
+            'caminho': metadata.get('caminho_relativo', ''),
+            'dimensoes': metadata.get('dimensoes', ''),
+            'metodo': metadata.get('metodo_extracao', 'desconhecido')
+        })
+
+        # imagens repetidas em vários PDFs guardam todas as origens em fontes_json; o nome e
+        # o caminho de cada uma entram no índice, não só os da primeira
+        fontes = json.loads(metadata.get('fontes_json') or '[]') or [metadata]
+        textos = {
+            "arquivo": " ".join(dict.fromkeys(f.get('arquivo_pdf', '') for f in fontes)).lower(),
+            "caminho": " ".join(dict.fromkeys(f.get('caminho_relativo', '') for f in fontes)).lower(),
+            "documento": documento.lower() if documento else ''
+        }
+        for campo, texto in textos.items():
+            for token in set(texto.split()):
+                self._indexar_token(campo, token, posicao)
+
+        self.bonus.append(sum(
+            1 for kw in TRILHA_KEYWORDS if kw in textos["arquivo"] or kw in textos["caminho"]
+        ))
+        self._arrays = None
+
+    def _indexar_token(self, campo, token, posicao):
+        posicoes = self.postings[campo].get(token)
+        if posicoes is None:
+            posicoes = self.postings[campo][token] = []
+            for trigrama in _trigramas(token):
+                self._trigramas[campo].setdefault(trigrama, set()).add(token)
+        posicoes.append(posicao)
+
+    def _preparar_arrays(self):
+        # listas de posições como arrays numpy, montadas uma vez e reaproveitadas nas buscas
+        self._arrays = {
+            campo: {token: np.asarray(posicoes, dtype=np.int32) for token, posicoes in postings.items()}
+            for campo, postings in self.postings.items()
+        }
+        self._bonus = np.asarray(self.bonus, dtype=np.int32)
+        self._memo = {}
+
+    def _posicoes_com(self, campo, palavra):
+        chave = (campo, palavra)
+        if chave not in self._memo:
+            if len(self._memo) >= MAXIMO_PALAVRAS_MEMORIZADAS:
+                self._memo.clear()
+            self._memo[chave] = self._resolver_palavra(campo, palavra)
+        return self._memo[chave]
+
+    def _resolver_palavra(self, campo, palavra):
+        tokens = None
+        for trigrama in _trigramas(palavra):
+            encontrados = self._trigramas[campo].get(trigrama)
+            if not encontrados:
+                return None
+            tokens = set(encontrados) if tokens is None else tokens & encontrados
+
+        arrays = [self._arrays[campo][token] for token in tokens or () if palavra in token]
+        if not arrays:
+            return None
+        # a palavra conta uma vez por campo, mesmo aparecendo em vários tokens do mesmo mapa
+        return arrays[0] if len(arrays) == 1 else np.unique(np.concatenate(arrays))
+
+    def buscar(self, query_text, top_k):
+        if not self.registros or top_k <= 0:
+            return []
+        if self._arrays is None:
+            self._preparar_arrays()
+
+        pontuacao = self._bonus.copy()
+        for palavra in query_text.lower().split():
+            if len(palavra) < TAMANHO_MINIMO_PALAVRA:
+                continue
+            for campo, peso in PESOS_CAMPOS.items():
+                posicoes = self._posicoes_com(campo, palavra)
+                if posicoes is not None:
+                    pontuacao[posicoes] += peso
+
+        # top_k sem ordenar a coleção inteira; empates mantêm a ordem da coleção, como na
+        # ordenação estável da varredura antiga
+        n = len(pontuacao)
+        if top_k < n:
+            limiar = np.partition(pontuacao, n - top_k)[n - top_k]
+            acima = np.flatnonzero(pontuacao > limiar)
+            iguais = np.flatnonzero(pontuacao == limiar)[:top_k - len(acima)]
+            selecionados = np.concatenate([acima, iguais])
+        else:
+            selecionados = np.arange(n)
+        selecionados = selecionados[np.argsort(-pontuacao[selecionados], kind="stable")]
+
+        return [
+            {**self.registros[posicao], 'relevancia': int(pontuacao[posicao])}
+            for posicao in selecionados[:top_k] if pontuacao[posicao] > 0
+        ]
+
+    @classmethod
+    def dos_registros(cls, ids, metadatas, documents, versao=None):
+        indice = cls(versao=versao)
+        for id_mapa, metadata, documento in zip(ids, metadatas, documents):
+            indice.adicionar(id_mapa, metadata, documento)
+        return indice
+
+    @classmethod
+    def da_colecao(cls, collection, versao=None):
+        resultado = collection.get(include=['metadatas', 'documents'])
+        return cls.dos_registros(resultado['ids'], resultado['metadatas'], resultado['documents'], versao)
+
+    def salvar(self, caminho):
+        temporario = caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({
+                "versao": self.versao,
+                "registros": self.registros,
+                "postings": self.postings,
+                "bonus": self.bonus
+            }, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho):
+        with open(caminho, "r", encoding="utf-8") as f:
+            dados = json.load(f)
+
+        indice = cls(versao=dados.get("versao"))
+        indice.registros = dados["registros"]
+        indice.bonus = dados["bonus"]
+        for campo in PESOS_CAMPOS:
+            for token, posicoes in dados["postings"][campo].items():
+                indice.postings[campo][token] = posicoes
+                for trigrama in _trigramas(token):
+                    indice._trigramas[campo].setdefault(trigrama, set()).add(token)
+        return indice
+
+
+_indices = {}
+
+
+def obter_indice(collection, db_folder):
+    # um índice por banco, mantido em memória; o arquivo salvo na ingestão evita reler a
+    # coleção, e uma versão diferente da registrada (contagem + marcador da ingestão) faz
+    # o índice ser reconstruído a partir do cache de metadados. A versão é conferida sem
+    # carregar os metadados (eles só são lidos do Chroma quando é preciso reconstruir) e
+    # no máximo uma vez por intervalo: a pergunta típica só faz o stat do marcador
+    chave = (db_folder, collection.name)
+    cache = cache_da_colecao(collection, db_folder)
+    versao = versao_verificada(collection, db_folder)
+
+    indice = _indices.get(chave)
+    if indice is not None and indice.versao == versao:
+        return indice
+
+    caminho = caminho_indice(db_folder)
+    indice = None
+    if os.path.exists(caminho):
+        try:
+            indice = IndiceMapas.carregar(caminho)
+        except Exception as e:
+            print(f"Aviso: índice de mapas ilegível ({e}), reconstruindo")
+
+    if indice is None or indice.versao != versao:
+        # rotulado com a versão verificada: com a leitura já feita, as próximas perguntas
+        # do intervalo acertam o índice em memória em vez de reconstruí-lo de novo
+        cache.atualizar()
+        indice = IndiceMapas.dos_registros(cache.ids, cache.metadatas, cache.documents, versao)
+        try:
+            indice.salvar(caminho)
+        except OSError as e:
+            print(f"Aviso: não foi possível salvar o índice de mapas: {e}")
+
+    _indices[chave] = indice
+    return indice
@@ -0,0 +1,247 @@
+import os
+import json
+import shutil
+import argparse
+from typing import Any, Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from cache_colecao import versao_colecao, versao_verificada, INTERVALO_VERIFICACAO_VERSAO
+
+# A coleção de texto tem poucos milhares de vetores de 384 dimensões: uma busca exata
+# (produto escalar contra a matriz inteira) custa menos que passar pelo cliente do
+# Chroma, SQLite e HNSW. A matriz fica num .npy aberto por memmap, então carregar o
+# índice é só mapear o arquivo; os textos e metadados ficam num JSON ao lado.
+
+NOME_PASTA_MEMMAP = "indice_memmap"
+ARQUIVO_VETORES = "vetores.npy"
+ARQUIVO_METADADOS = "metadados.json"
+
+# linhas lidas do Chroma por vez na exportação e multiplicadas por vez na busca
+LOTE_EXPORTACAO = 1000
+LINHAS_POR_BLOCO = 8192
+
+
+def caminho_indice_memmap(db_folder):
+    return os.path.join(db_folder, NOME_PASTA_MEMMAP)
+
+
+def exportar_colecao(collection, pasta, versao=None, dtype="float32"):
+    # grava vetores normalizados (float32 ou float16) + ids, textos e metadados; a pasta
+    # nova só substitui a antiga depois de completa. A matriz é criada com count(), mas
+    # termina com exatamente uma linha por id lido: se a coleção mudar durante a leitura,
+    # não sobram linhas zeradas que a busca devolveria sem id correspondente
+    total = collection.count()
+    temporaria = pasta + ".tmp"
+    shutil.rmtree(temporaria, ignore_errors=True)
+    os.makedirs(temporaria)
+
+    vetores = None
+    ids, documentos, metadatas = [], [], []
+    for inicio in range(0, total, LOTE_EXPORTACAO):
+        lote = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=LOTE_EXPORTACAO,
+            offset=inicio
+        )
+        # inserções concorrentes não passam do tamanho reservado
+        restantes = total - len(ids)
+        matriz = np.asarray(lote["embeddings"], dtype=np.float32)[:restantes]
+        if not len(matriz):
+            break
+        if vetores is None:
+            vetores = np.lib.format.open_memmap(
+                os.path.join(temporaria, ARQUIVO_VETORES), mode="w+",
+                dtype=dtype, shape=(total, matriz.shape[1])
+            )
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        vetores[len(ids):len(ids) + len(matriz)] = matriz / np.clip(normas, 1e-12, None)
+
+        ids.extend(lote["ids"][:restantes])
+        documentos.extend(lote["documents"][:restantes])
+        metadatas.extend(metadata or {} for metadata in lote["metadatas"][:restantes])
+
+    if vetores is not None and len(ids) < total:
+        # remoções concorrentes: a coleção devolveu menos linhas que o count()
+        caminho_vetores = os.path.join(temporaria, ARQUIVO_VETORES)
+        completos = np.array(vetores[:len(ids)])
+        del vetores
+        vetores = np.lib.format.open_memmap(caminho_vetores, mode="w+", dtype=dtype, shape=completos.shape)
+        vetores[:] = completos
+
+    if vetores is None:
+        vetores = np.lib.format.open_memmap(
+            os.path.join(temporaria, ARQUIVO_VETORES), mode="w+", dtype=dtype, shape=(0, 0)
+        )
+    vetores.flush()
+    del vetores
+
+    with open(os.path.join(temporaria, ARQUIVO_METADADOS), "w", encoding="utf-8") as f:
+        json.dump({
+            "versao": versao,
+            "colecao": collection.name,
+            "dtype": dtype,
+            "ids": ids,
+            "documentos": documentos,
+            "metadatas": metadatas,
+        }, f, ensure_ascii=False)
+
+    shutil.rmtree(pasta, ignore_errors=True)
+    os.replace(temporaria, pasta)
+    return len(ids)
+
+
+class IndiceMemmap:
+    # Busca exata top-k por produto escalar numa matriz mapeada em memória. Várias
+    # consultas são respondidas de uma vez (uma multiplicação de matrizes por bloco).
+
+    def __init__(self, vetores, ids, documentos, metadatas, versao=None):
+        self.vetores = vetores
+        self.ids = ids
+        self.documentos = documentos
+        self.metadatas = metadatas
+        self.versao = versao
+        self._posicoes = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def carregar(cls, pasta):
+        with open(os.path.join(pasta, ARQUIVO_METADADOS), "r", encoding="utf-8") as f:
+            dados = json.load(f)
+        vetores = np.load(os.path.join(pasta, ARQUIVO_VETORES), mmap_mode="r")
+        return cls(vetores, dados["ids"], dados["documentos"], dados["metadatas"], dados.get("versao"))
+
+    def buscar_vetores(self, consultas, k):
+        # consultas: (m, d); devolve [[(posição, similaridade)]] com os k melhores de cada uma
+        consultas = np.atleast_2d(np.asarray(consultas, dtype=np.float32))
+        consultas = consultas / np.clip(np.linalg.norm(consultas, axis=1, keepdims=True), 1e-12, None)
+        n = len(self.ids)
+        if not n:
+            return [[] for _ in consultas]
+
+        k = min(k, n)
+        # float16 é convertido por bloco: a multiplicação em float32 é bem mais rápida na CPU
+        if self.vetores.dtype == np.float32 and n <= LINHAS_POR_BLOCO:
+            similaridades = consultas @ self.vetores.T
+        else:
+            similaridades = np.empty((len(consultas), n), dtype=np.float32)
+            for inicio in range(0, n, LINHAS_POR_BLOCO):
+                bloco = np.asarray(self.vetores[inicio:inicio + LINHAS_POR_BLOCO], dtype=np.float32)
+                similaridades[:, inicio:inicio + len(bloco)] = consultas @ bloco.T
+
+        melhores = np.argpartition(-similaridades, k - 1, axis=1)[:, :k]
+        resultados = []
+        for linha, posicoes in zip(similaridades, melhores):
+            posicoes = posicoes[np.argsort(-linha[posicoes], kind="stable")]
+            resultados.append([(int(p), float(linha[p])) for p in posicoes])
+        return resultados
+
+    def vetores_por_id(self, ids):
+        # {id: vetor normalizado em float32} dos ids presentes no índice
+        if self._posicoes is None:
+            self._posicoes = {id_chunk: posicao for posicao, id_chunk in enumerate(self.ids)}
+        return {
+            id_chunk: np.asarray(self.vetores[self._posicoes[id_chunk]], dtype=np.float32)
+            for id_chunk in ids if id_chunk in self._posicoes
+        }
+
+    def documento(self, posicao):
+        return Document(
+            id=self.ids[posicao],
+            page_content=self.documentos[posicao] or "",
+            metadata=self.metadatas[posicao]
+        )
+
+
+_indices = {}
+
+
+def obter_indice_memmap(collection, db_folder, dtype="float32",
+                        intervalo_verificacao=INTERVALO_VERIFICACAO_VERSAO, pasta=None):
+    # abre o índice exportado; se não existir ou for de outra versão da coleção,
+    # exporta de novo a partir do Chroma. pasta=None usa a pasta dos agentes no banco
+    pasta = pasta or caminho_indice_memmap(db_folder)
+    chave = (db_folder, collection.name, pasta)
+    indice = _indices.get(chave)
+    versao = versao_verificada(collection, db_folder, intervalo_verificacao)
+    if indice is not None and indice.versao == versao:
+        return indice
+
+    indice = None
+    if os.path.exists(os.path.join(pasta, ARQUIVO_METADADOS)):
+        try:
+            indice = IndiceMemmap.carregar(pasta)
+        except Exception as e:
+            print(f"Aviso: índice memmap ilegível ({e}), exportando de novo")
+
+    if indice is None or indice.versao != versao:
+        # o arquivo mapeado da versão antiga precisa ser fechado antes de ser substituído (Windows)
+        _indices.pop(chave, None)
+        indice = None
+        print("Exportando os vetores da coleção para o índice memmap...")
+        exportar_colecao(collection, pasta, versao, dtype)
+        indice = IndiceMemmap.carregar(pasta)
+
+    _indices[chave] = indice
+    return indice
+
+
+class RetrieverMemmap(BaseRetriever):
+    # Mesmo papel do vectorstore.as_retriever(), mas com a busca exata no índice memmap.
+    # O vetor da pergunta vem do modelo de embeddings compartilhado (com cache).
+
+    vectorstore: Any
+    embeddings: Any
+    db_folder: str
+    k: int = 5
+    # outra pasta para o índice (o benchmark não mexe no índice usado pelos agentes)
+    pasta_indice: Optional[str] = None
+
+    def indice(self):
+        return obter_indice_memmap(self.vectorstore._collection, self.db_folder, pasta=self.pasta_indice)
+
+    def buscar_documentos(self, consulta, k):
+        indice = self.indice()
+        vetor = self.embeddings.embed_query(consulta)
+        return [indice.documento(posicao) for posicao, _ in indice.buscar_vetores(vetor, k)[0]]
+
+    def buscar_lote(self, consultas, k=None):
+        indice = self.indice()
+        vetores = self.embeddings.embed_documents(consultas)
+        return [
+            [indice.documento(posicao) for posicao, _ in resultado]
+            for resultado in indice.buscar_vetores(vetores, k or self.k)
+        ]
+
+    def vetores_dos_documentos(self, documentos):
+        # usados pelo MMR da montagem de contexto, sem voltar ao Chroma
+        return self.indice().vetores_por_id([doc.id for doc in documentos if doc.id])
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.buscar_documentos(query, self.k)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Exporta a coleção de texto do ChromaDB para o índice memmap de busca exata."
+    )
+    parser.add_argument("--banco", required=True, help="pasta do banco ChromaDB")
+    parser.add_argument("--colecao", default="PlanoManejo_Tijuca", help="nome da coleção")
+    parser.add_argument("--float16", action="store_true", help="grava os vetores em float16 (metade do espaço)")
+    args = parser.parse_args(argv)
+
+    import chromadb
+    collection = chromadb.PersistentClient(path=args.banco).get_collection(args.colecao)
+    total = exportar_colecao(
+        collection,
+        caminho_indice_memmap(args.banco),
+        versao_colecao(collection, args.banco),
+        "float16" if args.float16 else "float32"
+    )
+    print(f"{total} vetores exportados para {caminho_indice_memmap(args.banco)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+NOME_MANIFESTO = "manifesto_ingestao.json"
+
+
+def calcular_hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def caminho_manifesto(db_folder):
+    return os.path.join(db_folder, NOME_MANIFESTO)
+
+
+def novo_manifesto(parametros):
+    return {"parametros": parametros, "arquivos": {}}
+
+
+def carregar_manifesto(db_folder, parametros):
+    # devolve (manifesto, compativel). Um manifesto gerado com outros parâmetros de
+    # ingestão (tamanho de chunk, formato dos ids...) não serve para decidir o que pular.
+    caminho = caminho_manifesto(db_folder)
+    if not os.path.exists(caminho):
+        return novo_manifesto(parametros), False
+
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            manifesto = json.load(f)
+    except Exception as e:
+        print(f"Aviso: manifesto ilegível ({e}), refazendo a ingestão completa")
+        return novo_manifesto(parametros), False
+
+    if manifesto.get("parametros") != parametros:
+        return novo_manifesto(parametros), False
+
+    manifesto.setdefault("arquivos", {})
+    return manifesto, True
+
+
+def salvar_manifesto(db_folder, manifesto):
+    # escrita atômica: um processo interrompido nunca deixa o manifesto pela metade
+    caminho = caminho_manifesto(db_folder)
+    temporario = caminho + ".tmp"
+    manifesto["atualizado_em"] = datetime.now().isoformat()
+
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=1)
+    os.replace(temporario, caminho)
+
+
+def identificar_arquivos(manifesto, arquivos):
+    # arquivos: {chave: caminho_absoluto}. Tamanho e data de modificação iguais aos do
+    # manifesto dispensam recalcular o hash; caso contrário o conteúdo decide.
+    registrados = manifesto["arquivos"]
+    estado = {}
+    novos, alterados, inalterados = [], [], []
+
+    for chave, caminho in arquivos.items():
+        stat = os.stat(caminho)
+        registro = registrados.get(chave)
+
+        if registro and registro.get("tamanho") == stat.st_size and registro.get("mtime") == stat.st_mtime:
+            hash_arquivo = registro["hash"]
+        else:
+            hash_arquivo = calcular_hash_arquivo(caminho)
+
+        estado[chave] = {"hash": hash_arquivo, "tamanho": stat.st_size, "mtime": stat.st_mtime}
+
+        if registro is None:
+            novos.append(chave)
+        elif registro.get("hash") != hash_arquivo:
+            alterados.append(chave)
+        else:
+            registro.update(estado[chave])
+            inalterados.append(chave)
+
+    removidos = [chave for chave in registrados if chave not in arquivos]
+    return estado, novos, alterados, inalterados, removidos
+
+
+def registrar_arquivo(manifesto, chave, estado, ids, **extras):
+    manifesto["arquivos"][chave] = {
+        **estado,
+        **extras,
+        "ids": list(ids),
+        "data_processamento": datetime.now().isoformat(),
+    }
+
+
+def remover_registro(manifesto, chave):
+    return manifesto["arquivos"].pop(chave, {}).get("ids", [])
+
+
+def iniciar_execucao(manifesto, completa):
+    manifesto["execucao"] = {
+        "inicio": datetime.now().isoformat(),
+        "completa": completa,
+        "concluida": False,
+    }
+
+
+def execucao_interrompida(manifesto):
+    # o manifesto é salvo a cada arquivo concluído e serve de checkpoint: uma execução
+    # não concluída é retomada pulando os arquivos já registrados
+    execucao = manifesto.get("execucao")
+    return execucao is not None and not execucao.get("concluida", False)
+
+
+def concluir_execucao(manifesto):
+    if "execucao" in manifesto:
+        manifesto["execucao"]["concluida"] = True
+        manifesto["execucao"]["fim"] = datetime.now().isoformat()
@@ -0,0 +1,209 @@
+import numpy as np
+
+# orçamento de tokens do bloco de contexto enviado ao LLM (só os trechos, sem o resto do prompt)
+ORCAMENTO_TOKENS_CONTEXTO = 1200
+
+# peso da relevância contra a redundância no MMR e cosseno a partir do qual um trecho
+# é considerado repetido (mesmo texto em dois PDFs, versões do mesmo relatório)
+LAMBDA_MMR = 0.7
+LIMIAR_REDUNDANCIA = 0.95
+
+# estimativa de tokens do llama para texto em português; não temos o tokenizador do
+# Groq localmente e a conta só precisa ser consistente entre antes e depois
+CARACTERES_POR_TOKEN = 4
+
+# menor sobreposição (em caracteres) tratada como overlap entre chunks vizinhos
+SOBREPOSICAO_MINIMA = 20
+
+
+def descrever_trecho(metadata):
+    # chunks novos trazem a página de origem; os antigos só têm o número da parte
+    if 'pagina' not in metadata:
+        return f"Parte {metadata.get('parte', '?')}"
+
+    pagina_final = metadata.get('pagina_final', metadata['pagina'])
+    if pagina_final != metadata['pagina']:
+        return f"Páginas {metadata['pagina']}-{pagina_final}"
+    return f"Página {metadata['pagina']}"
+
+
+def formatar_tempos(tempos):
+    return " | ".join(f"{etapa}: {segundos * 1000:.0f} ms" for etapa, segundos in tempos.items())
+
+
+def contar_tokens(texto):
+    return -(-len(texto) // CARACTERES_POR_TOKEN)
+
+
+def cabecalho_trecho(metadata, descrever):
+    return f"[Fonte: {metadata.get('arquivo', 'Desconhecido')} - {descrever(metadata)}]"
+
+
+def formatar_trechos(trechos, descrever):
+    # trechos: [(metadata, texto)], no mesmo formato que o format_docs sempre usou
+    return "\n\n".join(f"{cabecalho_trecho(metadata, descrever)}\n{texto}" for metadata, texto in trechos)
+
+
+def tamanho_sobreposicao(anterior, seguinte):
+    # maior k tal que o fim de "anterior" é igual ao começo de "seguinte"
+    for k in range(min(len(anterior), len(seguinte)), SOBREPOSICAO_MINIMA - 1, -1):
+        if anterior.endswith(seguinte[:k]):
+            return k
+    return 0
+
+
+def vetores_dos_documentos(vectorstore, documentos, retriever=None):
+    # os vetores já existem; nada é recalculado. Um retriever que os tem em memória
+    # (memmap) responde sem ir ao Chroma; os demais caem na leitura da coleção
+    ids = [doc.id for doc in documentos if doc.id]
+    if not ids:
+        return {}
+
+    vetores = None
+    if retriever is not None and hasattr(retriever, "vetores_dos_documentos"):
+        try:
+            vetores = retriever.vetores_dos_documentos(documentos)
+        except Exception as e:
+            print(f"Aviso: vetores do índice indisponíveis ({e}), lendo do Chroma")
+    if vetores is not None:
+        return vetores
+
+    try:
+        resultado = vectorstore._collection.get(ids=ids, include=["embeddings"])
+    except Exception as e:
+        print(f"Aviso: vetores dos trechos indisponíveis ({e}), MMR sem diversidade")
+        return {}
+
+    vetores = {}
+    for id_chunk, vetor in zip(resultado["ids"], resultado["embeddings"]):
+        vetor = np.asarray(vetor, dtype=np.float32)
+        norma = np.linalg.norm(vetor)
+        vetores[id_chunk] = vetor / norma if norma > 0 else vetor
+    return vetores
+
+
+def _juntar_vizinhos(selecionados):
+    # agrupa por arquivo, ordena pela parte (ordem do chunk no PDF) e corta o trecho repetido no começo
+    # de cada chunk que continua o anterior; devolve blocos [(metadata, texto, melhor_posição)]
+    por_arquivo = {}
+    for posicao, doc in selecionados:
+        por_arquivo.setdefault(doc.metadata.get('arquivo'), []).append((posicao, doc))
+
+    blocos = []
+    for docs in por_arquivo.values():
+        docs.sort(key=lambda item: item[1].metadata.get('parte', 0))
+        atual = None
+        for posicao, doc in docs:
+            texto = doc.page_content
+            k = tamanho_sobreposicao(atual[1], texto) if atual else 0
+            if k:
+                metadata = dict(atual[0])
+                if 'pagina' in metadata:
+                    metadata['pagina_final'] = doc.metadata.get('pagina_final', doc.metadata.get('pagina'))
+                atual = (metadata, atual[1] + texto[k:], min(atual[2], posicao))
+                continue
+            if atual:
+                blocos.append(atual)
+            atual = (dict(doc.metadata), texto, posicao)
+        if atual:
+            blocos.append(atual)
+
+    blocos.sort(key=lambda bloco: bloco[2])
+    return blocos
+
+
+def _custo(doc, escolhidos, descrever):
+    # tokens que o trecho acrescenta, descontando o overlap com um vizinho já escolhido
+    texto = doc.page_content
+    arquivo = doc.metadata.get('arquivo')
+    for _, outro in escolhidos:
+        if outro.metadata.get('arquivo') != arquivo:
+            continue
+        k = max(tamanho_sobreposicao(outro.page_content, texto), tamanho_sobreposicao(texto, outro.page_content))
+        if k:
+            return contar_tokens(texto[k:])
+    return contar_tokens(cabecalho_trecho(doc.metadata, descrever) + "\n" + texto) + 1
+
+
+def cortar_tokens(texto, max_tokens):
+    limite = max_tokens * CARACTERES_POR_TOKEN
+    if len(texto) <= limite:
+        return texto
+    corte = texto.rfind(" ", 0, limite)
+    return texto[:corte if corte > 0 else limite]
+
+
+def _estatisticas(tokens_originais, contexto, recuperados, usados):
+    tokens_contexto = contar_tokens(contexto)
+    return {
+        "tokens_originais": tokens_originais,
+        "tokens_contexto": tokens_contexto,
+        "tokens_economizados": tokens_originais - tokens_contexto,
+        "trechos_recuperados": recuperados,
+        "trechos_usados": usados,
+    }
+
+
+def montar_contexto(documentos, vectorstore, descrever, orcamento=ORCAMENTO_TOKENS_CONTEXTO,
+                    lambda_mmr=LAMBDA_MMR, limiar_redundancia=LIMIAR_REDUNDANCIA, retriever=None):
+    # Escolhe os trechos por MMR (relevância pela ordem do retriever, que já mistura
+    # vetor e BM25; redundância pelo cosseno entre os vetores dos trechos), junta chunks
+    # vizinhos sem repetir o overlap e para quando o orçamento de tokens acaba.
+    # Devolve (contexto, documentos_usados, estatisticas).
+    original = formatar_trechos([(doc.metadata, doc.page_content) for doc in documentos], descrever)
+    tokens_originais = contar_tokens(original)
+
+    if not documentos:
+        return "", [], _estatisticas(0, "", 0, 0)
+
+    vetores = vetores_dos_documentos(vectorstore, documentos, retriever)
+    n = len(documentos)
+    relevancia = [1.0 - posicao / n for posicao in range(n)]
+
+    restantes = list(range(n))
+    escolhidos = []
+    gasto = 0
+    while restantes:
+        melhor, melhor_pontuacao, melhor_redundancia = None, None, 0.0
+        for i in restantes:
+            doc = documentos[i]
+            redundancia = 0.0
+            for _, outro in escolhidos:
+                if doc.page_content == outro.page_content:
+                    redundancia = 1.0
+                elif doc.id in vetores and outro.id in vetores:
+                    redundancia = max(redundancia, float(vetores[doc.id] @ vetores[outro.id]))
+            pontuacao = lambda_mmr * relevancia[i] - (1 - lambda_mmr) * redundancia
+            if melhor_pontuacao is None or pontuacao > melhor_pontuacao:
+                melhor, melhor_pontuacao, melhor_redundancia = i, pontuacao, redundancia
+
+        restantes.remove(melhor)
+        if melhor_redundancia >= limiar_redundancia:
+            continue
+
+        custo = _custo(documentos[melhor], escolhidos, descrever)
+        if gasto + custo > orcamento:
+            # sem nada escolhido ainda, o trecho mais relevante entra cortado no orçamento
+            if not escolhidos:
+                doc = documentos[melhor]
+                cabecalho = contar_tokens(cabecalho_trecho(doc.metadata, descrever)) + 1
+                texto = cortar_tokens(doc.page_content, max(orcamento - cabecalho, 0))
+                contexto = formatar_trechos([(doc.metadata, texto)], descrever)
+                return contexto, [doc], _estatisticas(tokens_originais, contexto, n, 1)
+            continue
+
+        escolhidos.append((melhor, documentos[melhor]))
+        gasto += custo
+
+    blocos = _juntar_vizinhos(escolhidos)
+    contexto = formatar_trechos([(metadata, texto) for metadata, texto, _ in blocos], descrever)
+    usados = [doc for _, doc in sorted(escolhidos, key=lambda item: item[0])]
+    return contexto, usados, _estatisticas(tokens_originais, contexto, n, len(usados))
+
+
+def formatar_economia(estatisticas):
+    return (
+        f"{estatisticas['tokens_contexto']} tokens de contexto "
+        f"({estatisticas['trechos_usados']}/{estatisticas['trechos_recuperados']} trechos, "
+        f"{estatisticas['tokens_economizados']} economizados)"
+    )
@@ -0,0 +1,93 @@
+import os
+import threading
+from dotenv import load_dotenv
+from cache_embeddings import EmbeddingsComCache
+
+load_dotenv()
+
+# recursos pesados criados uma única vez por processo e reaproveitados por todos os
+# agentes que o orquestrador carrega (modelo de embeddings, cliente do LLM, Chroma)
+MODELO_EMBEDDING = "all-MiniLM-L6-v2"
+MODELO_LLM = "llama-3.3-70b-versatile"
+
+# "pytorch" (sentence-transformers) ou "onnx_int8" / "onnx" (ONNX Runtime, ver embeddings_onnx.py);
+# os três geram vetores do mesmo modelo e servem para o mesmo índice do Chroma
+BACKEND_EMBEDDING = os.getenv("BACKEND_EMBEDDING", "pytorch")
+
+# vetores das perguntas já feitas, reaproveitados entre execuções (None = só em memória)
+CACHE_EMBEDDINGS_DISCO = os.path.join(os.path.dirname(__file__), "cache_embeddings.sqlite")
+
+_lock = threading.RLock()
+_embeddings = None
+_llm = None
+_vectorstores = {}
+_clientes_chroma = {}
+
+
+def criar_modelo_embeddings(backend=BACKEND_EMBEDDING):
+    # devolve (modelo, nome usado no cache); o nome muda por backend para o cache em
+    # disco não misturar vetores calculados de formas diferentes
+    if backend in ("onnx_int8", "onnx"):
+        from embeddings_onnx import EmbeddingsOnnx
+        return EmbeddingsOnnx(quantizado=backend == "onnx_int8"), f"{MODELO_EMBEDDING}-{backend}"
+
+    if backend != "pytorch":
+        print(f"Aviso: backend de embeddings desconhecido '{backend}', usando pytorch")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    modelo = HuggingFaceEmbeddings(
+        model_name=MODELO_EMBEDDING,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+    return modelo, MODELO_EMBEDDING
+
+
+def obter_embeddings():
+    global _embeddings
+    with _lock:
+        if _embeddings is None:
+            modelo, nome_modelo = criar_modelo_embeddings()
+            _embeddings = EmbeddingsComCache(
+                modelo,
+                nome_modelo=nome_modelo,
+                caminho_disco=CACHE_EMBEDDINGS_DISCO
+            )
+        return _embeddings
+
+
+def obter_llm():
+    # um cliente só; quem precisa de outros parâmetros usa .bind(temperature=..., max_tokens=...)
+    global _llm
+    with _lock:
+        if _llm is None:
+            from langchain_groq import ChatGroq
+            _llm = ChatGroq(
+                groq_api_key=os.getenv("GROQ_API_KEY"),
+                model_name=MODELO_LLM,
+                temperature=0.3,
+                max_tokens=2000
+            )
+        return _llm
+
+
+def obter_vectorstore(db_folder, collection_name):
+    with _lock:
+        chave = (os.path.abspath(db_folder), collection_name)
+        if chave not in _vectorstores:
+            from langchain_chroma import Chroma
+            _vectorstores[chave] = Chroma(
+                client=obter_cliente_chroma(db_folder),
+                collection_name=collection_name,
+                embedding_function=obter_embeddings()
+            )
+        return _vectorstores[chave]
+
+
+def obter_cliente_chroma(db_folder):
+    with _lock:
+        chave = os.path.abspath(db_folder)
+        if chave not in _clientes_chroma:
+            import chromadb
+            _clientes_chroma[chave] = chromadb.PersistentClient(path=db_folder)
+        return _clientes_chroma[chave]
@@ -0,0 +1,144 @@
+import re
+import threading
+import numpy as np
+
+# Classificação das perguntas sem chamar o LLM: regras de palavras-chave para o clima
+# (as mesmas expressões que o agente_clima reconhece) e, para o resto, o centróide mais
+# próximo entre perguntas de exemplo de cada categoria, com o modelo de embeddings que
+# os agentes já carregam. Só as perguntas em que a decisão fica apertada vão para o LLM.
+
+EXEMPLOS_POR_CATEGORIA = {
+    "clima": [
+        "Como está o tempo agora no parque?",
+        "Vai chover hoje na Tijuca?",
+        "Qual a previsão do tempo para amanhã?",
+        "Qual a temperatura neste momento?",
+        "Vai fazer sol no fim de semana?",
+        "Está ventando muito lá em cima?",
+        "Qual a previsão para os próximos dias?",
+        "Está frio no parque hoje?",
+        "Tem risco de tempestade à tarde?",
+        "Como está a umidade do ar?",
+    ],
+    "trilhas": [
+        "Como faço para chegar no Pico da Tijuca?",
+        "Qual a dificuldade da trilha da Cascatinha?",
+        "Mostre o mapa da trilha do Horto",
+        "Quanto tempo leva a trilha da Pedra Bonita?",
+        "Qual a distância até a Vista Chinesa?",
+        "Quais trilhas são boas para iniciantes?",
+        "Onde começa a trilha do Bico do Papagaio?",
+        "Qual o melhor caminho para o Mirante Dona Marta?",
+        "A trilha da Pedra da Gávea é perigosa?",
+        "Tem alguma trilha com cachoeira?",
+        "Qual rota leva até a Capela Mayrink?",
+        "Quais mirantes posso visitar a pé?",
+    ],
+    "geral": [
+        "Quais animais posso ver no parque?",
+        "Que árvores nativas existem na floresta?",
+        "Conte sobre a história do reflorestamento",
+        "O que é permitido fazer no parque?",
+        "Posso levar meu cachorro?",
+        "Qual o horário de funcionamento?",
+        "O parque cobra entrada?",
+        "Quem foi o Major Archer?",
+        "Quais espécies estão ameaçadas de extinção?",
+        "O que diz o plano de manejo sobre o uso público?",
+        "Posso fazer churrasco ou acampar?",
+        "Como o parque protege as nascentes?",
+    ],
+}
+
+# só expressões que não deixam dúvida de que a pergunta é sobre o tempo (as mesmas que o
+# agente_clima reconhece); palavras soltas como "chuva", "calor", "previsão" ou "clima"
+# aparecem em perguntas de trilhas e gerais ("trilha boa no calor", "previsão de
+# reabertura", "clima da Mata Atlântica") e ficam com os centróides
+PADRAO_CLIMA = re.compile(
+    r"\bvai (chover|fazer (sol|frio|calor)|esfriar|esquentar)\b|\best[aá] chovendo\b|"
+    r"\bprevis[aã]o do tempo\b|\bprevis[aã]o (para|pra) (hoje|amanh[aã]|os pr[oó]ximos dias)\b|"
+    r"\bcomo (est[aá]|t[aá]) o (tempo|clima)\b|\b(tempo|clima) (agora|hoje|amanh[aã])\b|"
+    r"\b(qual|como est[aá]) a (temperatura|umidade)\b"
+)
+
+# a decisão local vale quando o centróide vencedor é parecido o bastante com a pergunta
+# e fica à frente do segundo colocado por uma margem mínima
+SIMILARIDADE_MINIMA = 0.30
+MARGEM_MINIMA = 0.05
+
+
+class RoteadorLocal:
+    # Os centróides são calculados na primeira pergunta. Os contadores dizem quantas
+    # perguntas foram resolvidas por regra, por centróide ou encaminhadas ao LLM.
+
+    def __init__(self, embeddings, exemplos=None, similaridade_minima=SIMILARIDADE_MINIMA,
+                 margem_minima=MARGEM_MINIMA):
+        self.embeddings = embeddings
+        self.exemplos = exemplos or EXEMPLOS_POR_CATEGORIA
+        self.similaridade_minima = similaridade_minima
+        self.margem_minima = margem_minima
+        self._categorias = None
+        self._centroides = None
+        self._lock = threading.Lock()
+        self.por_regra = 0
+        self.por_centroide = 0
+        self.pelo_llm = 0
+
+    def _normalizado(self, vetor):
+        vetor = np.asarray(vetor, dtype=np.float32)
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma > 0 else vetor
+
+    def _preparar(self):
+        # os exemplos passam por embed_query para aproveitar o cache de embeddings em disco
+        with self._lock:
+            if self._centroides is None:
+                categorias = list(self.exemplos)
+                centroides = []
+                for categoria in categorias:
+                    vetores = np.stack([self._normalizado(self.embeddings.embed_query(p))
+                                        for p in self.exemplos[categoria]])
+                    centroides.append(self._normalizado(vetores.mean(axis=0)))
+                self._categorias = categorias
+                self._centroides = np.stack(centroides)
+        return self._categorias, self._centroides
+
+    def classificar(self, pergunta):
+        # devolve (categoria, confiança, origem) ou None quando a decisão deve ir ao LLM
+        categorias, centroides = self._preparar()
+        similaridades = centroides @ self._normalizado(self.embeddings.embed_query(pergunta))
+
+        # a regra de clima decide sozinha, a menos que a pergunta se pareça tanto com
+        # trilhas ou geral quanto com clima; aí quem decide são os centróides (ou o LLM)
+        if PADRAO_CLIMA.search(pergunta.lower()):
+            clima = similaridades[categorias.index("clima")] if "clima" in categorias else -1.0
+            outras = [float(similaridades[i]) for i, c in enumerate(categorias) if c != "clima"]
+            if not outras or max(outras) < self.similaridade_minima or max(outras) < clima:
+                with self._lock:
+                    self.por_regra += 1
+                return "clima", 1.0, "regra"
+
+        ordem = np.argsort(-similaridades)
+        melhor = float(similaridades[ordem[0]])
+        margem = melhor - float(similaridades[ordem[1]]) if len(ordem) > 1 else melhor
+
+        if melhor < self.similaridade_minima or margem < self.margem_minima:
+            with self._lock:
+                self.pelo_llm += 1
+            return None
+
+        with self._lock:
+            self.por_centroide += 1
+        return categorias[ordem[0]], margem, "centroide"
+
+    def estatisticas(self):
+        with self._lock:
+            locais = self.por_regra + self.por_centroide
+            total = locais + self.pelo_llm
+            return {
+                "consultas": total,
+                "por_regra": self.por_regra,
+                "por_centroide": self.por_centroide,
+                "pelo_llm": self.pelo_llm,
+                "taxa_local": locais / total if total else 0.0,
+            }
@@ -0,0 +1,88 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_respostas import CacheRespostas, TTL_POR_CATEGORIA, depende_do_historico
+
+HISTORICO = [("Como é a trilha da Pedra Bonita?", "É uma trilha curta e íngreme.")]
+
+CONTRACOES = [
+    "dessa", "desse", "dessas", "desses", "desta", "deste", "destas", "destes",
+    "nessa", "nesse", "nessas", "nesses", "nesta", "neste", "nestas", "nestes",
+    "daquela", "daquele", "daquelas", "daqueles", "daquilo",
+    "naquela", "naquele", "naquelas", "naqueles", "naquilo",
+]
+
+
+@pytest.mark.parametrize("pergunta", [
+    "Quanto tempo leva para subir nessa trilha?",
+    "Qual a dificuldade desta trilha?",
+    "Onde fica o começo daquele mirante?",
+])
+def test_demonstrativo_contraido_antes_do_substantivo(pergunta):
+    assert depende_do_historico(pergunta, HISTORICO)
+
+
+@pytest.mark.parametrize("palavra", CONTRACOES)
+def test_demonstrativos_contraidos(palavra):
+    assert depende_do_historico(f"Qual a altitude máxima {palavra} ponto do parque?", HISTORICO)
+
+
+def test_pergunta_autonoma_nao_depende_do_historico():
+    assert not depende_do_historico("Qual a altitude máxima do Pico da Tijuca?", HISTORICO)
+
+
+def test_sem_historico_nada_depende():
+    assert not depende_do_historico("Qual a dificuldade desta trilha?", [])
+
+
+class EmbeddingsFixos:
+    # toda pergunta vira o mesmo vetor: o que separa as respostas é só o TTL e os qualificadores
+    def embed_query(self, texto):
+        return [1.0, 0.0, 0.0]
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+def test_clima_nao_e_servido_depois_do_ttl():
+    relogio = Relogio()
+    cache = CacheRespostas(EmbeddingsFixos(), relogio=relogio)
+    cache.guardar("Vai chover hoje?", "clima", "Sem chuva hoje.")
+
+    relogio.agora += TTL_POR_CATEGORIA["clima"]
+    assert cache.buscar("Vai chover hoje?")[1] == "Sem chuva hoje."
+
+    relogio.agora += 1
+    assert cache.buscar("Vai chover hoje?") is None
+    assert cache.estatisticas()["expiradas"] == 1
+
+
+def test_ttl_por_categoria():
+    relogio = Relogio()
+    cache = CacheRespostas(EmbeddingsFixos(), relogio=relogio)
+    cache.guardar("Qual o horário do parque?", "geral", "Das 8h às 17h.")
+
+    # passado o TTL do clima, as respostas gerais continuam valendo
+    relogio.agora += TTL_POR_CATEGORIA["clima"] + 1
+    assert cache.buscar("Qual o horário do parque?")[1] == "Das 8h às 17h."
+
+
+def test_clima_separado_por_qualificador_de_tempo():
+    cache = CacheRespostas(EmbeddingsFixos(), relogio=Relogio())
+    cache.guardar("Vai chover hoje?", "clima", "Sem chuva hoje.")
+
+    assert cache.buscar("Vai chover amanhã?") is None
+    assert cache.buscar("Vai chover hoje no parque?")[1] == "Sem chuva hoje."
+
+    cache.guardar("Vai chover amanhã?", "clima", "Chuva forte amanhã.")
+    assert cache.buscar("Vai chover amanha?")[1] == "Chuva forte amanhã."
+    assert cache.buscar("Vai chover hoje?")[1] == "Sem chuva hoje."
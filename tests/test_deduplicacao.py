@@ -0,0 +1,93 @@
+import os
+import sys
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deduplicacao import IndiceMinHash, imagens_equivalentes
+
+TEXTO = ("A trilha do Pico da Tijuca sai do Bom Retiro e sobe por degraus de pedra até o cume, "
+         "com vista para a baía de Guanabara, a zona norte e a Pedra da Gávea em dias sem nuvens.")
+
+
+def mapa_base(largura=1200, altura=900, semente=0):
+    # blocos coloridos espalhados, como as manchas de vegetação e construções de um mapa
+    rng = np.random.default_rng(semente)
+    img = Image.new("RGB", (largura, altura), (200, 220, 200))
+    desenho = ImageDraw.Draw(img)
+    for _ in range(60):
+        x, y = int(rng.integers(0, largura - 50)), int(rng.integers(0, altura - 50))
+        desenho.rectangle([x, y, x + 40, y + 40], fill=tuple(int(v) for v in rng.integers(0, 255, 3)))
+    return img
+
+
+def com_trilha(img):
+    img = img.copy()
+    ImageDraw.Draw(img).line([(100, 100), (img.width - 100, img.height - 100)], fill=(255, 0, 0), width=5)
+    return img
+
+
+def test_mesmo_mapa_em_outra_resolucao():
+    mapa = mapa_base()
+    assert imagens_equivalentes(mapa, mapa.resize((600, 450), Image.Resampling.LANCZOS))
+    assert imagens_equivalentes(mapa.resize((600, 450), Image.Resampling.LANCZOS), mapa)
+
+
+def test_trilha_diferente_sobre_a_mesma_base():
+    mapa = mapa_base()
+    assert not imagens_equivalentes(mapa, com_trilha(mapa))
+    assert not imagens_equivalentes(mapa, com_trilha(mapa).resize((600, 450), Image.Resampling.LANCZOS))
+
+
+def test_proporcao_diferente():
+    mapa = mapa_base()
+    assert not imagens_equivalentes(mapa, mapa.resize((900, 900)))
+
+
+def test_minhash_reconhece_quase_duplicata():
+    indice = IndiceMinHash()
+    indice.adicionar("a-1", indice.calcular_assinatura(TEXTO), "a.pdf")
+
+    # o mesmo parágrafo com outra caixa e outro espaçamento
+    assert indice.buscar_duplicata(indice.calcular_assinatura("  " + TEXTO.upper())) == "a-1"
+    outro = "O horário de visitação do parque vai das oito às dezessete horas, inclusive em feriados."
+    assert indice.buscar_duplicata(indice.calcular_assinatura(outro)) is None
+
+
+def test_minhash_texto_vazio_sem_assinatura():
+    assert IndiceMinHash().calcular_assinatura("   \n") is None
+
+
+def test_minhash_remover_arquivo():
+    indice = IndiceMinHash()
+    assinatura = indice.calcular_assinatura(TEXTO)
+    indice.adicionar("a-1", assinatura, "a.pdf")
+    indice.adicionar("b-1", assinatura, "b.pdf")
+
+    indice.remover_arquivo("a.pdf")
+    assert len(indice) == 1
+    assert indice.buscar_duplicata(assinatura) == "b-1"
+
+    indice.remover_arquivo("b.pdf")
+    assert len(indice) == 0
+    assert indice.buscar_duplicata(assinatura) is None
+    assert all(not bucket for bucket in indice._buckets)
+
+
+def test_minhash_salvar_e_carregar(tmp_path):
+    caminho = str(tmp_path / "indice_duplicatas.npz")
+    indice = IndiceMinHash()
+    assinatura = indice.calcular_assinatura(TEXTO)
+    indice.adicionar("a-1", assinatura, "trilhas/a.pdf")
+    indice.salvar(caminho)
+
+    carregado = IndiceMinHash.carregar(caminho)
+    assert len(carregado) == 1
+    assert carregado.arquivos == {"a-1": "trilhas/a.pdf"}
+    assert carregado.buscar_duplicata(assinatura) == "a-1"
+
+    # outros parâmetros tornam as assinaturas salvas incomparáveis
+    assert len(IndiceMinHash.carregar(caminho, num_bandas=32)) == 0
+    assert len(IndiceMinHash.carregar(str(tmp_path / "inexistente.npz"))) == 0
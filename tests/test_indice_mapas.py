@@ -0,0 +1,117 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_colecao
+import indice_mapas
+from indice_mapas import IndiceMapas, PESOS_CAMPOS, TRILHA_KEYWORDS, TAMANHO_MINIMO_PALAVRA
+
+REGISTROS = [
+    ("img-1", {"arquivo_pdf": "Trilha Pico da Tijuca.pdf", "caminho_relativo": "trilhas/pico/Trilha Pico da Tijuca.pdf",
+               "pagina": 2, "dimensoes": "800x600"}, "trilhas/pico/Trilha Pico da Tijuca.pdf_p2_i1"),
+    ("img-2", {"arquivo_pdf": "Cascatinha Taunay.pdf", "caminho_relativo": "cachoeiras/Cascatinha Taunay.pdf",
+               "pagina": 1, "dimensoes": "1024x768"}, "cachoeiras/Cascatinha Taunay.pdf_p1_i1"),
+    ("img-3", {"arquivo_pdf": "Relatorio anual.pdf", "caminho_relativo": "gestao/Relatorio anual.pdf",
+               "pagina": 7, "dimensoes": "640x480"}, "mapa de visitacao pico"),
+    ("img-4", {"arquivo_pdf": "Mirante Excelsior.pdf", "caminho_relativo": "mirantes/Mirante Excelsior.pdf",
+               "pagina": 3, "dimensoes": "900x900"}, "estrada do excelsior"),
+    ("img-5", {"arquivo_pdf": "Fauna.pdf", "caminho_relativo": "biologia/Fauna.pdf",
+               "pagina": 4, "dimensoes": "500x500"}, None),
+]
+
+
+def varredura(registros, pergunta, top_k):
+    # a busca antiga: pontua todos os mapas da coleção a cada pergunta
+    pontuados = []
+    for id_mapa, metadata, documento in registros:
+        campos = {
+            "arquivo": metadata.get("arquivo_pdf", "").lower(),
+            "caminho": metadata.get("caminho_relativo", "").lower(),
+            "documento": documento.lower() if documento else "",
+        }
+        pontuacao = 0
+        for palavra in pergunta.lower().split():
+            if len(palavra) >= TAMANHO_MINIMO_PALAVRA:
+                pontuacao += sum(peso for campo, peso in PESOS_CAMPOS.items() if palavra in campos[campo])
+        pontuacao += sum(1 for kw in TRILHA_KEYWORDS if kw in campos["arquivo"] or kw in campos["caminho"])
+        if pontuacao > 0:
+            pontuados.append((id_mapa, pontuacao))
+
+    pontuados.sort(key=lambda item: item[1], reverse=True)
+    return pontuados[:top_k]
+
+
+@pytest.mark.parametrize("pergunta", [
+    "mapa da trilha do pico",
+    "como chegar na cascatinha taunay",
+    "mirante excelsior pela estrada",
+    "pico pico tijuca",
+    "relat",
+    "fauna do parque",
+    "xyz",
+])
+@pytest.mark.parametrize("top_k", [1, 3, 10])
+def test_mesma_pontuacao_e_ordem_da_varredura(pergunta, top_k):
+    indice = IndiceMapas.dos_registros(*zip(*REGISTROS))
+    resultado = [(mapa["id"], mapa["relevancia"]) for mapa in indice.buscar(pergunta, top_k)]
+    assert resultado == varredura(REGISTROS, pergunta, top_k)
+
+
+def test_salvar_e_carregar_preservam_a_busca(tmp_path):
+    indice = IndiceMapas.dos_registros(*zip(*REGISTROS), versao=[5, "abc"])
+    caminho = str(tmp_path / "indice_mapas.json")
+    indice.salvar(caminho)
+
+    carregado = IndiceMapas.carregar(caminho)
+    assert carregado.versao == [5, "abc"]
+    assert carregado.buscar("trilha do pico", 3) == indice.buscar("trilha do pico", 3)
+
+
+def test_todas_as_fontes_entram_no_indice():
+    fontes = [
+        {"arquivo_pdf": "Guia geral.pdf", "caminho_relativo": "guias/Guia geral.pdf"},
+        {"arquivo_pdf": "Trilha Mayrink.pdf", "caminho_relativo": "trilhas/Trilha Mayrink.pdf"},
+    ]
+    metadata = {**fontes[0], "pagina": 1, "fontes_json": json.dumps(fontes)}
+    indice = IndiceMapas.dos_registros(["img-1"], [metadata], [""])
+
+    resultado = indice.buscar("mayrink", 3)
+    assert [mapa["id"] for mapa in resultado] == ["img-1"]
+    assert resultado[0]["arquivo"] == "Guia geral.pdf"
+
+
+class ColecaoFalsa:
+    name = "Imagens"
+
+    def __init__(self, registros):
+        self.registros = registros
+        self.contagens = 0
+
+    def count(self):
+        self.contagens += 1
+        return len(self.registros)
+
+    def get(self, include=None):
+        ids, metadatas, documents = zip(*self.registros)
+        return {"ids": list(ids), "metadatas": list(metadatas), "documents": list(documents)}
+
+
+def test_versao_conferida_no_maximo_uma_vez_por_intervalo(tmp_path):
+    db_folder = str(tmp_path)
+    cache_colecao.marcar_nova_versao(db_folder)
+    colecao = ColecaoFalsa(REGISTROS)
+
+    indice = indice_mapas.obter_indice(colecao, db_folder)
+    contagens = colecao.contagens
+    for _ in range(20):
+        assert indice_mapas.obter_indice(colecao, db_folder) is indice
+    assert colecao.contagens == contagens
+
+    # uma ingestão nova regrava o marcador e é percebida sem esperar o intervalo
+    os.utime(cache_colecao.caminho_marcador(db_folder), (0, 0))
+    indice_mapas.obter_indice(colecao, db_folder)
+    assert colecao.contagens > contagens